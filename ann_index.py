@@ -0,0 +1,402 @@
+"""
+HNSW index profiles and pluggable nearest-neighbour backends.
+
+A profile is a named set of HNSW parameters: M (graph degree), ef_construction
+(build-time beam width) and ef_search (query-time beam width). Higher values
+trade memory, build time and query latency for recall:
+
+    fast         M=12  ef_construction=64   ef_search=16
+    balanced     M=16  ef_construction=200  ef_search=64
+    high-recall  M=48  ef_construction=400  ef_search=256
+
+With the default "chroma" backend the profile goes into the collection's
+hnsw:* metadata when it's created (Chroma can't change it afterwards). The
+"hnswlib" and "faiss" backends keep a local index next to the Chroma store
+instead, for corpora where Chroma's own index gets too slow or too big:
+Chroma still holds documents and metadata, but searches run against the local
+index through IndexedCollection, which behaves like a Chroma collection for
+everything the app uses. Chroma keeps building its own HNSW index over the
+same embeddings (it can't be switched off), so a local index changes how
+searches run, not how much memory the vectors take: it adds a second copy.
+"""
+import atexit
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+
+import settings
+
+PROFILES = {
+    "fast": {"M": 12, "ef_construction": 64, "ef_search": 16},
+    "balanced": {"M": 16, "ef_construction": 200, "ef_search": 64},
+    "high-recall": {"M": 48, "ef_construction": 400, "ef_search": 256},
+}
+METRICS = ("l2", "cosine", "ip")
+BACKENDS = ("chroma", "hnswlib", "faiss")
+
+
+def profile_params(profile: str = None) -> dict:
+    profile = profile or settings.INDEX_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown index profile '{profile}', expected one of {', '.join(PROFILES)}")
+    return PROFILES[profile]
+
+
+def chroma_metadata(profile: str = None, metric: str = None) -> dict:
+    """Collection metadata that configures Chroma's HNSW index."""
+    profile = profile or settings.INDEX_PROFILE
+    metric = metric or settings.INDEX_METRIC
+    if metric not in METRICS:
+        raise ValueError(f"Unknown distance metric '{metric}', expected one of {', '.join(METRICS)}")
+    params = profile_params(profile)
+    return {
+        "index_profile": profile,
+        "hnsw:space": metric,
+        "hnsw:M": params["M"],
+        "hnsw:construction_ef": params["ef_construction"],
+        "hnsw:search_ef": params["ef_search"],
+    }
+
+
+class ANNIndex:
+    """
+    Interface of a local nearest-neighbour index over string ids.
+    Distances follow Chroma's conventions: squared L2 for "l2",
+    1 - cosine similarity for "cosine" and 1 - dot product for "ip".
+    """
+
+    def __init__(self, dimension: int, profile: str = None, metric: str = None):
+        self.dimension = dimension
+        self.profile = profile or settings.INDEX_PROFILE
+        self.metric = metric or settings.INDEX_METRIC
+        self.params = profile_params(self.profile)
+
+    def upsert(self, ids, embeddings):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def search(self, embeddings, k: int):
+        """([[id, ...]], [[distance, ...]]) of the k nearest neighbours per query."""
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def save(self, path: Path):
+        raise NotImplementedError
+
+    def load(self, path: Path) -> bool:
+        """Load a saved index; False if there is none."""
+        raise NotImplementedError
+
+
+class HnswlibIndex(ANNIndex):
+    def __init__(self, dimension: int, profile: str = None, metric: str = None):
+        import hnswlib
+
+        super().__init__(dimension, profile, metric)
+        self._hnswlib = hnswlib
+        self._labels = {}   # id -> label
+        self._ids = {}      # label -> id
+        self._next_label = 0
+        self._index = self._new_index(1024)
+
+    def _new_index(self, capacity: int):
+        index = self._hnswlib.Index(space=self.metric, dim=self.dimension)
+        index.init_index(max_elements=capacity, ef_construction=self.params["ef_construction"],
+                         M=self.params["M"], allow_replace_deleted=True)
+        index.set_ef(self.params["ef_search"])
+        return index
+
+    def upsert(self, ids, embeddings):
+        if not len(ids):
+            return
+        labels = []
+        for chunk_id in ids:
+            label = self._labels.get(chunk_id)
+            if label is None:
+                label = self._labels[chunk_id] = self._next_label
+                self._ids[label] = chunk_id
+                self._next_label += 1
+            labels.append(label)
+        needed = self._index.get_current_count() + len(ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+        # Re-adding an existing label replaces its vector; new labels reuse deleted slots
+        self._index.add_items(np.asarray(embeddings, dtype=np.float32), labels, replace_deleted=True)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            label = self._labels.pop(chunk_id, None)
+            if label is not None:
+                del self._ids[label]
+                self._index.mark_deleted(label)
+
+    def search(self, embeddings, k: int):
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in embeddings], [[] for _ in embeddings]
+        # ef below k would cut the result list short
+        self._index.set_ef(max(self.params["ef_search"], k))
+        labels, distances = self._index.knn_query(np.asarray(embeddings, dtype=np.float32), k=k)
+        return ([[self._ids[label] for label in row] for row in labels],
+                [[float(d) for d in row] for row in distances])
+
+    def __len__(self):
+        return len(self._labels)
+
+    def save(self, path: Path):
+        self._index.save_index(str(path))
+        path.with_suffix(".ids.json").write_text(json.dumps(self._labels), encoding="utf-8")
+
+    def load(self, path: Path) -> bool:
+        ids_path = path.with_suffix(".ids.json")
+        if not path.exists() or not ids_path.exists():
+            return False
+        self._labels = json.loads(ids_path.read_text(encoding="utf-8"))
+        self._ids = {label: chunk_id for chunk_id, label in self._labels.items()}
+        self._next_label = max(self._ids, default=-1) + 1
+        self._index = self._hnswlib.Index(space=self.metric, dim=self.dimension)
+        self._index.load_index(str(path), allow_replace_deleted=True)
+        self._index.set_ef(self.params["ef_search"])
+        return True
+
+
+class FaissIndex(ANNIndex):
+    """
+    faiss.IndexHNSWFlat. HNSW graphs in FAISS can't remove vectors, so deleted
+    and replaced ids are tombstoned and skipped at query time; rebuild() (or
+    vectorstore compact) drops them for good.
+    """
+
+    def __init__(self, dimension: int, profile: str = None, metric: str = None):
+        import faiss
+
+        super().__init__(dimension, profile, metric)
+        self._faiss = faiss
+        self._labels = {}   # id -> live label
+        self._ids = []      # label -> id (None once tombstoned)
+        self._index = self._new_index()
+
+    def _new_index(self):
+        faiss_metric = self._faiss.METRIC_L2 if self.metric == "l2" else self._faiss.METRIC_INNER_PRODUCT
+        index = self._faiss.IndexHNSWFlat(self.dimension, self.params["M"], faiss_metric)
+        index.hnsw.efConstruction = self.params["ef_construction"]
+        index.hnsw.efSearch = self.params["ef_search"]
+        return index
+
+    def _prepare(self, embeddings):
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.metric == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def upsert(self, ids, embeddings):
+        if not len(ids):
+            return
+        self.delete(ids)
+        start = len(self._ids)
+        self._index.add(self._prepare(embeddings))
+        for offset, chunk_id in enumerate(ids):
+            self._labels[chunk_id] = start + offset
+            self._ids.append(chunk_id)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            label = self._labels.pop(chunk_id, None)
+            if label is not None:
+                self._ids[label] = None
+
+    def search(self, embeddings, k: int):
+        live = len(self)
+        if live == 0 or k == 0:
+            return [[] for _ in embeddings], [[] for _ in embeddings]
+        # Over-fetch by the number of tombstones so k live hits remain
+        fetch = min(k + (len(self._ids) - live), len(self._ids))
+        self._index.hnsw.efSearch = max(self.params["ef_search"], fetch)
+        scores, labels = self._index.search(self._prepare(embeddings), fetch)
+        all_ids, all_distances = [], []
+        for score_row, label_row in zip(scores, labels):
+            ids, distances = [], []
+            for score, label in zip(score_row, label_row):
+                if label < 0 or self._ids[label] is None:
+                    continue
+                ids.append(self._ids[label])
+                distances.append(float(score) if self.metric == "l2" else 1.0 - float(score))
+                if len(ids) == k:
+                    break
+            all_ids.append(ids)
+            all_distances.append(distances)
+        return all_ids, all_distances
+
+    def __len__(self):
+        return len(self._labels)
+
+    def save(self, path: Path):
+        self._faiss.write_index(self._index, str(path))
+        path.with_suffix(".ids.json").write_text(json.dumps(self._ids), encoding="utf-8")
+
+    def load(self, path: Path) -> bool:
+        ids_path = path.with_suffix(".ids.json")
+        if not path.exists() or not ids_path.exists():
+            return False
+        self._index = self._faiss.read_index(str(path))
+        self._index.hnsw.efSearch = self.params["ef_search"]
+        self._ids = json.loads(ids_path.read_text(encoding="utf-8"))
+        self._labels = {chunk_id: label for label, chunk_id in enumerate(self._ids) if chunk_id is not None}
+        return True
+
+
+def make_index(backend: str, dimension: int, profile: str = None, metric: str = None) -> ANNIndex:
+    if backend == "hnswlib":
+        return HnswlibIndex(dimension, profile, metric)
+    if backend == "faiss":
+        return FaissIndex(dimension, profile, metric)
+    raise ValueError(f"Unknown ANN backend '{backend}', expected one of {', '.join(BACKENDS[1:])}")
+
+
+class IndexedCollection:
+    """
+    A Chroma collection whose similarity search runs in a local ANN index.
+    Writes go to both; anything else is passed through to the collection.
+    """
+
+    def __init__(self, collection, index: ANNIndex, path: Path = None):
+        self.collection = collection
+        self.index = index
+        self.path = path
+        # Unsaved writes; a stale saved index is rebuilt on load anyway
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        with self._lock:
+            self.index.upsert(ids, embeddings)
+            self.dirty = True
+
+    def add(self, ids, embeddings, documents=None, metadatas=None):
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids=None, where=None):
+        if ids is None:
+            ids = self.collection.get(where=where, include=[])["ids"]
+        self.collection.delete(ids=ids)
+        with self._lock:
+            self.index.delete(ids)
+            self.dirty = True
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, include=("documents", "distances")):
+        """
+        Chroma-shaped results. With a where filter the search over-fetches
+        ANN_FILTER_OVERFETCH times n_results neighbours and keeps doubling
+        that until n_results of them pass the filter or the whole index was
+        searched. Past ANN_FILTER_MAX_FETCH neighbours (a namespace holding a
+        small share of the corpus) the filter is selective enough that
+        Chroma's own filtered query is cheaper, and answers instead.
+        """
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for embedding in query_embeddings:
+            ids, documents, metadatas, distances = self._query_one(embedding, n_results, where)
+            results["ids"].append(ids)
+            results["documents"].append(documents)
+            results["metadatas"].append(metadatas)
+            results["distances"].append(distances)
+        return results
+
+    def _query_one(self, embedding, n_results: int, where):
+        k = n_results * settings.ANN_FILTER_OVERFETCH if where else n_results
+        while True:
+            with self._lock:
+                size = len(self.index)
+                found_ids, found_distances = self.index.search([embedding], k)
+            ids, distances = found_ids[0], found_distances[0]
+            rows = self.collection.get(ids=ids, where=where, include=["documents", "metadatas"]) if ids else \
+                {"ids": [], "documents": [], "metadatas": []}
+            by_id = {chunk_id: (doc, meta) for chunk_id, doc, meta in zip(rows["ids"], rows["documents"], rows["metadatas"])}
+            hits = [(chunk_id, distance) for chunk_id, distance in zip(ids, distances) if chunk_id in by_id][:n_results]
+            if not where or len(hits) == n_results or k >= size:
+                break
+            k *= 2
+            if k > settings.ANN_FILTER_MAX_FETCH:
+                rows = self.collection.query(query_embeddings=[embedding], n_results=n_results, where=where,
+                                             include=["documents", "metadatas", "distances"])
+                return rows["ids"][0], rows["documents"][0], rows["metadatas"][0], rows["distances"][0]
+        return ([chunk_id for chunk_id, _ in hits], [by_id[chunk_id][0] for chunk_id, _ in hits],
+                [by_id[chunk_id][1] for chunk_id, _ in hits], [distance for _, distance in hits])
+
+    def rebuild(self, page_size: int = 5000):
+        """Re-create the local index from the embeddings stored in Chroma."""
+        index = make_index(backend_name(self.index), self.index.dimension, self.index.profile, self.index.metric)
+        offset = 0
+        while True:
+            rows = self.collection.get(limit=page_size, offset=offset, include=["embeddings"])
+            if not len(rows["ids"]):
+                break
+            index.upsert(rows["ids"], np.asarray(rows["embeddings"], dtype=np.float32))
+            offset += len(rows["ids"])
+        with self._lock:
+            self.index = index
+            self.dirty = True
+        self.save()
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self.index.save(self.path)
+            self.dirty = False
+
+
+def backend_name(index: ANNIndex) -> str:
+    return "faiss" if isinstance(index, FaissIndex) else "hnswlib"
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def attach(collection, dimension: int, backend: str = None, fresh: bool = False):
+    """
+    The process-wide IndexedCollection for a collection, loading its saved
+    index or rebuilding it from Chroma when the saved one is missing or stale.
+    `fresh` drops the index of a collection that was just (re)created.
+    """
+    backend = backend or settings.ANN_BACKEND
+    if isinstance(collection, IndexedCollection):
+        collection = collection.collection
+    if backend == "chroma":
+        return collection
+    metadata = collection.metadata or {}
+    profile = metadata.get("index_profile") or settings.INDEX_PROFILE
+    metric = metadata.get("hnsw:space") or settings.INDEX_METRIC
+    path = Path(settings.VECTOR_STORE_DIR) / "ann" / f"{collection.name}.{backend}"
+    with _indexes_lock:
+        indexed = _indexes.get(collection.name)
+        if indexed is not None and not fresh:
+            indexed.collection = collection
+            return indexed
+        indexed = IndexedCollection(collection, make_index(backend, dimension, profile, metric), path)
+        if not fresh and not (indexed.index.load(path) and len(indexed.index) == collection.count()):
+            indexed.rebuild()
+        _indexes[collection.name] = indexed
+        return indexed
+
+
+def save_all():
+    """Write every local index with unsaved changes to disk."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for indexed in indexes:
+        indexed.save()
+
+
+atexit.register(save_all)
@@ -0,0 +1,110 @@
+"""
+Semantic answer cache.
+
+Past answers are looked up by the cosine similarity of the new question's
+embedding to the questions already answered, so repeated and paraphrased
+questions skip retrieval and generation. Entries are tied to the collection
+version they were answered against and are dropped once it changes, expire
+after a TTL, and the least recently used ones are evicted at capacity.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import collection_versions
+import settings
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int, threshold: float, ttl: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> entry dict
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _prune(self, now):
+        for entry_id, entry in list(self._entries.items()):
+            if entry["version"] != collection_versions.current(entry["collection"]):
+                del self._entries[entry_id]
+                self.invalidations += 1
+            elif now - entry["created"] > self.ttl:
+                del self._entries[entry_id]
+                self.expirations += 1
+
+    def lookup(self, collection_name: str, question_embedding):
+        """Return (answer, source) for the most similar cached question, or None."""
+        if not self.enabled:
+            return None
+        query = self._normalize(question_embedding)
+        with self._lock:
+            self._prune(time.monotonic())
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items()
+                          if entry["collection"] == collection_name]
+            if candidates:
+                matrix = np.stack([entry["embedding"] for _, entry in candidates])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry["answer"], entry["source"]
+            self.misses += 1
+            return None
+
+    def store(self, collection_name: str, version: int, question: str, question_embedding, answer: str, source: str):
+        """Remember an answer computed against the given collection version."""
+        if not self.enabled or version != collection_versions.current(collection_name):
+            return
+        with self._lock:
+            self._entries[self._next_id] = {
+                "collection": collection_name,
+                "version": version,
+                "question": question,
+                "embedding": self._normalize(question_embedding),
+                "answer": answer,
+                "source": source,
+                "created": time.monotonic(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+cache = AnswerCache(settings.ANSWER_CACHE_SIZE, settings.ANSWER_CACHE_THRESHOLD, settings.ANSWER_CACHE_TTL)
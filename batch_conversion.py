@@ -0,0 +1,245 @@
+"""
+Parallel batch conversion to Markdown.
+
+Files are handed to a pool of long-lived worker processes, each with its own
+pre-built Docling converters. A file that raises only fails itself, and a file
+that runs past the timeout gets its worker killed and replaced, so one bad PDF
+can't stall or sink the rest of the batch. Results come back as each file
+finishes, in whatever order that happens. Files already in the conversion
+cache are written straight from it, without starting a worker.
+
+Headless use, e.g. for nightly bulk conversions:
+
+    python batch_conversion.py inbox/ extra.pdf --out output_markdown --workers 4 --timeout 600
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+
+import conversion_cache
+import settings
+
+SUPPORTED_EXTENSIONS = [".pdf", ".doc", ".docx", ".txt"]
+
+
+class ConversionResult:
+    def __init__(self, index: int, name: str, out_file: str = None, error: str = None,
+                 seconds: float = 0.0, cached: bool = False):
+        self.index = index
+        self.name = name
+        self.out_file = out_file
+        self.error = error
+        self.seconds = seconds
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "out_file": self.out_file,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "cached": self.cached,
+        }
+
+
+def default_workers() -> int:
+    if settings.BATCH_WORKERS > 0:
+        return settings.BATCH_WORKERS
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def _write_markdown(out_dir, name: str, markdown: str) -> Path:
+    out_file = Path(out_dir) / f"{Path(name).stem}.md"
+    out_file.write_text(markdown, encoding="utf-8", errors="replace")
+    return out_file
+
+
+def _worker(conn, num_threads, do_ocr):
+    # Imported here so the parent process never loads Docling itself
+    import conversion
+
+    conversion.configure(num_threads=num_threads, do_ocr=do_ocr)
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        index, src, name, out_dir = task
+        start = time.perf_counter()
+        hits = conversion.cache.hits
+        try:
+            out_file = _write_markdown(out_dir, name, conversion.convert_to_markdown(src))
+            conn.send((index, str(out_file), None, time.perf_counter() - start, conversion.cache.hits > hits))
+        except Exception as e:
+            conn.send((index, None, f"{type(e).__name__}: {e}", time.perf_counter() - start, False))
+
+
+def convert_batch(files, out_dir, workers: int = None, timeout: float = None,
+                  threads_per_worker: int = None, do_ocr: bool = None, on_result=None):
+    """
+    Convert files (a list of paths, or (path, output name) pairs) into out_dir.
+    on_result(result, completed, total) is called from the calling thread as
+    each file finishes. Returns the ConversionResults in input order.
+    """
+    jobs = [(f, Path(f).name) if isinstance(f, (str, Path)) else f for f in files]
+    total = len(jobs)
+    if not total:
+        return []
+
+    timeout = timeout or settings.BATCH_TIMEOUT
+    do_ocr = settings.CONVERTER_OCR if do_ocr is None else do_ocr
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    finished = {}
+
+    def finish(result):
+        finished[result.index] = result
+        if on_result:
+            on_result(result, len(finished), total)
+
+    # Cache hits are served here, so a known batch doesn't start (and load
+    # Docling in) a single worker
+    pending = deque()
+    for index, (src, name) in enumerate(jobs):
+        start = time.perf_counter()
+        try:
+            markdown = conversion_cache.cached_markdown(src, do_ocr)
+        except OSError:
+            # Unreadable here; the worker reports the error
+            markdown = None
+        if markdown is None:
+            pending.append((index, (src, name)))
+            continue
+        out_file = _write_markdown(out_dir, name, markdown)
+        finish(ConversionResult(index, name, str(out_file), seconds=time.perf_counter() - start, cached=True))
+    if not pending:
+        return [finished[i] for i in range(total)]
+
+    workers = max(1, min(workers or default_workers(), len(pending)))
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    # Every worker gets its own pipe, so killing a stuck or crashed worker
+    # can't leave a lock held on a channel the other workers still use
+    ctx = multiprocessing.get_context("spawn")
+    procs = {}    # worker_id -> (process, connection)
+    running = {}  # worker_id -> (index, start time)
+    next_worker_id = 0
+
+    def spawn():
+        nonlocal next_worker_id
+        parent_conn, child_conn = ctx.Pipe()
+        proc = ctx.Process(target=_worker, args=(child_conn, threads_per_worker, do_ocr), daemon=True)
+        proc.start()
+        child_conn.close()
+        procs[next_worker_id] = (proc, parent_conn)
+        next_worker_id += 1
+        return next_worker_id - 1
+
+    def dispatch(worker_id):
+        if not pending:
+            return
+        index, (src, name) = pending.popleft()
+        running[worker_id] = (index, time.monotonic())
+        try:
+            procs[worker_id][1].send((index, str(src), name, str(out_dir)))
+        except OSError:
+            # The worker is already gone; the liveness check below reports it
+            pass
+
+    try:
+        for _ in range(workers):
+            dispatch(spawn())
+
+        while len(finished) < total:
+            by_conn = {procs[worker_id][1]: worker_id for worker_id in running}
+            for conn in wait(list(by_conn), timeout=0.5):
+                worker_id = by_conn[conn]
+                try:
+                    index, out_file, error, seconds, cached = conn.recv()
+                except (EOFError, OSError):
+                    continue
+                del running[worker_id]
+                finish(ConversionResult(index, jobs[index][1], out_file, error, seconds, cached))
+                dispatch(worker_id)
+
+            now = time.monotonic()
+            for worker_id, (index, start) in list(running.items()):
+                proc, conn = procs[worker_id]
+                timed_out = now - start > timeout
+                if not timed_out and proc.is_alive():
+                    continue
+                if timed_out:
+                    proc.terminate()
+                proc.join()
+                conn.close()
+                del procs[worker_id]
+                del running[worker_id]
+                error = f"TimeoutError: no result after {timeout}s" if timed_out else \
+                    f"Worker exited with code {proc.exitcode}"
+                finish(ConversionResult(index, jobs[index][1], error=error, seconds=now - start))
+                if pending:
+                    dispatch(spawn())
+    finally:
+        for proc, conn in procs.values():
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for proc, conn in procs.values():
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+            conn.close()
+
+    return [finished[i] for i in range(total)]
+
+
+def collect_files(inputs):
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in SUPPORTED_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert documents to Markdown in parallel.")
+    parser.add_argument("inputs", nargs="+", help="Files or folders to convert")
+    parser.add_argument("--out", default="output_markdown", help="Destination folder")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds allowed per file")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--ocr", action="store_true", default=None, help="OCR scanned PDFs")
+    args = parser.parse_args()
+
+    files = collect_files(args.inputs)
+    start = time.perf_counter()
+
+    def report(result, completed, total):
+        print(json.dumps({"completed": completed, "total": total, **result.as_dict()}), flush=True)
+
+    results = convert_batch(files, args.out, workers=args.workers, timeout=args.timeout,
+                            threads_per_worker=args.threads_per_worker, do_ocr=args.ocr, on_result=report)
+    failed = [r for r in results if not r.ok]
+    print(json.dumps({
+        "files": len(results),
+        "failed": len(failed),
+        "cached": sum(r.cached for r in results),
+        "seconds": round(time.perf_counter() - start, 3),
+    }), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Answer a file of questions against the knowledge base, e.g. for nightly
+regression sets:
+
+    python batch_qa.py questions.jsonl answers.jsonl --collection documents --batch-size 32
+
+Input is JSONL (one {"question": ..., "id": ...} per line) or CSV with a
+"question" column (and optionally "id"). The output format follows the output
+file's extension (.jsonl or .csv) and holds the answer, source, retrieved ids,
+distances and prompt size in tokens for every question.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+import ann_index
+import corpus
+import settings
+from embeddings import get_embedder
+from qa import answer_batch
+from vectorstore import ensure_compatible, get_client
+
+OUTPUT_FIELDS = ["id", "question", "answer", "source", "ids", "distances", "prompt_tokens"]
+
+
+def read_questions(path: Path) -> list:
+    """[(id, question)] from a JSONL or CSV file."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+    return [(record.get("id") or str(i), record["question"]) for i, record in enumerate(records, start=1)]
+
+
+class AnswerWriter:
+    def __init__(self, path: Path):
+        self.csv = path.suffix.lower() == ".csv"
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=OUTPUT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row: dict):
+        if self.csv:
+            self.writer.writerow({**row, "ids": json.dumps(row["ids"]), "distances": json.dumps(row["distances"])})
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of questions in batches.")
+    parser.add_argument("questions", help="Input .jsonl or .csv file")
+    parser.add_argument("output", help="Output .jsonl or .csv file")
+    parser.add_argument("--collection", default="documents", help="Collection to search (\"docs\" is the built-in corpus)")
+    parser.add_argument("--namespace", help="Only search the documents this user/team added to the knowledge base")
+    parser.add_argument("--n-results", type=int, default=settings.N_RESULTS)
+    parser.add_argument("--batch-size", type=int, default=settings.QA_BATCH_SIZE, help="Prompts per generation batch")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Questions retrieved and written per round")
+    args = parser.parse_args()
+
+    questions = read_questions(Path(args.questions))
+    if args.collection == corpus.COLLECTION_NAME:
+        collection = corpus.load()
+    else:
+        client = get_client()
+        collection = ensure_compatible(client, client.get_collection(name=args.collection))
+        collection = ann_index.attach(collection, get_embedder().dimension)
+    writer = AnswerWriter(Path(args.output))
+    start = time.perf_counter()
+    try:
+        for offset in range(0, len(questions), args.chunk_size):
+            chunk = questions[offset:offset + args.chunk_size]
+            rows = answer_batch(collection, [q for _, q in chunk], n_results=args.n_results,
+                                batch_size=args.batch_size, namespace=args.namespace)
+            for (question_id, _), row in zip(chunk, rows):
+                writer.write({"id": question_id, **row})
+            done = offset + len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{len(questions)} questions in {elapsed:.1f}s ({done / elapsed:.1f} q/s)", file=sys.stderr)
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
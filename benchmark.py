@@ -0,0 +1,440 @@
+"""
+Retrieval benchmark and evaluation harness.
+
+Builds a throwaway index from the built-in padel documents (split with the
+configured chunk size/overlap) plus synthetic distractor chunks, runs a
+labeled question set against it and reports retrieval quality (recall@k, MRR,
+how well the distance cut-off separates on- and off-topic questions) next to
+ingest throughput, query latency percentiles and peak RSS. Every run happens
+in a fresh process, so its peak RSS isn't inflated by the runs before it.
+Results are written as JSON so runs can be compared across releases:
+
+    python benchmark.py --sizes 0 1000 10000 100000 --output bench.json
+
+Chunking, n_results and the cut-off come from settings.py, so e.g.
+PADELMATE_CHUNK_SIZE=500 python benchmark.py evaluates a different chunk size.
+
+Every size is run once per index profile and ANN backend, and each run also
+reports the ANN recall against an exact (brute-force) search, so the
+recall/latency trade-off of the profiles can be compared directly:
+
+    python benchmark.py --sizes 100000 --profiles fast balanced high-recall --backends chroma hnswlib
+
+Questions go through qa.retrieve, so hybrid retrieval and re-ranking are
+measured the way the app runs them; compare them with
+
+    python benchmark.py --retrieval vector hybrid --rerank off on
+
+--inference compares the model inference backends (PyTorch vs int8 ONNX
+Runtime): load time, embedding throughput, query embedding and generation
+latency and peak RSS, each backend measured in a fresh process:
+
+    python benchmark.py --sizes 0 --inference torch onnx
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import chromadb
+import numpy as np
+
+import ann_index
+import corpus
+import lexical_index
+import qa
+import rerank
+import settings
+from embeddings import get_embedder
+from generation import get_generator, load_metrics
+from qa import build_prompt
+from ingestion import IngestReport, ingest_documents, max_upsert_batch, upsert_batched
+
+# (question, id of the padel document that answers it)
+LABELED_QUESTIONS = [
+    ("Where did padel originate?", "padel1"),
+    ("Who built the first padel court?", "padel1"),
+    ("When was the World Padel Tour established?", "padel1"),
+    ("How high is the net in padel?", "padel2"),
+    ("How do you serve in padel?", "padel2"),
+    ("How many players are on a padel court?", "padel2"),
+    ("How big is a padel court?", "padel2"),
+    ("What are padel rackets made of?", "padel3"),
+    ("Which racket shape gives the most power?", "padel3"),
+    ("What shoes should I wear to play padel?", "padel3"),
+    ("Who are the best padel players today?", "padel4"),
+    ("Who is Arturo Coello?", "padel4"),
+    ("Which women form the strongest padel duo?", "padel4"),
+    ("How many padel courts are there in Spain?", "padel5"),
+    ("Which celebrities invested in padel?", "padel5"),
+    ("When was the Premier Padel Tour launched?", "padel5"),
+]
+
+# Questions the corpus can't answer; the distance cut-off should reject them
+OFF_TOPIC_QUESTIONS = [
+    "What is the capital of Japan?",
+    "How do I bake sourdough bread?",
+    "Explain quantum entanglement.",
+    "Which programming language is fastest?",
+]
+
+RECALL_AT = [1, 3, 5, 10]
+
+_VOCABULARY = (
+    "match player court ball racket team season club coach training league final set game point serve "
+    "volley smash tournament ranking fitness strategy score wall glass net doubles partner rally spin "
+    "shot defence attack league federation sponsor stadium fans tickets weather travel city summer winter "
+    "equipment shoes grip speed power control injury recovery practice drill lesson beginner advanced"
+).split()
+
+
+def synthetic_chunks(count: int, seed: int = 13) -> list:
+    """Distractor chunks of roughly CHUNK_SIZE characters of sports-flavoured filler."""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words, length = [], 0
+        while length < settings.CHUNK_SIZE * 0.8:
+            word = rng.choice(_VOCABULARY)
+            words.append(word)
+            length += len(word) + 1
+        chunks.append(" ".join(words).capitalize() + ".")
+    return chunks
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_index(client, name: str, size: int, profile: str = None, backend: str = "chroma"):
+    """Index the padel documents plus `size` synthetic chunks; returns (collection, ingest stats)."""
+    embedder = get_embedder()
+    try:
+        client.delete_collection(name=name)
+    except Exception:
+        pass
+    collection = client.create_collection(name=name, metadata={**ann_index.chroma_metadata(profile),
+                                                               **embedder.fingerprint()})
+    if backend != "chroma":
+        # A throwaway local index: not registered or saved like the app's
+        collection = ann_index.IndexedCollection(
+            collection, ann_index.make_index(backend, embedder.dimension, profile))
+    write_batch_size = max_upsert_batch(client)
+
+    fixture = ingest_documents(collection, embedder, list(zip(corpus.PADEL_IDS, corpus.PADEL_DOCUMENTS)),
+                               write_batch_size=write_batch_size)
+
+    report = IngestReport(settings.EMBED_BATCH_SIZE, write_batch_size)
+    chunks = synthetic_chunks(size)
+    start = time.perf_counter()
+    embeddings = embedder.encode(chunks)
+    report.encode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    upsert_batched(collection, [f"synthetic_{i}" for i in range(size)], embeddings, chunks,
+                   [{"filename": "synthetic", "chunk_index": i} for i in range(size)], write_batch_size)
+    report.write_seconds = time.perf_counter() - start
+    report.documents = 1 if size else 0
+    report.chunks = report.added_chunks = size
+    report.tokens = embedder.count_tokens(chunks)
+
+    return collection, {"fixture": fixture.as_dict(), "synthetic": report.as_dict()}
+
+
+def stored_embeddings(collection, page_size: int = 5000):
+    """(ids, float32 matrix) of everything in the collection."""
+    ids, blocks = [], []
+    offset = 0
+    while True:
+        rows = collection.get(limit=page_size, offset=offset, include=["embeddings"])
+        if not len(rows["ids"]):
+            break
+        ids.extend(rows["ids"])
+        blocks.append(np.asarray(rows["embeddings"], dtype=np.float32))
+        offset += len(rows["ids"])
+    return ids, np.vstack(blocks) if blocks else np.empty((0, get_embedder().dimension), dtype=np.float32)
+
+
+def exact_neighbours(ids, matrix, query, k: int, metric: str) -> list:
+    """Ids of the true k nearest neighbours, by brute force."""
+    query = np.asarray(query, dtype=np.float32)
+    if metric == "l2":
+        distances = ((matrix - query) ** 2).sum(axis=1)
+    elif metric == "cosine":
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        distances = 1.0 - (matrix @ query) / np.maximum(norms, 1e-12)
+    else:
+        distances = 1.0 - matrix @ query
+    k = min(k, len(ids))
+    nearest = np.argpartition(distances, k - 1)[:k] if k else []
+    return [ids[i] for i in nearest]
+
+
+def evaluate(collection, repeats: int = 3) -> dict:
+    """
+    Retrieval quality and latency of the labeled and off-topic question sets,
+    retrieved through qa.retrieve like the app does (so with the configured
+    RETRIEVAL_MODE and RERANK), bypassing its cache.
+    """
+    embedder = get_embedder()
+    k_max = max(RECALL_AT + [settings.N_RESULTS])
+    hits = {k: 0 for k in RECALL_AT}
+    reciprocal_ranks = []
+    embed_ms, search_ms = [], []
+    answered, rejected, reranked, searches = 0, 0, 0, 0
+    metric = (collection.metadata or {}).get("hnsw:space", "l2")
+    all_ids, matrix = stored_embeddings(collection)
+    ann_overlap = {k: [] for k in (settings.N_RESULTS, k_max)}
+    if settings.RETRIEVAL_MODE == "hybrid":
+        # Build the BM25 index up front, as a long-running app would have it
+        lexical_index.get_index(collection)
+    if settings.RERANK:
+        # Load the cross-encoder now rather than fall back on the first questions
+        rerank.rerank(LABELED_QUESTIONS[0][0], {"ids": ["a", "b"], "documents": ["a", "b"], "distances": [0, 0]},
+                      1, budget_ms=0)
+
+    def search(question):
+        nonlocal reranked, searches
+        start = time.perf_counter()
+        embedding = embedder.embed_query(question)
+        embedded = time.perf_counter()
+        retrieved = qa.retrieve(collection, question, n_results=k_max, query_embedding=embedding, use_cache=False)
+        done = time.perf_counter()
+        embed_ms.append((embedded - start) * 1000)
+        search_ms.append((done - embedded) * 1000)
+        reranked += bool(retrieved.get("reranked"))
+        searches += 1
+        # How many of the true nearest neighbours the vector index found (untimed)
+        found = collection.query(query_embeddings=[embedding], n_results=k_max, include=["distances"])["ids"][0]
+        for k in ann_overlap:
+            exact = exact_neighbours(all_ids, matrix, embedding, k, metric)
+            if exact:
+                ann_overlap[k].append(len(set(found[:k]) & set(exact)) / len(exact))
+        return retrieved
+
+    for question, expected in LABELED_QUESTIONS:
+        for _ in range(repeats):
+            retrieved = search(question)
+        stored = collection.get(ids=retrieved["ids"], include=["metadatas"]) if retrieved["ids"] else \
+            {"ids": [], "metadatas": []}
+        filenames = {chunk_id: metadata["filename"] for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])}
+        sources = [filenames.get(chunk_id) for chunk_id in retrieved["ids"]]
+        rank = sources.index(expected) + 1 if expected in sources else None
+        for k in RECALL_AT:
+            hits[k] += rank is not None and rank <= k
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        answered += qa.is_relevant({key: retrieved[key][:settings.N_RESULTS] for key in ("documents", "distances")})
+
+    for question in OFF_TOPIC_QUESTIONS:
+        for _ in range(repeats):
+            retrieved = search(question)
+        rejected += not qa.is_relevant({key: retrieved[key][:settings.N_RESULTS] for key in ("documents", "distances")})
+
+    total_ms = [e + s for e, s in zip(embed_ms, search_ms)]
+    return {
+        "retrieval": {
+            **{f"recall@{k}": round(hits[k] / len(LABELED_QUESTIONS), 4) for k in RECALL_AT},
+            "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+        },
+        # Agreement of the approximate search with an exact one
+        "ann_recall": {
+            f"@{k}": round(sum(overlaps) / len(overlaps), 4) if overlaps else None
+            for k, overlaps in ann_overlap.items()
+        },
+        "cutoff": {
+            "threshold": settings.DISTANCE_THRESHOLD,
+            "on_topic_answered": round(answered / len(LABELED_QUESTIONS), 4),
+            "off_topic_rejected": round(rejected / len(OFF_TOPIC_QUESTIONS), 4),
+        },
+        # Share of searches the cross-encoder scored within RERANK_BUDGET_MS
+        "reranked": round(reranked / searches, 4) if settings.RERANK else None,
+        "latency_ms": {
+            stage: {f"p{p}": round(percentile(samples, p), 3) for p in (50, 95, 99)}
+            for stage, samples in (("embed", embed_ms), ("search", search_ms), ("total", total_ms))
+        },
+    }
+
+
+def run(size: int, repeats: int = 3, profile: str = None, backend: str = "chroma") -> dict:
+    client = chromadb.Client()
+    profile = profile or settings.INDEX_PROFILE
+    name = f"benchmark_{size}_{profile}_{backend}"
+    collection, ingest = build_index(client, name, size, profile, backend)
+    result = {
+        "synthetic_chunks": size,
+        "profile": profile,
+        "index_params": ann_index.profile_params(profile),
+        "backend": backend,
+        "retrieval_mode": settings.RETRIEVAL_MODE,
+        "rerank": settings.RERANK,
+        "indexed_chunks": collection.count(),
+        "ingest": ingest,
+        **evaluate(collection, repeats),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    client.delete_collection(name=name)
+    return result
+
+
+def run_isolated(size: int, repeats: int, profile: str, backend: str, retrieval: str, rerank_on: bool) -> dict:
+    """run() in a fresh process, so peak_rss_mb covers this configuration only."""
+    env = {**os.environ, "PADELMATE_RETRIEVAL_MODE": retrieval, "PADELMATE_RERANK": "1" if rerank_on else "0"}
+    command = [sys.executable, __file__, "--run-one", "--sizes", str(size), "--repeats", str(repeats),
+               "--profiles", profile, "--backends", backend]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def inference_run(repeats: int = 3) -> dict:
+    """Speed and memory of the configured inference backend (run in a fresh process)."""
+    start = time.perf_counter()
+    embedder = get_embedder()
+    embed_load = time.perf_counter() - start
+    chunks = synthetic_chunks(1000)
+    start = time.perf_counter()
+    embedder.encode(chunks)
+    encode_seconds = time.perf_counter() - start
+    query_ms = []
+    for question, _ in LABELED_QUESTIONS:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            embedder.embed_query(question)
+            query_ms.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    generator = get_generator(settings.GENERATION_MODEL, max_length=settings.ANSWER_MAX_LENGTH)
+    generation_load = time.perf_counter() - start
+    documents = dict(zip(corpus.PADEL_IDS, corpus.PADEL_DOCUMENTS))
+    generate_ms = []
+    for question, doc_id in LABELED_QUESTIONS:
+        prompt = build_prompt(question, [documents[doc_id][:settings.CHUNK_SIZE]])
+        for _ in range(repeats):
+            start = time.perf_counter()
+            generator(prompt)
+            generate_ms.append((time.perf_counter() - start) * 1000)
+
+    model_stats = next(iter(load_metrics().values()), {})
+    return {
+        "backend": settings.INFERENCE_BACKEND,
+        # What actually ran: an export that failed its parity check stays on PyTorch
+        "embedding_backend": embedder.backend,
+        "generation_backend": model_stats.get("backend", "torch"),
+        "load_seconds": {"embedding": round(embed_load, 3), "generation": round(generation_load, 3)},
+        "encode_chunks_per_second": round(len(chunks) / encode_seconds, 1) if encode_seconds else None,
+        "latency_ms": {
+            stage: {f"p{p}": round(percentile(samples, p), 3) for p in (50, 95, 99)}
+            for stage, samples in (("query_embed", query_ms), ("generate", generate_ms))
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_inference(backend: str, repeats: int) -> dict:
+    env = {**os.environ, "PADELMATE_INFERENCE_BACKEND": backend}
+    completed = subprocess.run([sys.executable, __file__, "--inference-run", "--repeats", str(repeats)],
+                               env=env, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and speed.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[0, 1000, 10000],
+                        help="Synthetic distractor chunks per run")
+    parser.add_argument("--repeats", type=int, default=3, help="Times each question is timed")
+    parser.add_argument("--profiles", nargs="+", choices=list(ann_index.PROFILES), default=[settings.INDEX_PROFILE],
+                        help="HNSW index profiles to compare")
+    parser.add_argument("--backends", nargs="+", choices=list(ann_index.BACKENDS), default=["chroma"],
+                        help="Where the nearest-neighbour search runs")
+    parser.add_argument("--retrieval", nargs="+", choices=["vector", "hybrid"], default=[settings.RETRIEVAL_MODE],
+                        help="Retrieval modes to compare")
+    parser.add_argument("--rerank", nargs="+", choices=["off", "on"], default=["on" if settings.RERANK else "off"],
+                        help="Compare retrieval without and/or with cross-encoder re-ranking")
+    parser.add_argument("--inference", nargs="+", choices=["torch", "onnx"], default=[],
+                        help="Also compare these model inference backends")
+    parser.add_argument("--run-one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--inference-run", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    if args.run_one:
+        print(json.dumps(run(args.sizes[0], args.repeats, args.profiles[0], args.backends[0])))
+        return
+    if args.inference_run:
+        print(json.dumps(inference_run(args.repeats)))
+        return
+
+    report = {
+        "config": {
+            "embedding_model": settings.EMBEDDING_MODEL,
+            "chunk_size": settings.CHUNK_SIZE,
+            "chunk_overlap": settings.CHUNK_OVERLAP,
+            "n_results": settings.N_RESULTS,
+            "distance_threshold": settings.DISTANCE_THRESHOLD,
+            "index_metric": settings.INDEX_METRIC,
+            "embed_batch_size": settings.EMBED_BATCH_SIZE,
+            "inference_backend": settings.INFERENCE_BACKEND,
+            "python": platform.python_version(),
+            "chromadb": chromadb.__version__,
+        },
+        "runs": [],
+    }
+    for size in args.sizes:
+        for backend in args.backends:
+            for profile in args.profiles:
+                for retrieval in args.retrieval:
+                    for rerank_setting in args.rerank:
+                        print(f"Benchmarking {profile} ({backend}, {retrieval}, rerank {rerank_setting}) "
+                              f"with {size} synthetic chunks...", file=sys.stderr)
+                        report["runs"].append(run_isolated(size, args.repeats, profile, backend, retrieval,
+                                                           rerank_setting == "on"))
+    # One line per run: what each profile buys in recall and costs in latency
+    report["recall_vs_latency"] = [
+        {
+            "synthetic_chunks": r["synthetic_chunks"],
+            "backend": r["backend"],
+            "profile": r["profile"],
+            "retrieval_mode": r["retrieval_mode"],
+            "rerank": r["rerank"],
+            "ann_recall": r["ann_recall"],
+            f"recall@{RECALL_AT[-1]}": r["retrieval"][f"recall@{RECALL_AT[-1]}"],
+            "search_ms_p50": r["latency_ms"]["search"]["p50"],
+            "search_ms_p95": r["latency_ms"]["search"]["p95"],
+        }
+        for r in report["runs"]
+    ]
+    for backend in args.inference:
+        print(f"Benchmarking {backend} inference...", file=sys.stderr)
+        report.setdefault("inference", []).append(run_inference(backend, args.repeats))
+    baseline = next((r for r in report.get("inference", []) if r["backend"] == "torch"), None)
+    if baseline:
+        for r in report["inference"]:
+            r["speedup_vs_torch"] = {
+                stage: round(baseline["latency_ms"][stage]["p50"] / r["latency_ms"][stage]["p50"], 2)
+                for stage in r["latency_ms"] if r["latency_ms"][stage]["p50"]
+            }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Monotonically increasing version numbers per collection.
+
+Everything that writes to a collection bumps its version, so caches can tag
+their entries with the version they were computed against and never serve
+results from before the last add or delete.
+"""
+import threading
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def current(collection_name: str) -> int:
+    return _versions.get(collection_name, 0)
+
+
+def bump(collection_name: str) -> int:
+    with _lock:
+        _versions[collection_name] = _versions.get(collection_name, 0) + 1
+        return _versions[collection_name]
@@ -0,0 +1,118 @@
+"""
+Token-budget-aware prompt assembly.
+
+flan-t5 reads at most 512 tokens and silently truncates the rest, so a prompt
+of three full chunks plus instructions can lose the end of its context (and
+the question) while still paying to tokenize and encode all of it. The
+context is packed instead: retrieved chunks go in best first, text a previous
+chunk already contains (the CHUNK_OVERLAP characters neighbouring chunks
+share) is dropped, and a chunk that doesn't fit whole is cut down to the
+sentences that do. Tokens are counted with the generation model's own
+tokenizer, and the final prompt is checked against the budget.
+"""
+import re
+
+import settings
+
+# Shortest shared prefix/suffix treated as chunk overlap rather than coincidence
+MIN_OVERLAP = 20
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class PromptContext:
+    def __init__(self, prompt: str, tokens: int, budget: int, excerpts, trimmed: int, dropped: int):
+        self.prompt = prompt
+        self.tokens = tokens
+        self.budget = budget
+        # The (possibly trimmed) chunk texts that made it into the prompt
+        self.excerpts = excerpts
+        self.trimmed = trimmed
+        self.dropped = dropped
+
+    def as_dict(self) -> dict:
+        return {
+            "prompt_tokens": self.tokens,
+            "token_budget": self.budget,
+            "excerpts": len(self.excerpts),
+            "trimmed": self.trimmed,
+            "dropped": self.dropped,
+        }
+
+
+def strip_overlap(text: str, previous, max_overlap: int = None) -> str:
+    """
+    text without the parts it shares with already selected chunks: empty if
+    one of them contains it, otherwise minus a leading (or trailing) stretch
+    that one of them ends (or starts) with.
+    """
+    max_overlap = max_overlap or 2 * settings.CHUNK_OVERLAP
+    text = text.strip()
+    for other in previous:
+        if text in other:
+            return ""
+        for n in range(min(len(other), len(text), max_overlap), MIN_OVERLAP - 1, -1):
+            if other.endswith(text[:n]):
+                text = text[n:].strip()
+                break
+        for n in range(min(len(other), len(text), max_overlap), MIN_OVERLAP - 1, -1):
+            if other.startswith(text[-n:]):
+                text = text[:-n].strip()
+                break
+    return text
+
+
+def sentences(text: str) -> list:
+    return [s for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def build_context(question: str, docs, build_prompt, count_tokens, budget: int) -> PromptContext:
+    """
+    Pack docs (best first) into build_prompt(question, excerpts) so that it
+    stays within budget tokens. count_tokens(texts) returns the token count
+    of each text including the end-of-sequence token, which also covers the
+    blank line between documents.
+    """
+    base_tokens = count_tokens([build_prompt(question, [])])[0]
+    available = budget - base_tokens
+    excerpts, selected, trimmed, dropped = [], [], 0, 0
+    for doc in docs:
+        text = strip_overlap(doc, selected)
+        selected.append(doc)
+        if not text:
+            dropped += 1
+            continue
+        label = f"Document {len(excerpts) + 1}: "
+        cost = count_tokens([label + text])[0]
+        if cost <= available:
+            excerpts.append(text)
+            available -= cost
+            continue
+        # Keep the leading sentences that still fit
+        parts = sentences(text)
+        kept, used = [], count_tokens([label])[0]
+        for sentence, tokens in zip(parts, count_tokens(parts)):
+            if used + tokens > available:
+                break
+            kept.append(sentence)
+            used += tokens
+        if kept:
+            excerpts.append(" ".join(kept))
+            available -= used
+            trimmed += 1
+        else:
+            dropped += 1
+
+    # Per-piece counts are close but not exact; make sure the whole prompt fits
+    prompt = build_prompt(question, excerpts)
+    tokens = count_tokens([prompt])[0]
+    while tokens > budget and excerpts:
+        parts = sentences(excerpts[-1])
+        if len(parts) > 1:
+            excerpts[-1] = " ".join(parts[:-1])
+        else:
+            excerpts.pop()
+            dropped += 1
+        prompt = build_prompt(question, excerpts)
+        tokens = count_tokens([prompt])[0]
+    return PromptContext(prompt, tokens, budget, excerpts, trimmed, dropped)
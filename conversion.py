@@ -0,0 +1,166 @@
+"""
+Document -> Markdown conversion shared by app.py and conversionapp.py.
+
+Each format's DocumentConverter is built once per process and reused, so only
+the first file pays for pipeline and layout model initialization. Docling
+output is cached on disk under a SHA-256 of the file bytes and the converter
+options (see conversion_cache), so re-uploading a known file skips the
+conversion altogether.
+
+Large PDFs can also be converted a page range at a time with iter_pdf_pages(),
+which keeps only one range's Docling document in memory.
+"""
+import hashlib
+import threading
+from pathlib import Path
+
+import pypdfium2
+from docling.document_converter import DocumentConverter, PdfFormatOption
+from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions, AcceleratorDevice
+
+import settings
+from conversion_cache import DOCLING_EXTENSIONS, cache, converter_kind, converter_options
+from telemetry import span
+
+class ConverterPool:
+    """One pre-built DocumentConverter per format, shared by every session."""
+
+    def __init__(self, num_threads: int, do_ocr: bool):
+        self.num_threads = num_threads
+        self.do_ocr = do_ocr
+        self._converters = {}
+        # Docling models aren't safe to run from several threads at once,
+        # so each converter converts one file at a time
+        self._locks = {"pdf": threading.Lock(), "word": threading.Lock()}
+        self._build_lock = threading.Lock()
+
+    def _build(self, kind: str):
+        if kind == "pdf":
+            pdf_opts = PdfPipelineOptions(do_ocr=self.do_ocr)
+            pdf_opts.accelerator_options = AcceleratorOptions(
+                num_threads=self.num_threads,
+                device=AcceleratorDevice.CPU
+            )
+            converter = DocumentConverter(
+                format_options={
+                    InputFormat.PDF: PdfFormatOption(
+                        pipeline_options=pdf_opts,
+                        backend=DoclingParseV2DocumentBackend
+                    )
+                }
+            )
+            converter.initialize_pipeline(InputFormat.PDF)
+            return converter
+
+        converter = DocumentConverter()
+        converter.initialize_pipeline(InputFormat.DOCX)
+        return converter
+
+    def get(self, kind: str):
+        converter = self._converters.get(kind)
+        if converter is None:
+            with self._build_lock:
+                converter = self._converters.get(kind)
+                if converter is None:
+                    converter = self._build(kind)
+                    self._converters[kind] = converter
+        return converter
+
+    def convert(self, file_path: str, kind: str, page_range: tuple = None) -> str:
+        """Markdown for the file, or for the (first, last) pages of a PDF (1-based, inclusive)."""
+        converter = self.get(kind)
+        kwargs = {"page_range": page_range} if page_range else {}
+        with self._locks[kind]:
+            doc = converter.convert(file_path, **kwargs).document
+            return doc.export_to_markdown(image_mode="placeholder")
+
+    def warm_up(self, kinds=("pdf", "word")):
+        for kind in kinds:
+            self.get(kind)
+
+    def options(self, kind: str) -> dict:
+        """Everything besides the file bytes that affects the Markdown output."""
+        return converter_options(kind, self.do_ocr)
+
+
+converters = ConverterPool(settings.CONVERTER_NUM_THREADS, settings.CONVERTER_OCR)
+_configure_lock = threading.Lock()
+
+
+def configure(num_threads: int = None, do_ocr: bool = None):
+    """Swap in a pool with new options; the current one is kept when nothing changes."""
+    global converters
+    with _configure_lock:
+        num_threads = converters.num_threads if num_threads is None else num_threads
+        do_ocr = converters.do_ocr if do_ocr is None else do_ocr
+        if (num_threads, do_ocr) != (converters.num_threads, converters.do_ocr):
+            converters = ConverterPool(num_threads, do_ocr)
+    return converters
+
+
+# Convert uploaded file to markdown text
+def convert_to_markdown(file_path: str) -> str:
+    path = Path(file_path)
+    ext = path.suffix.lower()
+
+    if ext in DOCLING_EXTENSIONS:
+        kind = converter_kind(ext)
+        if not cache.enabled:
+            with span("convert.docling"):
+                return converters.convert(file_path, kind)
+        with span("convert.cache_lookup"):
+            key = cache.key(path, converters.options(kind))
+            markdown = cache.get(key)
+        if markdown is None:
+            with span("convert.docling"):
+                markdown = converters.convert(file_path, kind)
+            with span("convert.cache_store"):
+                cache.put(key, markdown)
+        return markdown
+
+    if ext == ".txt":
+        with span("convert.read_text"):
+            try:
+                return path.read_text(encoding="utf-8")
+            except UnicodeDecodeError:
+                return path.read_text(encoding="latin-1", errors="replace")
+
+    raise ValueError(f"Unsupported extension: {ext}")
+
+
+def pdf_page_count(file_path: str) -> int:
+    pdf = pypdfium2.PdfDocument(str(file_path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def iter_pdf_pages(file_path: str, pages_per_section: int = None):
+    """
+    Convert a PDF `pages_per_section` pages at a time, yielding
+    ((first_page, last_page), markdown) as each range is done. Every range is
+    cached on its own, so an interrupted run picks up where it stopped.
+    """
+    path = Path(file_path)
+    pages_per_section = pages_per_section or settings.STREAM_PAGES_PER_SECTION
+    total = pdf_page_count(path)
+    if cache.enabled:
+        with span("convert.cache_lookup"):
+            file_key = cache.key(path, converters.options("pdf"))
+    for first in range(1, total + 1, pages_per_section):
+        last = min(first + pages_per_section - 1, total)
+        markdown = None
+        if cache.enabled:
+            with span("convert.cache_lookup"):
+                key = hashlib.sha256(f"{file_key}:{first}-{last}".encode()).hexdigest()
+                markdown = cache.get(key)
+        if markdown is None:
+            with span("convert.docling"):
+                markdown = converters.convert(str(path), "pdf", page_range=(first, last))
+            if cache.enabled:
+                with span("convert.cache_store"):
+                    cache.put(key, markdown)
+        yield (first, last), markdown
@@ -0,0 +1,119 @@
+"""
+Content-addressed cache of converted Markdown.
+
+Entries are keyed by a SHA-256 of the file bytes and the converter options
+and evicted least recently used first once the cache outgrows its size
+limit. Nothing here imports Docling, so a process can look up a file (e.g.
+batch_conversion before dispatching work) without loading the converters.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import settings
+
+# Bump when the conversion code changes in a way that changes its output
+CACHE_FORMAT_VERSION = 1
+DOCLING_EXTENSIONS = [".pdf", ".doc", ".docx"]
+
+
+class ConversionCache:
+    """Content-addressed Markdown cache with size-based LRU eviction."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, path: Path, options: dict) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(json.dumps({"version": CACHE_FORMAT_VERSION, **options}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> Path:
+        return self.directory / f"{key}.md"
+
+    def get(self, key: str):
+        entry = self._entry(key)
+        try:
+            markdown = entry.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        # The modification time doubles as the "last used" time for eviction
+        os.utime(entry)
+        self.hits += 1
+        return markdown
+
+    def put(self, key: str, markdown: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = self._entry(key)
+        tmp = entry.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(markdown, encoding="utf-8", errors="replace")
+        os.replace(tmp, entry)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for entry in self.directory.glob("*.md"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        entries = list(self.directory.glob("*.md")) if self.directory.exists() else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(e.stat().st_size for e in entries if e.exists()),
+            "max_bytes": self.max_bytes,
+        }
+
+
+cache = ConversionCache(settings.CONVERSION_CACHE_DIR, settings.CONVERSION_CACHE_MAX_MB * 1024 * 1024)
+
+
+def converter_kind(ext: str) -> str:
+    return "pdf" if ext == ".pdf" else "word"
+
+
+def converter_options(kind: str, do_ocr: bool) -> dict:
+    """Everything besides the file bytes that affects the Markdown output of a converter."""
+    if kind == "pdf":
+        return {"format": "pdf", "do_ocr": do_ocr, "backend": "docling_parse_v2", "image_mode": "placeholder"}
+    return {"format": "word", "image_mode": "placeholder"}
+
+
+def cached_markdown(path, do_ocr: bool):
+    """Markdown a Docling conversion of the file with these options left in the cache, or None."""
+    path = Path(path)
+    ext = path.suffix.lower()
+    if not cache.enabled or ext not in DOCLING_EXTENSIONS:
+        return None
+    return cache.get(cache.key(path, converter_options(converter_kind(ext), do_ocr)))
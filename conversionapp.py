@@ -2,45 +2,8 @@ import streamlit as st
 from pathlib import Path
 import tempfile
 
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions, AcceleratorDevice
-
-
-def convert_to_markdown(file_path: str) -> str:
-    path = Path(file_path)
-    ext = path.suffix.lower()
-
-    if ext == ".pdf":
-        pdf_opts = PdfPipelineOptions(do_ocr=False)
-        pdf_opts.accelerator_options = AcceleratorOptions(
-            num_threads=4,
-            device=AcceleratorDevice.CPU
-        )
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_options=pdf_opts,
-                    backend=DoclingParseV2DocumentBackend
-                )
-            }
-        )
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext in [".doc", ".docx"]:
-        converter = DocumentConverter()
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext == ".txt":
-        try:
-            return path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            return path.read_text(encoding="latin-1", errors="replace")
-
-    raise ValueError(f"Unsupported extension: {ext}")
+import settings
+from batch_conversion import convert_batch, default_workers
 
 
 def main():
@@ -57,6 +20,30 @@ def main():
         value="output_markdown"
     )
 
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        workers = st.number_input(
+            "Worker processes",
+            min_value=1,
+            max_value=32,
+            value=default_workers()
+        )
+    with col2:
+        num_threads = st.number_input(
+            "Threads per worker",
+            min_value=1,
+            max_value=64,
+            value=settings.CONVERTER_NUM_THREADS
+        )
+    with col3:
+        timeout = st.number_input(
+            "Timeout per file (s)",
+            min_value=10,
+            value=settings.BATCH_TIMEOUT
+        )
+    with col4:
+        do_ocr = st.checkbox("OCR scanned PDFs", value=settings.CONVERTER_OCR)
+
     # prepare session state for downloads
     if "downloads" not in st.session_state:
         st.session_state.downloads = []
@@ -76,28 +63,41 @@ def main():
         status = st.empty()
 
         total = len(uploaded)
+        status.text(f"Converting {total} files with {min(int(workers), total)} workers...")
 
-        for idx, up in enumerate(uploaded, start=1):
-            name = up.name
-            status.text(f"Converting {name} ({idx}/{total})")
-            with tempfile.NamedTemporaryFile(delete=False, suffix=Path(name).suffix) as tmp:
+        files = []
+        for up in uploaded:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=Path(up.name).suffix) as tmp:
                 tmp.write(up.getvalue())
-                tmp_path = tmp.name
-
-            try:
-                md = convert_to_markdown(tmp_path)
-                out_file = out_folder / f"{Path(name).stem}.md"
-                out_file.write_text(md, encoding="utf-8", errors="replace")
+                files.append((tmp.name, up.name))
+
+        # files finish in any order; each one moves the bar as soon as it's done
+        def on_result(result, completed, total):
+            if result.ok:
+                md = Path(result.out_file).read_text(encoding="utf-8", errors="replace")
+                st.session_state.downloads.append((Path(result.out_file).name, md))
+            else:
+                st.warning(f"Failed: {result.name}: {result.error}")
+            status.text(f"Converted {result.name} ({completed}/{total})")
+            progress.progress(completed / total)
 
-                # store for download
-                st.session_state.downloads.append((out_file.name, md))
-
-            except Exception as e:
-                st.warning(f"Failed: {name}: {e}")
-
-            progress.progress(idx / total)
+        try:
+            results = convert_batch(
+                files,
+                out_folder,
+                workers=int(workers),
+                timeout=timeout,
+                threads_per_worker=int(num_threads),
+                do_ocr=do_ocr,
+                on_result=on_result
+            )
+        finally:
+            for tmp_path, _ in files:
+                Path(tmp_path).unlink(missing_ok=True)
 
-        status.text("Conversion done.")
+        cached = sum(r.cached for r in results)
+        failed = sum(not r.ok for r in results)
+        status.text(f"Conversion done. {cached} from cache, {failed} failed.")
         st.success(f"Saved markdown files to {out_folder.resolve()}")
 
     # show download buttons after conversion
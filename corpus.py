@@ -0,0 +1,92 @@
+"""
+The built-in padel corpus behind the app's quick Q&A box.
+
+It is embedded into the "docs" collection once per process (or just reopened
+from the persistent store) and then shared by every session, so Streamlit
+reruns do no embedding work at all. Prebuild it at deploy time with:
+
+    python corpus.py
+"""
+import hashlib
+import json
+import threading
+import time
+
+import collection_versions
+import lexical_index
+from embeddings import get_embedder
+from vectorstore import get_client, get_or_create_collection
+
+COLLECTION_NAME = "docs"
+
+# STUDENT TASK: Replace these 5 documents with your own!
+# Pick ONE topic: movies, sports, cooking, travel, technology
+# Each document should be 150-200 words
+# IMPORTANT: The quality of your documents affects answer quality!
+
+PADEL_DOCUMENTS = [
+    "A Brief History of Padel: Padel originated in Mexico in 1969, when Enrique Corcuera created the first court at his home. The sport quickly spread to Spain and Argentina, where it gained immense popularity. Unlike tennis, padel is played on a smaller court enclosed by walls, which are part of the game. Its combination of squash and tennis elements makes it dynamic and strategic. By the 1990s, padel had become one of Spain’s most popular sports. The World Padel Tour (WPT) was established in 2013, further professionalizing the sport. As of 2025, padel is played in over 90 countries and is among the fastest-growing sports in Europe and the Middle East. Its appeal lies in its accessibility—easy for beginners yet tactically rich for advanced players. Today, efforts are ongoing to make padel an Olympic sport. The game's unique mix of teamwork, reflexes, and wall-play has helped it carve out a distinct identity within the racket sport world.",
+
+    "Rules and How the Game Works: Padel is typically played in doubles, 4 players in total, on a 10x20 meter enclosed court. The scoring system mirrors tennis: games, sets, and matches. Players use solid, stringless rackets and a ball slightly less pressurized than a tennis ball. Serves must be underhand and bounce once before crossing diagonally. After the serve, players can use walls to return shots, making positioning and anticipation crucial. The ball must bounce once on the ground before hitting the walls. Shots that hit the opponent's glass wall before the ground are still valid. Unlike tennis, power alone doesn't win matches—strategy, angles, and teamwork are vital. The net is lower than in tennis (88 cm at the center) and the game is played at a faster pace due to shorter court distances. Padel encourages long rallies, spectacular recoveries, and creative use of the back glass. The sport emphasizes reflexes, placement, and coordination, making it accessible yet complex enough for elite competition.",
+
+    "Padel Equipment: What You Need to Play: Padel equipment is simple but specialized. The most important item is the padel racket—solid, perforated, and without strings. It’s made from carbon fiber or fiberglass with a foam core, and it varies in shape: round (control), diamond (power), or teardrop (hybrid). Players choose rackets based on their skill level and playing style. Padel balls resemble tennis balls but have slightly lower pressure for better control in enclosed courts. Footwear is also key: padel shoes offer lateral support and grip suitable for artificial turf and sand-filled surfaces. Apparel is similar to tennis—breathable clothes and wristbands are common. Safety gear like elbow or knee supports can help prevent injuries. Some players wear vibration-dampening gloves or wrist braces. Advanced gear might include smart sensors to track performance or custom-molded grips. While the setup cost is lower than other racket sports, choosing the right gear can greatly impact your game experience and performance.",
+
+    "Who Are the Best Padel Players Today?: As of 2025, the top figures in padel dominate headlines in Spain, Argentina, and increasingly worldwide. On the men’s side, Alejandro Galán and Juan Lebrón have long held top rankings, known for their aggressive play and fluid teamwork. Arturo Coello, a rising Spanish star, has surged through the ranks with powerful smashes and clever tactics. In the women’s circuit, Alejandra Salazar and Gemma Triay form one of the strongest duos, known for their consistency and resilience under pressure. Paula Josemaría has also become a household name due to her speed and anticipation. The World Padel Tour (WPT) and Premier Padel Tour showcase elite talent, with tournaments held across Europe, South America, and the Middle East. Some tennis stars like Andy Murray and Serena Williams have also shown interest in the sport. Rankings evolve rapidly as younger players emerge, but Spain and Argentina remain the dominant forces in both talent and fanbase.",
+
+    "The Global Rise of Padel: Padel has exploded in popularity over the last decade. Spain leads in player base and infrastructure, with over 20,000 courts and more than 5 million players. Argentina has long been a stronghold, with a deep-rooted padel culture. The sport has surged in Italy, Sweden, France, and the UAE, with courts popping up in urban areas and resorts. Padel's growth is driven by its social nature—it’s easy to learn, promotes teamwork, and doesn’t require advanced fitness to start. Major investments by sports clubs, ex-tennis pros, and celebrities (like Neymar and Beckham) have given it global exposure. In 2022, the International Padel Federation partnered with Qatar Sports Investments to launch the Premier Padel Tour, accelerating the sport’s international expansion. Padel clubs now exist in North America and Asia, and talks of Olympic inclusion are gaining momentum. Its combination of fun, accessibility, and fast-paced action continues to attract players of all ages and skill levels."
+]
+
+PADEL_IDS = ["padel1", "padel2", "padel3", "padel4", "padel5"]
+
+_collection = None
+_lock = threading.Lock()
+_stats = {"cold_start_seconds": None, "embedded_documents": 0}
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build(client=None):
+    """Embed the documents that are missing or changed in the store; returns the collection."""
+    collection = get_or_create_collection(client or get_client(), COLLECTION_NAME)
+    stored = collection.get(ids=PADEL_IDS, include=["metadatas"])
+    stored_hashes = {doc_id: (metadata or {}).get("content_hash")
+                     for doc_id, metadata in zip(stored["ids"], stored["metadatas"])}
+    stale = [i for i, doc_id in enumerate(PADEL_IDS)
+             if stored_hashes.get(doc_id) != _content_hash(PADEL_DOCUMENTS[i])]
+    if stale:
+        documents = [PADEL_DOCUMENTS[i] for i in stale]
+        ids = [PADEL_IDS[i] for i in stale]
+        metadatas = [{"content_hash": _content_hash(doc)} for doc in documents]
+        collection.upsert(
+            documents=documents,
+            embeddings=get_embedder().encode(documents).tolist(),
+            metadatas=metadatas,
+            ids=ids
+        )
+        lexical_index.added(collection.name, ids, documents, metadatas)
+        collection_versions.bump(collection.name)
+    _stats["embedded_documents"] += len(stale)
+    return collection
+
+
+def load():
+    """The shared corpus collection, built on the first call in this process."""
+    global _collection
+    if _collection is None:
+        with _lock:
+            if _collection is None:
+                start = time.perf_counter()
+                _collection = build()
+                _stats["cold_start_seconds"] = time.perf_counter() - start
+    return _collection
+
+
+def stats() -> dict:
+    return dict(_stats, loaded=_collection is not None)
+
+
+if __name__ == "__main__":
+    load()
+    print(json.dumps(stats()))
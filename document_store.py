@@ -0,0 +1,135 @@
+"""
+On-disk store for converted documents.
+
+The Markdown of every ingested document is written to
+DOCUMENT_STORE_DIR/<collection>/<doc id>.md next to a small JSON record with
+the stats computed at ingest time (words, characters, bytes, chunks, pages).
+Documents are addressed by their key in the collection (the knowledge base
+uses a hash of the uploaded file, so shared copies are stored once).
+Sessions only keep those records ("handles") and read the text lazily, e.g. a
+preview's first few hundred characters, so no session holds full documents
+and nothing has to re-split the text to show word counts.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import settings
+
+
+class DocumentWriter:
+    """Appends a document section by section; committed on a clean exit."""
+
+    def __init__(self, store, collection_name: str, key: str, **fields):
+        self.store = store
+        self.collection_name = collection_name
+        self.key = key
+        self.fields = fields
+        self.words = 0
+        self.chars = 0
+        self.handle = None
+        self._text_path, _ = store._paths(collection_name, key)
+        self._text_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self._text_path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        self._file = open(self._tmp, "w", encoding="utf-8", errors="replace")
+
+    def write(self, text: str):
+        if self.chars:
+            self._file.write("\n\n")
+            self.chars += 2
+        self._file.write(text)
+        self.words += len(text.split())
+        self.chars += len(text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is not None:
+            self._tmp.unlink(missing_ok=True)
+            return False
+        os.replace(self._tmp, self._text_path)
+        self.handle = self.store._save_record({
+            "collection": self.collection_name,
+            "key": self.key,
+            "doc_id": self.store.doc_id(self.key),
+            "words": self.words,
+            "chars": self.chars,
+            "bytes": self._text_path.stat().st_size,
+            "chunks": 0,
+            "stored_at": time.time(),
+            **self.fields,
+        })
+        return False
+
+
+class DocumentStore:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def doc_id(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+    def _paths(self, collection_name: str, key: str):
+        base = self.directory / collection_name / self.doc_id(key)
+        return base.with_suffix(".md"), base.with_suffix(".json")
+
+    def _save_record(self, record: dict) -> dict:
+        _, record_path = self._paths(record["collection"], record["key"])
+        tmp = record_path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, record_path)
+        return record
+
+    def writer(self, collection_name: str, key: str, **fields) -> DocumentWriter:
+        """Stream a large document into the store; replaces any earlier version on success."""
+        return DocumentWriter(self, collection_name, key, **fields)
+
+    def put(self, collection_name: str, key: str, text: str, **fields) -> dict:
+        with self.writer(collection_name, key, **fields) as writer:
+            writer.write(text)
+        return writer.handle
+
+    def update(self, handle: dict, **fields) -> dict:
+        return self._save_record({**handle, **fields})
+
+    def get(self, collection_name: str, key: str):
+        _, record_path = self._paths(collection_name, key)
+        try:
+            return json.loads(record_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+
+    def list(self, collection_name: str) -> list:
+        records = []
+        for record_path in sorted((self.directory / collection_name).glob("*.json")):
+            try:
+                records.append(json.loads(record_path.read_text(encoding="utf-8")))
+            except (FileNotFoundError, ValueError):
+                continue
+        return sorted(records, key=lambda r: r["stored_at"])
+
+    def preview(self, handle: dict, chars: int = 500) -> str:
+        """The first `chars` characters of the document, without reading the rest."""
+        text_path, _ = self._paths(handle["collection"], handle["key"])
+        try:
+            with open(text_path, encoding="utf-8", errors="replace") as f:
+                return f.read(chars)
+        except FileNotFoundError:
+            return ""
+
+    def read(self, handle: dict) -> str:
+        text_path, _ = self._paths(handle["collection"], handle["key"])
+        return text_path.read_text(encoding="utf-8", errors="replace")
+
+    def delete(self, collection_name: str, key: str):
+        for path in self._paths(collection_name, key):
+            path.unlink(missing_ok=True)
+
+
+store = DocumentStore(settings.DOCUMENT_STORE_DIR)
@@ -0,0 +1,103 @@
+"""
+One embedding service for indexing and querying.
+
+Chunks are embedded with the same SentenceTransformer that embeds questions,
+and queries pass query_embeddings to Chroma so it never loads its own default
+embedding function. Models are loaded once per process and shared by every
+session. With settings.INFERENCE_BACKEND="onnx" the model runs int8-quantized
+on ONNX Runtime (onnx_backend); its vectors stay close enough to the PyTorch
+ones (parity-checked) that existing collections remain usable. If the ONNX
+model can't be built, the PyTorch one is used.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+import settings
+
+logger = logging.getLogger("padelmate.embeddings")
+
+
+class Embedder:
+    def __init__(self, model_name: str):
+        start = time.perf_counter()
+        self.model_name = model_name
+        self.model = None
+        self.backend = "torch"
+        if settings.INFERENCE_BACKEND == "onnx":
+            try:
+                import onnx_backend
+
+                self.model = onnx_backend.load_embedding(model_name)
+            except Exception:
+                logger.exception("ONNX backend unavailable for %s; using PyTorch", model_name)
+            self.backend = "onnx" if self.model is not None else "torch"
+        if self.model is None:
+            self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.load_seconds = time.perf_counter() - start
+        # The fast tokenizer can't be shared between threads while its
+        # truncation/padding settings change between encode and count_tokens
+        self._lock = threading.Lock()
+
+    def fingerprint(self) -> dict:
+        """What gets recorded on every collection built with this model."""
+        return {
+            "embedding_model": self.model_name,
+            "embedding_dimension": self.dimension
+        }
+
+    def encode(self, texts, batch_size: int = None) -> np.ndarray:
+        """
+        Encode texts into one float32 matrix of shape (len(texts), dimension).
+        The model is locked one batch at a time, so questions get embedded in
+        between the batches of a large document being indexed in the background.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        blocks = []
+        for start in range(0, len(texts), batch_size):
+            with self._lock:
+                blocks.append(self.model.encode(
+                    texts[start:start + batch_size],
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                ))
+        return np.concatenate(blocks).astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> list:
+        return self.encode([text])[0].tolist()
+
+    def embed_queries(self, texts, batch_size: int = None) -> list:
+        return self.encode(texts, batch_size).tolist()
+
+    def count_tokens(self, texts) -> int:
+        """Number of tokens the model actually sees (after truncation)."""
+        if not texts:
+            return 0
+        with self._lock:
+            encoded = self.model.tokenizer(list(texts), truncation=True, max_length=self.model.max_seq_length)
+        return sum(len(ids) for ids in encoded["input_ids"])
+
+
+_embedders = {}
+_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = None) -> Embedder:
+    """Return the shared embedder for model_name (settings.EMBEDDING_MODEL by default)."""
+    model_name = model_name or settings.EMBEDDING_MODEL
+    embedder = _embedders.get(model_name)
+    if embedder is None:
+        with _lock:
+            embedder = _embedders.get(model_name)
+            if embedder is None:
+                embedder = Embedder(model_name)
+                _embedders[model_name] = embedder
+    return embedder
@@ -0,0 +1,227 @@
+"""
+Process-wide registry of text generation pipelines.
+
+Streamlit re-runs the app script on every interaction, but imported modules
+are only loaded once per process, so the models kept here are shared by every
+session instead of being rebuilt for every question.
+
+With settings.INFERENCE_BACKEND="onnx", text2text models are loaded as
+int8-quantized ONNX Runtime models (onnx_backend) behind the same pipeline;
+if that fails (optimum not installed, export or quantization errors) the
+model is loaded on PyTorch instead.
+"""
+import gc
+import logging
+import threading
+import time
+
+from transformers import TextIteratorStreamer, pipeline
+
+import settings
+
+logger = logging.getLogger("padelmate.generation")
+
+DEFAULT_MODEL = "google/flan-t5-small"
+DEFAULT_TASK = "text2text-generation"
+
+
+class Generator:
+    """
+    Callable wrapper around a pipeline that shares its weights with every other
+    generator built for the same model. Calls are serialized per model because
+    the fast tokenizers are not safe to use from several threads at once, and
+    torch already spreads a single generation over all CPU cores.
+    """
+
+    def __init__(self, pipe, lock, stats, generation_kwargs=None):
+        self.pipeline = pipe
+        self.lock = lock
+        self.generation_kwargs = dict(generation_kwargs or {})
+        self._stats = stats
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        with self.lock:
+            result = self.pipeline(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        self._stats["generate_calls"] += 1
+        self._stats["generate_seconds"] += elapsed
+        return result
+
+    def stream(self, prompt: str, **generate_kwargs):
+        """
+        Yield the generated text piece by piece as the model produces it.
+        Generation runs in a background thread feeding a TextIteratorStreamer.
+        """
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        kwargs = {**self.generation_kwargs, **generate_kwargs}
+        errors = []
+
+        def run():
+            start = time.perf_counter()
+            try:
+                with self.lock:
+                    inputs = self.tokenizer(prompt, return_tensors="pt")
+                    self.model.generate(**inputs, streamer=streamer, **kwargs)
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer, which re-raises below
+                streamer.end()
+            self._stats["generate_calls"] += 1
+            self._stats["generate_seconds"] += time.perf_counter() - start
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def count_tokens(self, texts) -> list:
+        """Input tokens per text, end-of-sequence token included."""
+        with self.lock:
+            encoded = self.tokenizer(list(texts))
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    @property
+    def max_input_tokens(self) -> int:
+        return self.tokenizer.model_max_length
+
+    @property
+    def model(self):
+        return self.pipeline.model
+
+    @property
+    def tokenizer(self):
+        return self.pipeline.tokenizer
+
+
+class GeneratorRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (task, model_name) -> base pipeline holding the loaded weights
+        self._base = {}
+        # (task, model_name) -> lock shared by every generator of that model
+        self._model_locks = {}
+        # (task, model_name, settings) -> Generator
+        self._generators = {}
+        self._stats = {}
+
+    def get(self, model_name: str = DEFAULT_MODEL, task: str = DEFAULT_TASK, **generation_kwargs):
+        """
+        Return the generator for model_name/task with the given default
+        generation settings (e.g. max_length=150), loading the model on first use.
+        """
+        key = (task, model_name, tuple(sorted(generation_kwargs.items())))
+        generator = self._generators.get(key)
+        if generator is not None:
+            self._stats[(task, model_name)]["hits"] += 1
+            return generator
+
+        with self._lock:
+            generator = self._generators.get(key)
+            if generator is None:
+                base = self._load(task, model_name)
+                # Building a pipeline around already loaded weights is cheap,
+                # so each settings variant reuses the same model and tokenizer
+                pipe = pipeline(task, model=base.model, tokenizer=base.tokenizer, **generation_kwargs)
+                generator = Generator(pipe, self._model_locks[(task, model_name)], self._stats[(task, model_name)],
+                                      generation_kwargs)
+                self._generators[key] = generator
+        return generator
+
+    def _load(self, task, model_name):
+        base = self._base.get((task, model_name))
+        if base is not None:
+            return base
+
+        start = time.perf_counter()
+        backend, onnx_model = "torch", None
+        if settings.INFERENCE_BACKEND == "onnx" and task == DEFAULT_TASK:
+            try:
+                import onnx_backend
+
+                onnx_model = onnx_backend.load_seq2seq(model_name)
+            except Exception:
+                logger.exception("ONNX backend unavailable for %s; using PyTorch", model_name)
+        if onnx_model is not None:
+            backend = "onnx"
+            model, tokenizer = onnx_model
+            base = pipeline(task, model=model, tokenizer=tokenizer)
+        else:
+            base = pipeline(task, model=model_name)
+        elapsed = time.perf_counter() - start
+
+        self._base[(task, model_name)] = base
+        self._model_locks[(task, model_name)] = threading.Lock()
+        stats = self._stats.setdefault((task, model_name), {
+            "loads": 0,
+            "load_seconds": 0.0,
+            "last_load_seconds": 0.0,
+            "hits": 0,
+            "generate_calls": 0,
+            "generate_seconds": 0.0,
+        })
+        stats["loads"] += 1
+        stats["backend"] = backend
+        stats["load_seconds"] += elapsed
+        stats["last_load_seconds"] = elapsed
+        return base
+
+    def warm_up(self, model_name: str = DEFAULT_MODEL, task: str = DEFAULT_TASK, **generation_kwargs):
+        """
+        Load the model and run one tiny generation so the first real question
+        is fast. Does nothing beyond a lookup when the model is already loaded.
+        """
+        already_loaded = self.is_loaded(model_name, task)
+        generator = self.get(model_name, task, **generation_kwargs)
+        if not already_loaded:
+            generator("Question: What is padel?\n\nAnswer:", max_length=8)
+        return generator
+
+    def unload(self, model_name: str = None, task: str = None):
+        """Drop cached models (all of them when no name is given) and free their memory."""
+        with self._lock:
+            for key in list(self._base):
+                if (model_name is None or key[1] == model_name) and (task is None or key[0] == task):
+                    del self._base[key]
+                    del self._model_locks[key]
+            for key in list(self._generators):
+                if (key[0], key[1]) not in self._base:
+                    del self._generators[key]
+        gc.collect()
+
+    def is_loaded(self, model_name: str = DEFAULT_MODEL, task: str = DEFAULT_TASK) -> bool:
+        return (task, model_name) in self._base
+
+    def metrics(self) -> dict:
+        """Load and usage metrics per model, keyed by "task:model_name"."""
+        report = {}
+        for (task, model_name), stats in self._stats.items():
+            entry = dict(stats)
+            entry["loaded"] = (task, model_name) in self._base
+            calls = entry["generate_calls"]
+            entry["avg_generate_seconds"] = entry["generate_seconds"] / calls if calls else 0.0
+            report[f"{task}:{model_name}"] = entry
+        return report
+
+
+registry = GeneratorRegistry()
+
+
+def get_generator(model_name: str = DEFAULT_MODEL, task: str = DEFAULT_TASK, **generation_kwargs):
+    return registry.get(model_name, task, **generation_kwargs)
+
+
+def warm_up(model_name: str = DEFAULT_MODEL, task: str = DEFAULT_TASK, **generation_kwargs):
+    return registry.warm_up(model_name, task, **generation_kwargs)
+
+
+def unload(model_name: str = None, task: str = None):
+    registry.unload(model_name, task)
+
+
+def load_metrics() -> dict:
+    return registry.metrics()
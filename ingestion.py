@@ -0,0 +1,352 @@
+"""
+Batched chunk -> embedding -> Chroma ingestion.
+
+All chunks of an upload are encoded in one call to the shared embedder (which
+mini-batches internally) and written back with a handful of bulk upserts
+instead of one encode and one Chroma round-trip per chunk.
+
+Chunk ids are derived from a hash of the chunk text, so re-ingesting an edited
+document only embeds the chunks that changed, keeps the vectors of the ones
+that didn't and deletes the ones that disappeared. When an edited document is
+stored under a new name (the knowledge base keys documents by content), pass
+the old name as reuse_from and its vectors are copied for unchanged chunks.
+
+Very large documents can be streamed instead: ingest_stream() takes the text
+section by section (e.g. a few PDF pages at a time) and makes every section
+searchable as soon as it's written, so memory stays bounded by the section
+size rather than the document size.
+
+Run as a script to measure encode throughput for several batch sizes:
+
+    python ingestion.py notes.md manual.txt --batch-sizes 16 32 64 128
+"""
+import argparse
+import hashlib
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+import collection_versions
+import lexical_index
+import settings
+from telemetry import span
+
+# What Chroma's sqlite backend accepts per call when the client can't tell us
+DEFAULT_MAX_UPSERT_BATCH = 5461
+
+
+class IngestReport:
+    """Throughput numbers for one ingestion run."""
+
+    def __init__(self, batch_size: int = 0, write_batch_size: int = 0):
+        self.batch_size = batch_size
+        self.write_batch_size = write_batch_size
+        self.documents = 0
+        # chunks produced by the splitter = reused + added
+        self.chunks = 0
+        self.reused_chunks = 0
+        self.added_chunks = 0
+        self.removed_chunks = 0
+        # tokens of the chunks that were actually embedded
+        self.tokens = 0
+        self.split_seconds = 0.0
+        self.diff_seconds = 0.0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.split_seconds + self.diff_seconds + self.encode_seconds + self.write_seconds
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.total_seconds if self.total_seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.total_seconds if self.total_seconds else 0.0
+
+    @property
+    def encode_chunks_per_second(self) -> float:
+        return self.added_chunks / self.encode_seconds if self.encode_seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "reused_chunks": self.reused_chunks,
+            "added_chunks": self.added_chunks,
+            "removed_chunks": self.removed_chunks,
+            "tokens": self.tokens,
+            "batch_size": self.batch_size,
+            "write_batch_size": self.write_batch_size,
+            "split_seconds": round(self.split_seconds, 4),
+            "diff_seconds": round(self.diff_seconds, 4),
+            "encode_seconds": round(self.encode_seconds, 4),
+            "write_seconds": round(self.write_seconds, 4),
+            "total_seconds": round(self.total_seconds, 4),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+            "tokens_per_second": round(self.tokens_per_second, 2),
+            "encode_chunks_per_second": round(self.encode_chunks_per_second, 2),
+        }
+
+    def __str__(self):
+        return (
+            f"{self.chunks} chunks ({self.added_chunks} embedded, {self.reused_chunks} reused, "
+            f"{self.removed_chunks} removed) / {self.tokens} tokens from {self.documents} documents "
+            f"in {self.total_seconds:.2f}s ({self.chunks_per_second:.1f} chunks/s, "
+            f"{self.tokens_per_second:.0f} tokens/s, batch size {self.batch_size})"
+        )
+
+
+def split_text(text: str):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return splitter.split_text(text)
+
+
+def max_upsert_batch(client) -> int:
+    if settings.UPSERT_BATCH_SIZE > 0:
+        return settings.UPSERT_BATCH_SIZE
+    try:
+        return client.get_max_batch_size()
+    except Exception:
+        return DEFAULT_MAX_UPSERT_BATCH
+
+
+def upsert_batched(collection, ids, embeddings, documents, metadatas, write_batch_size: int):
+    """Write rows to the collection in as few upsert calls as the client allows."""
+    for start in range(0, len(ids), write_batch_size):
+        end = start + write_batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end].tolist(),
+            documents=documents[start:end],
+            metadatas=metadatas[start:end]
+        )
+        lexical_index.added(collection.name, ids[start:end], documents[start:end], metadatas[start:end])
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def chunk_rows(filename: str, chunks, start: int = 0, seen: dict = None):
+    """
+    Ids and metadatas for a document's chunks. The id depends on the chunk's
+    content (and how many identical chunks came before it), not its position,
+    so unchanged chunks keep their id when text is inserted above them.
+    When a document arrives in sections, pass the index of the section's first
+    chunk and the same `seen` dict for every section.
+    """
+    ids, metadatas = [], []
+    seen = {} if seen is None else seen
+    for i, chunk in enumerate(chunks, start=start):
+        digest = chunk_hash(chunk)
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{filename}_chunk_{digest[:16]}_{occurrence}")
+        metadatas.append({
+            "filename": filename,
+            "chunk_index": i,
+            "chunk_size": len(chunk),
+            "chunk_hash": digest
+        })
+    return ids, metadatas
+
+
+def filename_filter(filenames) -> dict:
+    filenames = list(filenames)
+    return {"filename": filenames[0]} if len(filenames) == 1 else {"filename": {"$in": filenames}}
+
+
+def existing_rows(collection, filenames) -> dict:
+    """id -> metadata of the chunks already stored for these documents."""
+    if not filenames:
+        return {}
+    rows = collection.get(where=filename_filter(filenames), include=["metadatas"])
+    return dict(zip(rows["ids"], rows["metadatas"]))
+
+
+def stored_vectors(collection, filenames, hashes) -> dict:
+    """chunk hash -> stored embedding, for the chunks of these documents with these hashes."""
+    filenames, hashes = list(filenames), sorted(set(hashes))
+    if not filenames or not hashes:
+        return {}
+    where = {"$and": [filename_filter(filenames), {"chunk_hash": {"$in": hashes}}]}
+    rows = collection.get(where=where, include=["embeddings", "metadatas"])
+    return {metadata["chunk_hash"]: embedding for metadata, embedding in zip(rows["metadatas"], rows["embeddings"])}
+
+
+def ingest_documents(collection, embedder, docs, batch_size: int = None, write_batch_size: int = DEFAULT_MAX_UPSERT_BATCH,
+                     reuse_from=(), write_lock=None):
+    """
+    Split, embed and store a list of (filename, text) pairs, embedding only
+    chunks that aren't already stored for that document (or for one of the
+    documents in reuse_from). write_lock, if given, is held only while
+    writing to the collection, not while splitting or embedding.
+    Returns an IngestReport with the reuse counts and throughput of the run.
+    """
+    report = IngestReport(batch_size or settings.EMBED_BATCH_SIZE, write_batch_size)
+    # A later copy of the same file replaces an earlier one
+    docs = dict(docs)
+
+    ids, chunks, metadatas = [], [], []
+    filenames = []
+    with span("ingest.split") as timing:
+        for filename, text in docs.items():
+            doc_chunks = split_text(text)
+            doc_ids, doc_metadatas = chunk_rows(filename, doc_chunks)
+            ids.extend(doc_ids)
+            chunks.extend(doc_chunks)
+            metadatas.extend(doc_metadatas)
+            filenames.append(filename)
+            report.documents += 1
+    report.split_seconds = timing.seconds
+
+    with span("ingest.diff") as timing:
+        existing = existing_rows(collection, filenames)
+        removed_ids = list(set(existing) - set(ids))
+    report.diff_seconds = timing.seconds
+
+    store_chunks(collection, embedder, report, ids, chunks, metadatas, existing, removed_ids, reuse_from, write_lock)
+    return report
+
+
+def store_chunks(collection, embedder, report: IngestReport, ids, chunks, metadatas, existing: dict, removed_ids=(),
+                 reuse_from=(), write_lock=None):
+    """
+    Embed and upsert the chunks missing from `existing` (copying the vector of
+    identical chunks of the documents in `reuse_from`), update the position of
+    stored chunks that moved and delete `removed_ids`. Adds to the report.
+    Only the writes happen under write_lock.
+    """
+    with span("ingest.diff") as timing:
+        new_rows = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        # Unchanged chunks that moved only need their position updated
+        moved_rows = [i for i, chunk_id in enumerate(ids)
+                      if chunk_id in existing and (existing[chunk_id] or {}).get("chunk_index") != metadatas[i]["chunk_index"]]
+        reusable = stored_vectors(collection, reuse_from, [metadatas[i]["chunk_hash"] for i in new_rows])
+        copied_rows = [i for i in new_rows if metadatas[i]["chunk_hash"] in reusable]
+        embed_rows = [i for i in new_rows if metadatas[i]["chunk_hash"] not in reusable]
+    report.diff_seconds += timing.seconds
+
+    new_chunks = [chunks[i] for i in embed_rows]
+    with span("ingest.embed") as timing:
+        embeddings = embedder.encode(new_chunks, report.batch_size)
+    report.encode_seconds += timing.seconds
+
+    write_batch_size = report.write_batch_size
+    with span("ingest.write") as timing, write_lock or nullcontext():
+        upsert_batched(
+            collection,
+            [ids[i] for i in embed_rows],
+            embeddings,
+            new_chunks,
+            [metadatas[i] for i in embed_rows],
+            write_batch_size
+        )
+        if copied_rows:
+            upsert_batched(
+                collection,
+                [ids[i] for i in copied_rows],
+                np.asarray([reusable[metadatas[i]["chunk_hash"]] for i in copied_rows], dtype=np.float32),
+                [chunks[i] for i in copied_rows],
+                [metadatas[i] for i in copied_rows],
+                write_batch_size
+            )
+        for offset in range(0, len(moved_rows), write_batch_size):
+            batch = moved_rows[offset:offset + write_batch_size]
+            collection.update(ids=[ids[i] for i in batch], metadatas=[metadatas[i] for i in batch])
+        for offset in range(0, len(removed_ids), write_batch_size):
+            batch = list(removed_ids[offset:offset + write_batch_size])
+            collection.delete(ids=batch)
+            lexical_index.deleted(collection.name, batch)
+        if new_rows or moved_rows or removed_ids:
+            collection_versions.bump(collection.name)
+    report.write_seconds += timing.seconds
+
+    report.chunks += len(chunks)
+    report.added_chunks += len(embed_rows)
+    report.reused_chunks += len(chunks) - len(embed_rows)
+    report.removed_chunks += len(removed_ids)
+    report.tokens += embedder.count_tokens(new_chunks)
+
+
+def ingest_stream(collection, embedder, filename: str, sections, batch_size: int = None,
+                  write_batch_size: int = DEFAULT_MAX_UPSERT_BATCH, reuse_from=(), write_lock=None):
+    """
+    Ingest one document that arrives as an iterable of (label, text) sections,
+    e.g. page ranges of a large PDF. Each section is split, embedded and
+    written before the next one is read, so it's searchable right away and
+    only one section is held in memory. Chunks don't span sections. Reading a
+    section (e.g. converting its pages) happens outside write_lock.
+
+    A generator: yields (label, report) after every section, then removes the
+    chunks of an earlier version of the document that didn't come back.
+    The report is updated in place and is final once the generator is done.
+    """
+    report = IngestReport(batch_size or settings.EMBED_BATCH_SIZE, write_batch_size)
+    report.documents = 1
+    seen, kept_ids = {}, set()
+    for label, text in sections:
+        with span("ingest.split") as timing:
+            chunks = split_text(text)
+            ids, metadatas = chunk_rows(filename, chunks, start=report.chunks, seen=seen)
+        report.split_seconds += timing.seconds
+
+        with span("ingest.diff") as timing:
+            stored = collection.get(ids=ids, include=["metadatas"]) if ids else {"ids": [], "metadatas": []}
+            existing = dict(zip(stored["ids"], stored["metadatas"]))
+        report.diff_seconds += timing.seconds
+
+        store_chunks(collection, embedder, report, ids, chunks, metadatas, existing, reuse_from=reuse_from,
+                     write_lock=write_lock)
+        kept_ids.update(ids)
+        yield label, report
+
+    with span("ingest.diff") as timing:
+        removed_ids = [chunk_id for chunk_id in existing_rows(collection, [filename]) if chunk_id not in kept_ids]
+    report.diff_seconds += timing.seconds
+    store_chunks(collection, embedder, report, [], [], [], {}, removed_ids, write_lock=write_lock)
+
+
+def main():
+    from embeddings import get_embedder
+
+    parser = argparse.ArgumentParser(description="Measure embedding throughput for several batch sizes.")
+    parser.add_argument("files", nargs="+", help="Markdown or text files to split and embed")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[16, 32, 64, 128])
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    embedder = get_embedder(args.model)
+    chunks = []
+    for name in args.files:
+        chunks.extend(split_text(Path(name).read_text(encoding="utf-8", errors="replace")))
+    tokens = embedder.count_tokens(chunks)
+
+    # One throwaway pass so model warm-up doesn't skew the first batch size
+    embedder.encode(chunks[:8])
+
+    for batch_size in args.batch_sizes:
+        report = IngestReport(batch_size)
+        report.documents = len(args.files)
+        report.chunks = len(chunks)
+        report.added_chunks = len(chunks)
+        report.tokens = tokens
+        start = time.perf_counter()
+        embedder.encode(chunks, batch_size)
+        report.encode_seconds = time.perf_counter() - start
+        print(json.dumps(report.as_dict()))
+
+
+if __name__ == "__main__":
+    main()
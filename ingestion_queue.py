@@ -0,0 +1,290 @@
+"""
+Background ingestion queue.
+
+Uploads are handed to worker threads instead of being converted and embedded
+inside the Streamlit script run, so the session stays responsive and long
+uploads can't hit the request timeout. submit() returns a job id right away;
+each file is converted and indexed on its own, so it becomes searchable as
+soon as it's done, and job() reports per-file progress. Jobs live in the
+process, not the session, so they keep running while the user switches tabs
+(or reruns the page).
+
+Large PDFs (settings.STREAM_MIN_PAGES and up) are streamed a few pages at a
+time through conversion.iter_pdf_pages() and ingestion.ingest_stream(): the
+first pages are searchable while the rest is still converting.
+
+Files are added to a namespace of the shared knowledge base. A file whose
+bytes are already indexed (by anyone) is attached right away without being
+converted or embedded again. Converted text goes to the document store; a
+finished file only carries the store's handle, never the text itself.
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import ann_index
+import collection_versions
+import document_store
+import settings
+import telemetry
+from conversion import convert_to_markdown, iter_pdf_pages, pdf_page_count
+from embeddings import get_embedder
+from ingestion import IngestReport, ingest_documents, ingest_stream, max_upsert_batch
+from knowledge_base import document_key, get_knowledge_base
+from vectorstore import get_client, get_or_create_collection
+
+QUEUED, CONVERTING, INDEXING, DONE, FAILED = "queued", "converting", "indexing", "done", "failed"
+
+
+class FileJob:
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.data = data
+        self.status = QUEUED
+        self.error = None
+        self.key = None
+        # Knowledge base handle, set once the file is indexed
+        self.document = None
+        self.streamed = False
+        self.shared = False
+        self.pages_done = 0
+        self.pages_total = 0
+        self.report = None
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "error": self.error,
+            "streamed": self.streamed,
+            "shared": self.shared,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "seconds": round(self.seconds, 2),
+            "report": self.report,
+            "document": self.document,
+        }
+
+
+class Job:
+    def __init__(self, files, collection_name: str, namespace: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.collection_name = collection_name
+        self.namespace = namespace
+        self.files = [FileJob(filename, data) for filename, data in files]
+        self.created_at = time.time()
+
+    @property
+    def finished(self) -> bool:
+        return all(f.status in (DONE, FAILED) for f in self.files)
+
+    def progress(self) -> float:
+        return sum(f.status in (DONE, FAILED) for f in self.files) / len(self.files) if self.files else 1.0
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "collection": self.collection_name,
+            "namespace": self.namespace,
+            "created_at": self.created_at,
+            "finished": self.finished,
+            "progress": self.progress(),
+            "files": [f.as_dict() for f in self.files],
+        }
+
+
+class IngestionQueue:
+    def __init__(self, workers: int, keep_jobs: int = 100):
+        self.workers = max(1, workers)
+        self.keep_jobs = keep_jobs
+        self._tasks = queue.Queue()
+        self._jobs = OrderedDict()   # job id -> Job, oldest first
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name="padelmate-ingest", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, files, collection_name: str = "documents", namespace: str = None) -> str:
+        """Queue (filename, bytes) pairs for a namespace of the knowledge base; returns the job id."""
+        job = Job(files, collection_name, namespace or settings.DEFAULT_NAMESPACE)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs
+            for job_id in [i for i, j in self._jobs.items() if j.finished][:max(0, len(self._jobs) - self.keep_jobs)]:
+                del self._jobs[job_id]
+        for file_job in job.files:
+            self._tasks.put((job, file_job))
+        self._start()
+        return job.id
+
+    def job(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> int:
+        return self._tasks.qsize()
+
+    def _run(self):
+        while True:
+            job, file_job = self._tasks.get()
+            try:
+                self._process(job, file_job)
+            finally:
+                self._tasks.task_done()
+
+    def _process(self, job: Job, file_job: FileJob):
+        start = time.perf_counter()
+        temp_file_path = None
+        try:
+            with telemetry.trace("upload", job=job.id, filename=file_job.filename):
+                base = get_knowledge_base(job.collection_name)
+                file_job.key = document_key(file_job.data)
+                report = self._share(job, file_job, base) if base.has(file_job.key) else None
+                if report is None:
+                    temp_file_path = write_temp_file(file_job.filename, file_job.data)
+                    file_job.data = None
+                    if should_stream(temp_file_path):
+                        report = self._stream(job, file_job, base, temp_file_path)
+                    else:
+                        report = self._ingest(job, file_job, base, temp_file_path)
+                file_job.report = report.as_dict()
+                file_job.status = DONE
+        except Exception as e:
+            file_job.status = FAILED
+            file_job.error = f"{type(e).__name__}: {e}"
+        finally:
+            file_job.data = None
+            if temp_file_path:
+                os.unlink(temp_file_path)
+            file_job.seconds = time.perf_counter() - start
+        if self._tasks.empty():
+            # Persist local ANN indexes once the queue drains (no-op with the Chroma backend)
+            ann_index.save_all()
+
+    def _share(self, job: Job, file_job: FileJob, base):
+        """
+        Attach a document that's already indexed; nothing is converted or
+        embedded. None if its last copy was deleted in the meantime.
+        """
+        with base.lock:
+            if not base.has(file_job.key):
+                return None
+            file_job.document = base.attach(job.namespace, file_job.filename, file_job.key)
+        file_job.shared = True
+        report = IngestReport()
+        report.documents = 1
+        report.chunks = report.reused_chunks = file_job.document["chunks"]
+        return report
+
+    def _ingest(self, job: Job, file_job: FileJob, base, path: str):
+        file_job.status = CONVERTING
+        with telemetry.span("upload.convert"):
+            text = convert_to_markdown(path)
+        file_job.status = INDEXING
+        client = get_client()
+        # Until the document is attached nothing refers to its chunks: the pin keeps
+        # a delete meanwhile off them, and releasing it after a failure hands the
+        # chunks written so far (and the stored text) to the deleter
+        base.pin(file_job.key)
+        try:
+            with telemetry.span("upload.index"):
+                collection = get_or_create_collection(client, job.collection_name)
+                # Chunks are stored under the document key, so copies in other namespaces share
+                # them. The write lock is only held for the upserts, not for embedding.
+                report = ingest_documents(collection, get_embedder(), [(file_job.key, text)],
+                                          write_batch_size=max_upsert_batch(client),
+                                          reuse_from=previous_version(job, file_job, base), write_lock=base.lock)
+                with base.lock:
+                    document_store.store.put(job.collection_name, file_job.key, text, chunks=report.chunks)
+                    file_job.document = base.attach(job.namespace, file_job.filename, file_job.key)
+        finally:
+            base.unpin(file_job.key)
+        return report
+
+    def _stream(self, job: Job, file_job: FileJob, base, path: str):
+        file_job.streamed = True
+        file_job.pages_total = pdf_page_count(path)
+        file_job.status = INDEXING
+        client = get_client()
+        collection = get_or_create_collection(client, job.collection_name)
+        # The first section replaces an earlier file of this name in the namespace;
+        # keep that version's chunks (and this one's) until the stream is done, so a
+        # failure can put it back and a delete meanwhile can't pull chunks from under us
+        previous = base.entry(job.namespace, file_job.filename)
+        pinned = {file_job.key} | ({previous["key"]} if previous else set())
+        for key in pinned:
+            base.pin(key)
+        try:
+            return self._stream_sections(job, file_job, base, path, client, collection, previous)
+        finally:
+            for key in pinned:
+                base.unpin(key)
+
+    def _stream_sections(self, job: Job, file_job: FileJob, base, path: str, client, collection, previous):
+        report = None
+        with document_store.store.writer(job.collection_name, file_job.key,
+                                         pages=file_job.pages_total) as writer:
+
+            def sections():
+                for pages, markdown in iter_pdf_pages(path):
+                    writer.write(markdown)
+                    yield pages, markdown
+
+            # Pages are converted and embedded outside the write lock, which is only
+            # held for each section's writes
+            stream = ingest_stream(collection, get_embedder(), file_job.key, sections(),
+                                   write_batch_size=max_upsert_batch(client),
+                                   reuse_from=previous_version(job, file_job, base), write_lock=base.lock)
+            try:
+                with telemetry.span("upload.stream"):
+                    for (_, file_job.pages_done), report in stream:
+                        if file_job.document is None:
+                            # The namespace can search the first pages from now on
+                            file_job.document = base.attach(job.namespace, file_job.filename, file_job.key)
+                        else:
+                            collection_versions.bump(base.scope(job.namespace))
+            except Exception:
+                # Don't leave a half-indexed document behind; a replaced version comes back
+                if file_job.document is not None:
+                    base.restore(job.namespace, file_job.filename, file_job.key, previous)
+                    file_job.document = None
+                raise
+        document_store.store.update(writer.handle, chunks=report.chunks)
+        file_job.document = base.document(job.namespace, file_job.filename)
+        return report
+
+
+def previous_version(job: Job, file_job: FileJob, base) -> list:
+    """
+    The document this upload replaces in its namespace, whose vectors can be
+    reused for unchanged chunks (an edited file gets a new key).
+    """
+    previous = base.key_of(job.namespace, file_job.filename)
+    return [previous] if previous and previous != file_job.key else []
+
+
+def write_temp_file(filename: str, data: bytes) -> str:
+    """A temporary copy of an upload with the same extension, for Docling."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=Path(filename).suffix) as temp_file:
+        temp_file.write(data)
+        return temp_file.name
+
+
+def should_stream(path: str) -> bool:
+    return (settings.STREAM_MIN_PAGES > 0 and Path(path).suffix.lower() == ".pdf"
+            and pdf_page_count(path) >= settings.STREAM_MIN_PAGES)
+
+
+jobs = IngestionQueue(settings.INGEST_WORKERS)
@@ -0,0 +1,287 @@
+"""
+Shared, namespaced knowledge base.
+
+Every session and user works against one process-wide collection; a namespace
+(a user or a team) is just the set of documents it has added, so memory grows
+with the corpus, not with corpus x sessions. Documents are keyed by a hash of
+the uploaded bytes: a file that's already in the collection, whoever added it,
+is shared instead of being converted and embedded again. Each namespace entry
+holds a reference, and a document's chunks (and stored text) are deleted when
+the last reference goes.
+
+Writes to the collection go through `lock`, so uploads and deletes can't
+interleave; uploads only hold it while writing a batch, never while converting
+or embedding. Removing a document from a namespace only updates the registry
+and returns right away: deleting chunks nothing refers to any more is queued
+to a background thread, which checks the document wasn't attached again in
+the meantime. Reads don't take the lock: questions are answered from the
+chunks of the namespace's documents via a `where` filter built from the
+registry.
+
+The registry (namespace -> filename -> document key) is a JSON file next to
+the document store; with an in-memory vector store it's kept in memory too.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import collection_versions
+import document_store
+import settings
+from vectorstore import delete_document, get_client, get_or_create_collection
+
+logger = logging.getLogger("padelmate.knowledge_base")
+
+
+def document_key(data: bytes) -> str:
+    return "doc_" + hashlib.sha256(data).hexdigest()[:24]
+
+
+class KnowledgeBase:
+    def __init__(self, collection_name: str, directory: str):
+        self.collection_name = collection_name
+        self.registry_path = Path(directory) / f"{collection_name}.namespaces.json"
+        # Held for every write to the collection; reentrant so callers can
+        # check has() and attach under one acquisition
+        self.lock = threading.RLock()
+        # Guards the registry only, for short reads and updates
+        self._registry_lock = threading.Lock()
+        self._entries = self._load()   # namespace -> {filename: {"key", "added_at"}}
+        self._refs = Counter(entry["key"] for files in self._entries.values() for entry in files.values())
+        # Running uploads holding on to a document; not namespace references
+        self._pins = Counter()
+        self._deletes = queue.Queue()
+        self._deleter = None
+
+    def _load(self) -> dict:
+        if settings.VECTOR_STORE != "persistent":
+            # Chunks don't outlive the process, so neither do the namespaces
+            return {}
+        try:
+            return json.loads(self.registry_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def _save(self):
+        if settings.VECTOR_STORE != "persistent":
+            return
+        self.registry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.registry_path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.registry_path)
+
+    def collection(self):
+        return get_or_create_collection(get_client(), self.collection_name)
+
+    def scope(self, namespace: str) -> str:
+        """Cache scope of a namespace; its version changes whenever its documents do."""
+        return f"{self.collection_name}@{namespace}"
+
+    def has(self, key: str) -> bool:
+        """
+        Whether the document is fully indexed (possibly for another namespace).
+        A stored copy whose chunks are no longer in the collection (the vector
+        store was lost or lives in memory) doesn't count, and is dropped so the
+        document gets indexed again.
+        """
+        if document_store.store.get(self.collection_name, key) is None:
+            return False
+        if self._indexed(key):
+            return True
+        with self.lock:
+            if not self._indexed(key):
+                document_store.store.delete(self.collection_name, key)
+                return False
+        return True
+
+    def _indexed(self, key: str) -> bool:
+        return bool(self.collection().get(where={"filename": key}, limit=1, include=[])["ids"])
+
+    def attach(self, namespace: str, filename: str, key: str) -> dict:
+        """Add an indexed document to a namespace, replacing an earlier file of that name."""
+        with self._registry_lock:
+            files = self._entries.setdefault(namespace, {})
+            previous = files.get(filename)
+            files[filename] = {"key": key, "added_at": time.time()}
+            self._refs[key] += 1
+            unused = self._release(previous["key"]) if previous else None
+            self._save()
+        collection_versions.bump(self.scope(namespace))
+        self._schedule_delete(unused)
+        return self.document(namespace, filename)
+
+    def detach(self, namespace: str, filename: str):
+        """Remove a file from a namespace; doesn't wait for uploads holding the write lock."""
+        with self._registry_lock:
+            entry = self._entries.get(namespace, {}).pop(filename, None)
+            if entry is None:
+                return
+            unused = self._release(entry["key"])
+            self._save()
+        collection_versions.bump(self.scope(namespace))
+        self._schedule_delete(unused)
+
+    def restore(self, namespace: str, filename: str, key: str, previous: dict = None):
+        """
+        Undo attach(namespace, filename, key): put back the entry it replaced,
+        or drop the file if there was none. Does nothing if the file has been
+        replaced or removed since.
+        """
+        with self._registry_lock:
+            files = self._entries.get(namespace, {})
+            current = files.get(filename)
+            if current is None or current["key"] != key:
+                return
+            if previous:
+                files[filename] = dict(previous)
+                self._refs[previous["key"]] += 1
+            else:
+                del files[filename]
+            unused = self._release(key)
+            self._save()
+        collection_versions.bump(self.scope(namespace))
+        self._schedule_delete(unused)
+
+    def pin(self, key: str):
+        """Keep a document's chunks while a running upload needs them, referenced or not."""
+        with self._registry_lock:
+            self._pins[key] += 1
+
+    def unpin(self, key: str):
+        with self._registry_lock:
+            unused = self._release(key, self._pins)
+        self._schedule_delete(unused)
+
+    def _release(self, key: str, counts: Counter = None):
+        """Drop a reference (or pin); returns the key if nothing holds on to it any more."""
+        counts = self._refs if counts is None else counts
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+        return None if self._in_use(key) else key
+
+    def _in_use(self, key: str) -> bool:
+        return self._refs[key] > 0 or self._pins[key] > 0
+
+    def _schedule_delete(self, key: str):
+        if key is None:
+            return
+        self._deletes.put(key)
+        with self._registry_lock:
+            if self._deleter is None or not self._deleter.is_alive():
+                self._deleter = threading.Thread(target=self._run_deletes, name="padelmate-kb-delete", daemon=True)
+                self._deleter.start()
+
+    def _run_deletes(self):
+        while True:
+            key = self._deletes.get()
+            try:
+                with self.lock:
+                    with self._registry_lock:
+                        # Attached again since it was released
+                        in_use = self._in_use(key)
+                    if not in_use:
+                        delete_document(self.collection(), key)
+                        document_store.store.delete(self.collection_name, key)
+            except Exception:
+                logger.exception("Deleting document %s failed", key)
+            finally:
+                self._deletes.task_done()
+
+    def flush(self):
+        """Wait until queued deletes are done."""
+        self._deletes.join()
+
+    def entry(self, namespace: str, filename: str):
+        """Registry entry ({"key", "added_at"}) of a namespace's file, if any."""
+        with self._registry_lock:
+            entry = self._entries.get(namespace, {}).get(filename)
+        return dict(entry) if entry else None
+
+    def key_of(self, namespace: str, filename: str):
+        """Key of the document a namespace has under this filename, if any."""
+        entry = self.entry(namespace, filename)
+        return entry["key"] if entry else None
+
+    def keys(self, namespace: str) -> list:
+        with self._registry_lock:
+            return sorted({entry["key"] for entry in self._entries.get(namespace, {}).values()})
+
+    def where(self, namespace: str) -> dict:
+        """Chroma filter for the chunks of a namespace's documents."""
+        keys = self.keys(namespace)
+        return {"filename": keys[0]} if len(keys) == 1 else {"filename": {"$in": keys}}
+
+    def source_name(self, namespace: str, key: str) -> str:
+        """
+        The filename a namespace knows a document by; without a namespace, the
+        name it was first uploaded under. The key itself if it isn't registered.
+        """
+        with self._registry_lock:
+            if namespace is None:
+                files = [item for entries in self._entries.values() for item in entries.items()]
+            else:
+                files = list(self._entries.get(namespace, {}).items())
+        names = sorted((entry["added_at"], filename) for filename, entry in files if entry["key"] == key)
+        return names[0][1] if names else key
+
+    def document(self, namespace: str, filename: str):
+        """Document store handle of a namespace's file, with its filename and share count."""
+        with self._registry_lock:
+            entry = self._entries.get(namespace, {}).get(filename)
+            shared_with = self._refs[entry["key"]] - 1 if entry else 0
+        if entry is None:
+            return None
+        record = document_store.store.get(self.collection_name, entry["key"]) or {
+            "collection": self.collection_name, "key": entry["key"], "words": 0, "chars": 0, "bytes": 0, "chunks": 0,
+        }
+        return {**record, "filename": filename, "namespace": namespace,
+                "added_at": entry["added_at"], "shared_with": shared_with}
+
+    def documents(self, namespace: str) -> list:
+        with self._registry_lock:
+            files = sorted(self._entries.get(namespace, {}).items(), key=lambda item: item[1]["added_at"])
+        documents = [self.document(namespace, filename) for filename, _ in files]
+        # Skip files removed in the meantime
+        return [doc for doc in documents if doc is not None]
+
+    def count(self, namespace: str) -> int:
+        with self._registry_lock:
+            return len(self._entries.get(namespace, {}))
+
+    def namespaces(self) -> list:
+        with self._registry_lock:
+            return sorted(namespace for namespace, files in self._entries.items() if files)
+
+    def stats(self) -> dict:
+        with self._registry_lock:
+            entries = sum(len(files) for files in self._entries.values())
+            namespaces = sum(1 for files in self._entries.values() if files)
+            documents = len(self._refs)
+            shared = sum(1 for refs in self._refs.values() if refs > 1)
+        return {
+            "namespaces": namespaces,
+            "entries": entries,
+            "documents": documents,
+            "shared_documents": shared,
+            # Copies that didn't have to be converted, embedded or stored again
+            "deduplicated": entries - documents,
+        }
+
+
+_bases = {}
+_bases_lock = threading.Lock()
+
+
+def get_knowledge_base(collection_name: str = "documents") -> KnowledgeBase:
+    with _bases_lock:
+        base = _bases.get(collection_name)
+        if base is None:
+            base = _bases[collection_name] = KnowledgeBase(collection_name, settings.DOCUMENT_STORE_DIR)
+        return base
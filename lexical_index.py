@@ -0,0 +1,219 @@
+"""
+In-process BM25 index over the chunks of a collection, for hybrid retrieval.
+
+MiniLM embeddings are weak on rare names and numbers ("Galán", "Lebrón",
+"88 cm"), which a lexical match gets right. Each collection gets a compact
+inverted index (term -> {chunk number: term frequency}), read from the
+collection once per process on first use and kept up to date by the writers:
+upserts and deletes pass their rows straight to added()/deleted(), so a write
+costs only the chunks it touches and never a rescan of the collection.
+
+hybrid() fuses the vector hits with the BM25 hits using weighted reciprocal
+rank fusion, so the first stage finds the right chunk more often and n_results
+(and with it the prompt) can stay small.
+"""
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+import settings
+
+K1 = 1.5
+B = 0.75
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with "
+    "what who how when where why do does did can i you".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lowercased word tokens with accents folded, so "Galán" matches "galan"."""
+    folded = "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+    return [token for token in _TOKEN.findall(folded) if token not in _STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self):
+        self._numbers = {}     # chunk id -> chunk number
+        self._chunks = {}      # chunk number -> (chunk id, filename, length, terms)
+        self._files = {}       # filename -> {chunk id}
+        self._postings = {}    # term -> {chunk number: term frequency}
+        self._next = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def add(self, ids, documents, metadatas):
+        with self._lock:
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                if chunk_id in self._numbers:
+                    self._remove([chunk_id])
+                tokens = tokenize(document or "")
+                frequencies = Counter(tokens)
+                filename = (metadata or {}).get("filename")
+                number = self._next
+                self._next += 1
+                self._numbers[chunk_id] = number
+                self._chunks[number] = (chunk_id, filename, len(tokens), tuple(frequencies))
+                self._files.setdefault(filename, set()).add(chunk_id)
+                self._total_length += len(tokens)
+                for term, frequency in frequencies.items():
+                    self._postings.setdefault(term, {})[number] = frequency
+
+    def delete(self, ids):
+        with self._lock:
+            self._remove([chunk_id for chunk_id in ids if chunk_id in self._numbers])
+
+    def delete_file(self, filename: str):
+        with self._lock:
+            self._remove(list(self._files.get(filename, ())))
+
+    def _remove(self, ids):
+        for chunk_id in ids:
+            number = self._numbers.pop(chunk_id)
+            _, filename, length, terms = self._chunks.pop(number)
+            self._total_length -= length
+            chunk_ids = self._files[filename]
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._files[filename]
+            for term in terms:
+                postings = self._postings[term]
+                del postings[number]
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int, filenames=None) -> list:
+        """[(chunk id, score)] of the k best BM25 matches, optionally only from these filenames."""
+        with self._lock:
+            count = len(self._chunks)
+            if not count:
+                return []
+            average_length = self._total_length / count or 1.0
+            allowed = set(filenames) if filenames is not None else None
+            scores = {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for number, frequency in postings.items():
+                    _, filename, length, _ = self._chunks[number]
+                    if allowed is not None and filename not in allowed:
+                        continue
+                    norm = frequency + K1 * (1 - B + B * length / average_length)
+                    scores[number] = scores.get(number, 0.0) + idf * frequency * (K1 + 1) / norm
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._chunks[number][0], score) for number, score in best]
+
+    def load(self, collection, page_size: int = 5000):
+        """Index every chunk stored in the collection."""
+        offset = 0
+        while True:
+            rows = collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+            if not rows["ids"]:
+                break
+            self.add(rows["ids"], rows["documents"], rows["metadatas"])
+            offset += len(rows["ids"])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(collection) -> BM25Index:
+    """The process-wide BM25 index of a collection, read from it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(collection.name)
+        if index is None:
+            # Writes wait for the load, so none of them is missed
+            index = BM25Index()
+            index.load(collection)
+            _indexes[collection.name] = index
+    return index
+
+
+# Called by everything that writes to a collection. Collections whose index
+# hasn't been loaded yet are skipped: the load will read the stored chunks.
+
+def added(collection_name: str, ids, documents, metadatas):
+    with _indexes_lock:
+        index = _indexes.get(collection_name)
+        if index is not None:
+            index.add(ids, documents, metadatas)
+
+
+def deleted(collection_name: str, ids):
+    with _indexes_lock:
+        index = _indexes.get(collection_name)
+        if index is not None:
+            index.delete(ids)
+
+
+def deleted_file(collection_name: str, filename: str):
+    with _indexes_lock:
+        index = _indexes.get(collection_name)
+        if index is not None:
+            index.delete_file(filename)
+
+
+def forget(collection_name: str):
+    """Drop the index of a collection that was deleted or re-created."""
+    with _indexes_lock:
+        _indexes.pop(collection_name, None)
+
+
+def reciprocal_rank_fusion(vector_ids, lexical_ids, weight: float = None, k: int = None) -> list:
+    """
+    Ids ordered by weighted RRF: (1 - weight) / (k + vector rank) +
+    weight / (k + lexical rank). weight=0 is pure vector, 1 pure BM25.
+    """
+    weight = settings.HYBRID_WEIGHT if weight is None else weight
+    k = k or settings.RRF_K
+    scores = {}
+    for rank, chunk_id in enumerate(vector_ids, start=1):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + (1 - weight) / (k + rank)
+    for rank, chunk_id in enumerate(lexical_ids, start=1):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=lambda chunk_id: scores[chunk_id], reverse=True)
+
+
+def distance(a, b, metric: str) -> float:
+    if metric == "l2":
+        return sum((x - y) ** 2 for x, y in zip(a, b))
+    dot = sum(x * y for x, y in zip(a, b))
+    if metric == "cosine":
+        norms = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return 1.0 - dot / norms if norms else 1.0
+    return 1.0 - dot
+
+
+def hybrid(collection, question: str, query_embedding, vector: dict, n_results: int, filenames=None) -> dict:
+    """
+    Fuse vector hits ({"ids", "documents", "distances"}) with BM25 hits into
+    the n_results best chunks. Chunks only found lexically get their real
+    vector distance, so the relevance cut-off still applies to them.
+    """
+    lexical = get_index(collection).search(question, settings.HYBRID_CANDIDATES, filenames)
+    fused = reciprocal_rank_fusion(vector["ids"], [chunk_id for chunk_id, _ in lexical])[:n_results]
+
+    known = {chunk_id: (document, dist) for chunk_id, document, dist
+             in zip(vector["ids"], vector["documents"], vector["distances"])}
+    missing = [chunk_id for chunk_id in fused if chunk_id not in known]
+    if missing:
+        metric = (collection.metadata or {}).get("hnsw:space", "l2")
+        rows = collection.get(ids=missing, include=["documents", "embeddings"])
+        for chunk_id, document, embedding in zip(rows["ids"], rows["documents"], rows["embeddings"]):
+            known[chunk_id] = (document, distance(query_embedding, embedding, metric))
+    fused = [chunk_id for chunk_id in fused if chunk_id in known]
+    return {
+        "ids": fused,
+        "documents": [known[chunk_id][0] for chunk_id in fused],
+        "distances": [known[chunk_id][1] for chunk_id in fused],
+    }
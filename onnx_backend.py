@@ -0,0 +1,249 @@
+"""
+Optional ONNX Runtime inference backend (settings.INFERENCE_BACKEND="onnx").
+
+The generation model (flan-t5) and the embedding model (MiniLM) are exported
+to ONNX once, quantized to int8 with dynamic quantization (int8 weights,
+activations quantized on the fly, no calibration data) and cached under
+settings.ONNX_DIR, so later processes load the quantized files directly.
+
+Every export is checked against the PyTorch model before it's used: embeddings
+must keep a cosine similarity of at least ONNX_PARITY_MIN_COSINE, and greedy
+answers to a few padel prompts must mostly match (ONNX_PARITY_MIN_MATCH). The
+result is saved next to the export as parity.json; an export that fails it is
+not used and the model stays on PyTorch.
+
+Needs optimum with ONNX Runtime (pip install "optimum[onnxruntime]") and
+sentence-transformers 3.2 or newer.
+
+    python onnx_backend.py            # export, quantize and check both models
+"""
+import argparse
+import json
+import logging
+import platform
+import shutil
+import time
+from pathlib import Path
+
+import settings
+
+QUANTIZATIONS = ("auto", "avx2", "avx512", "avx512_vnni", "arm64")
+
+PARITY_TEXTS = [
+    "Padel is a racket sport played in doubles on an enclosed court.",
+    "The ball may be played off the glass walls after it bounces.",
+    "Who is Arturo Coello?",
+    "How high is the net in padel?",
+    "Galán and Lebrón won the final in straight sets.",
+    "A padel court measures 20 by 10 metres.",
+]
+
+PARITY_PROMPTS = [
+    "Context information:\nDocument 1: The net is 88 cm high at the centre and 92 cm at the posts.\n\n"
+    "Question: How high is the net in padel?\n\nAnswer:",
+    "Context information:\nDocument 1: Padel was invented in Acapulco, Mexico, in 1969 by Enrique Corcuera.\n\n"
+    "Question: Where did padel originate?\n\nAnswer:",
+    "Context information:\nDocument 1: The serve must be hit underhand after one bounce, diagonally into the "
+    "opponent's service box.\n\nQuestion: How do you serve in padel?\n\nAnswer:",
+    "Context information:\nDocument 1: Round rackets give the most control, diamond-shaped rackets the most "
+    "power.\n\nQuestion: Which racket shape gives the most power?\n\nAnswer:",
+]
+
+logger = logging.getLogger("padelmate.onnx")
+
+
+def quantization_target(name: str = None) -> str:
+    """The instruction set to quantize for; "auto" picks the best one this CPU has."""
+    name = name or settings.ONNX_QUANTIZATION
+    if name not in QUANTIZATIONS:
+        raise ValueError(f"Unknown ONNX quantization {name!r}; use one of {', '.join(QUANTIZATIONS)}")
+    if name != "auto":
+        return name
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        flags = Path("/proc/cpuinfo").read_text().split()
+    except OSError:
+        flags = []
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
+
+
+def quantization_config(target: str):
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if target == "arm64":
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    return getattr(AutoQuantizationConfig, target)(is_static=False, per_channel=False)
+
+
+def export_dir(model_name: str, kind: str) -> Path:
+    return Path(settings.ONNX_DIR) / f"{model_name.replace('/', '--')}-{kind}-int8"
+
+
+def read_parity(path: Path):
+    try:
+        return json.loads((path / "parity.json").read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+
+
+def _write_parity(path: Path, parity: dict) -> dict:
+    (path / "parity.json").write_text(json.dumps(parity, indent=2), encoding="utf-8")
+    if not parity["passed"]:
+        logger.warning("ONNX export of %s failed the parity check (%s); staying on PyTorch", parity["model"], parity)
+    return parity
+
+
+# Generation (flan-t5)
+
+def _seq2seq_files(path: Path) -> dict:
+    names = {}
+    for part in ("encoder", "decoder", "decoder_with_past"):
+        file_name = f"{part}_model_quantized.onnx"
+        if (path / file_name).exists():
+            names[f"{part}_file_name"] = file_name
+    return names
+
+
+def _load_seq2seq(path: Path):
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    model = ORTModelForSeq2SeqLM.from_pretrained(path, **_seq2seq_files(path))
+    return model, AutoTokenizer.from_pretrained(path)
+
+
+def export_seq2seq(model_name: str) -> dict:
+    """Export and quantize a seq2seq model (once) and check it; returns the parity report."""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from transformers import AutoTokenizer
+
+    path = export_dir(model_name, "seq2seq")
+    parity = read_parity(path)
+    if parity is not None:
+        return parity
+    target = quantization_target()
+    fp32 = path.with_name(path.name + ".fp32")
+    shutil.rmtree(fp32, ignore_errors=True)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True)
+    model.save_pretrained(fp32)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    for onnx_file in sorted(fp32.glob("*.onnx")):
+        quantizer = ORTQuantizer.from_pretrained(fp32, file_name=onnx_file.name)
+        quantizer.quantize(save_dir=path, quantization_config=quantization_config(target))
+    model.config.save_pretrained(path)
+    model.generation_config.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    shutil.rmtree(fp32, ignore_errors=True)
+
+    onnx_model, onnx_tokenizer = _load_seq2seq(path)
+    return _write_parity(path, {"model": model_name, "quantization": target,
+                                **generation_parity(model_name, onnx_model, onnx_tokenizer)})
+
+
+def generation_parity(model_name: str, onnx_model, onnx_tokenizer) -> dict:
+    """Greedy answers of the PyTorch and ONNX models to PARITY_PROMPTS, compared."""
+    from transformers import pipeline
+
+    runs = {}
+    for backend, pipe in (("torch", pipeline("text2text-generation", model=model_name)),
+                          ("onnx", pipeline("text2text-generation", model=onnx_model, tokenizer=onnx_tokenizer))):
+        start = time.perf_counter()
+        answers = [pipe(prompt, max_length=32)[0]["generated_text"].strip() for prompt in PARITY_PROMPTS]
+        runs[backend] = (answers, time.perf_counter() - start)
+    matches = sum(a == b for a, b in zip(runs["torch"][0], runs["onnx"][0])) / len(PARITY_PROMPTS)
+    return {
+        "answer_match": round(matches, 4),
+        "torch_seconds": round(runs["torch"][1], 3),
+        "onnx_seconds": round(runs["onnx"][1], 3),
+        "mismatches": [{"torch": a, "onnx": b} for a, b in zip(runs["torch"][0], runs["onnx"][0]) if a != b],
+        "passed": matches >= settings.ONNX_PARITY_MIN_MATCH,
+    }
+
+
+def load_seq2seq(model_name: str):
+    """(model, tokenizer) of the quantized export, or None if it didn't pass the parity check."""
+    parity = export_seq2seq(model_name)
+    if not parity["passed"]:
+        return None
+    return _load_seq2seq(export_dir(model_name, "seq2seq"))
+
+
+# Embeddings (sentence-transformers)
+
+QUANTIZED_EMBEDDING_FILE = "onnx/model_qint8.onnx"
+
+
+def _load_embedding(path: Path):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(str(path), backend="onnx", device="cpu",
+                               model_kwargs={"file_name": QUANTIZED_EMBEDDING_FILE})
+
+
+def export_embedding(model_name: str) -> dict:
+    """Export and quantize a SentenceTransformer model (once) and check it; returns the parity report."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    path = export_dir(model_name, "embedding")
+    parity = read_parity(path)
+    if parity is not None:
+        return parity
+    target = quantization_target()
+    model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+    model.save(str(path))
+    export_dynamic_quantized_onnx_model(model, quantization_config(target), str(path), file_suffix="qint8")
+    return _write_parity(path, {"model": model_name, "quantization": target,
+                                **embedding_parity(model_name, _load_embedding(path))})
+
+
+def embedding_parity(model_name: str, onnx_model) -> dict:
+    """Cosine similarity between the PyTorch and ONNX embeddings of PARITY_TEXTS."""
+    from sentence_transformers import SentenceTransformer
+
+    runs = {}
+    for backend, model in (("torch", SentenceTransformer(model_name, device="cpu")), ("onnx", onnx_model)):
+        start = time.perf_counter()
+        runs[backend] = (model.encode(PARITY_TEXTS, normalize_embeddings=True, show_progress_bar=False),
+                         time.perf_counter() - start)
+    cosines = (runs["torch"][0] * runs["onnx"][0]).sum(axis=1)
+    return {
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "torch_seconds": round(runs["torch"][1], 3),
+        "onnx_seconds": round(runs["onnx"][1], 3),
+        "passed": float(cosines.min()) >= settings.ONNX_PARITY_MIN_COSINE,
+    }
+
+
+def load_embedding(model_name: str):
+    """The quantized SentenceTransformer, or None if it didn't pass the parity check."""
+    parity = export_embedding(model_name)
+    if not parity["passed"]:
+        return None
+    return _load_embedding(export_dir(model_name, "embedding"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, quantize and parity-check the ONNX models.")
+    parser.add_argument("--generation-model", default=settings.GENERATION_MODEL)
+    parser.add_argument("--embedding-model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--force", action="store_true", help="Export again even if a checked export exists")
+    args = parser.parse_args()
+
+    if args.force:
+        shutil.rmtree(export_dir(args.generation_model, "seq2seq"), ignore_errors=True)
+        shutil.rmtree(export_dir(args.embedding_model, "embedding"), ignore_errors=True)
+    report = {
+        "generation": export_seq2seq(args.generation_model),
+        "embedding": export_embedding(args.embedding_model),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
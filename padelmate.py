@@ -1,15 +1,20 @@
 import streamlit as st
-import chromadb
-from transformers import pipeline
+from generation import get_generator, warm_up
 from pathlib import Path
-import tempfile
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.backend.docling_parse_v2_backend import DoclingParseV2DocumentBackend
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, AcceleratorOptions, AcceleratorDevice
 from datetime import datetime
+import answer_cache
+import retrieval_cache
+import corpus
+import json
+import telemetry
+import ingestion_queue
+import document_store
+import settings
+from knowledge_base import get_knowledge_base
+from conversion import cache as conversion_cache
+from embeddings import get_embedder
+from qa import answer_with_source, best_source, retrieve, stream_answer_with_source
+from vectorstore import get_client, get_or_create_collection
 
 def add_custom_css():
     st.markdown("""
@@ -166,40 +171,10 @@ st.markdown("""
 def setup_documents():
     """
     This function creates our document database
-    NOTE: This runs every time someone uses the app
-    In a real app, you'd want to save this data permanently
+    NOTE: The documents live in corpus.py and are embedded once per process
+    (or reopened from disk), so reruns of this script don't redo any of it
     """
-    client = chromadb.Client()
-    try:
-        collection = client.get_collection(name="docs")
-    except Exception:
-        collection = client.create_collection(name="docs")
-    
-    # STUDENT TASK: Replace these 5 documents with your own!
-    # Pick ONE topic: movies, sports, cooking, travel, technology
-    # Each document should be 150-200 words
-    # IMPORTANT: The quality of your documents affects answer quality!
-    
-    my_documents = [
-        "A Brief History of Padel: Padel originated in Mexico in 1969, when Enrique Corcuera created the first court at his home. The sport quickly spread to Spain and Argentina, where it gained immense popularity. Unlike tennis, padel is played on a smaller court enclosed by walls, which are part of the game. Its combination of squash and tennis elements makes it dynamic and strategic. By the 1990s, padel had become one of Spain’s most popular sports. The World Padel Tour (WPT) was established in 2013, further professionalizing the sport. As of 2025, padel is played in over 90 countries and is among the fastest-growing sports in Europe and the Middle East. Its appeal lies in its accessibility—easy for beginners yet tactically rich for advanced players. Today, efforts are ongoing to make padel an Olympic sport. The game's unique mix of teamwork, reflexes, and wall-play has helped it carve out a distinct identity within the racket sport world.",
-
-        "Rules and How the Game Works: Padel is typically played in doubles, 4 players in total, on a 10x20 meter enclosed court. The scoring system mirrors tennis: games, sets, and matches. Players use solid, stringless rackets and a ball slightly less pressurized than a tennis ball. Serves must be underhand and bounce once before crossing diagonally. After the serve, players can use walls to return shots, making positioning and anticipation crucial. The ball must bounce once on the ground before hitting the walls. Shots that hit the opponent's glass wall before the ground are still valid. Unlike tennis, power alone doesn't win matches—strategy, angles, and teamwork are vital. The net is lower than in tennis (88 cm at the center) and the game is played at a faster pace due to shorter court distances. Padel encourages long rallies, spectacular recoveries, and creative use of the back glass. The sport emphasizes reflexes, placement, and coordination, making it accessible yet complex enough for elite competition.",
-
-        "Padel Equipment: What You Need to Play: Padel equipment is simple but specialized. The most important item is the padel racket—solid, perforated, and without strings. It’s made from carbon fiber or fiberglass with a foam core, and it varies in shape: round (control), diamond (power), or teardrop (hybrid). Players choose rackets based on their skill level and playing style. Padel balls resemble tennis balls but have slightly lower pressure for better control in enclosed courts. Footwear is also key: padel shoes offer lateral support and grip suitable for artificial turf and sand-filled surfaces. Apparel is similar to tennis—breathable clothes and wristbands are common. Safety gear like elbow or knee supports can help prevent injuries. Some players wear vibration-dampening gloves or wrist braces. Advanced gear might include smart sensors to track performance or custom-molded grips. While the setup cost is lower than other racket sports, choosing the right gear can greatly impact your game experience and performance.",
-
-        "Who Are the Best Padel Players Today?: As of 2025, the top figures in padel dominate headlines in Spain, Argentina, and increasingly worldwide. On the men’s side, Alejandro Galán and Juan Lebrón have long held top rankings, known for their aggressive play and fluid teamwork. Arturo Coello, a rising Spanish star, has surged through the ranks with powerful smashes and clever tactics. In the women’s circuit, Alejandra Salazar and Gemma Triay form one of the strongest duos, known for their consistency and resilience under pressure. Paula Josemaría has also become a household name due to her speed and anticipation. The World Padel Tour (WPT) and Premier Padel Tour showcase elite talent, with tournaments held across Europe, South America, and the Middle East. Some tennis stars like Andy Murray and Serena Williams have also shown interest in the sport. Rankings evolve rapidly as younger players emerge, but Spain and Argentina remain the dominant forces in both talent and fanbase.",
-
-        "The Global Rise of Padel: Padel has exploded in popularity over the last decade. Spain leads in player base and infrastructure, with over 20,000 courts and more than 5 million players. Argentina has long been a stronghold, with a deep-rooted padel culture. The sport has surged in Italy, Sweden, France, and the UAE, with courts popping up in urban areas and resorts. Padel's growth is driven by its social nature—it’s easy to learn, promotes teamwork, and doesn’t require advanced fitness to start. Major investments by sports clubs, ex-tennis pros, and celebrities (like Neymar and Beckham) have given it global exposure. In 2022, the International Padel Federation partnered with Qatar Sports Investments to launch the Premier Padel Tour, accelerating the sport’s international expansion. Padel clubs now exist in North America and Asia, and talks of Olympic inclusion are gaining momentum. Its combination of fun, accessibility, and fast-paced action continues to attract players of all ages and skill levels."
-    ]
-    
-    # Add documents to database with unique IDs
-    # ChromaDB needs unique identifiers for each document
-    collection.add(
-        documents=my_documents,
-        ids=["padel1", "padel2", "padel3", "padel4", "padel5"]
-    )
-    
-    return collection
+    return corpus.load()
 
 def get_answer(collection, question):
     """
@@ -209,7 +184,7 @@ def get_answer(collection, question):
     # STEP 1: Search for relevant documents in the database
     # We get 3 documents instead of 2 for better context coverage
     results = collection.query(
-        query_texts=[question],    # The user's question
+        query_embeddings=[get_embedder().embed_query(question)],    # The user's question
         n_results=3               # Get 3 most similar documents
     )
     
@@ -245,11 +220,9 @@ Instructions: Answer ONLY using the information provided above. If the answer is
 Answer:"""
     
     # STEP 6: Generate answer with anti-hallucination parameters
-    ai_model = pipeline("text2text-generation", model="google/flan-t5-small")
-    response = ai_model(
-        prompt, 
-        max_length=75
-    )
+    # The model is loaded once per process and shared by every session
+    ai_model = get_generator(settings.GENERATION_MODEL, max_length=75)
+    response = ai_model(prompt)
     
     # STEP 7: Extract and clean the generated answer
     answer = response[0]['generated_text'].strip()
@@ -262,9 +235,12 @@ Answer:"""
 
 # STREAMLIT BUILDING BLOCK 3: FUNCTION CALLS
 # We call our function to set up the document database
-# This happens every time someone uses the app
+# Only the first run of the process builds it; later runs get the shared collection
 collection = setup_documents()
 
+# Load the generation model up front; after the first run of this process this is a no-op
+warm_up(settings.GENERATION_MODEL)
+
 # STREAMLIT BUILDING BLOCK 4: TEXT INPUT BOX
 # st.text_input() creates a box where users can type
 # - First parameter: Label that appears above the box
@@ -345,120 +321,18 @@ with st.expander("ℹ️ **WHAT CAN I ASK ABOUT?**"):
 
 
 
-# Convert uploaded file to markdown text
-def convert_to_markdown(file_path: str) -> str:
-    path = Path(file_path)
-    ext = path.suffix.lower()
-
-    if ext == ".pdf":
-        pdf_opts = PdfPipelineOptions(do_ocr=False)
-        pdf_opts.accelerator_options = AcceleratorOptions(
-            num_threads=4,
-            device=AcceleratorDevice.CPU
-        )
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: PdfFormatOption(
-                    pipeline_options=pdf_opts,
-                    backend=DoclingParseV2DocumentBackend
-                )
-            }
-        )
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext in [".doc", ".docx"]:
-        converter = DocumentConverter()
-        doc = converter.convert(file_path).document
-        return doc.export_to_markdown(image_mode="placeholder")
-
-    if ext == ".txt":
-        try:
-            return path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            return path.read_text(encoding="latin-1", errors="replace")
-
-    raise ValueError(f"Unsupported extension: {ext}")
-
-
-# Reset ChromaDB collection
-def reset_collection(client, collection_name: str):
-    try:
-        client.delete_collection(name=collection_name)
-    except Exception:
-        pass
-    return client.create_collection(name=collection_name)
-
-
-# Add text chunks to ChromaDB
-def add_text_to_chromadb(text: str, filename: str, collection_name: str = "documents"):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=700,
-        chunk_overlap=100,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    chunks = splitter.split_text(text)
-
-    if not hasattr(add_text_to_chromadb, 'client'):
-        add_text_to_chromadb.client = chromadb.Client()
-        add_text_to_chromadb.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        add_text_to_chromadb.collections = {}
-
-    if collection_name not in add_text_to_chromadb.collections:
-        try:
-            collection = add_text_to_chromadb.client.get_collection(name=collection_name)
-        except:
-            collection = add_text_to_chromadb.client.create_collection(name=collection_name)
-        add_text_to_chromadb.collections[collection_name] = collection
-
-    collection = add_text_to_chromadb.collections[collection_name]
-
-    for i, chunk in enumerate(chunks):
-        embedding = add_text_to_chromadb.embedding_model.encode(chunk).tolist()
-
-        metadata = {
-            "filename": filename,
-            "chunk_index": i,
-            "chunk_size": len(chunk)
-        }
-
-        collection.add(
-            embeddings=[embedding],
-            documents=[chunk],
-            metadatas=[metadata],
-            ids=[f"{filename}_chunk_{i}"]
-        )
-
-    return collection
-
-
-
 # Q&A function with source tracking
-def get_answer_with_source(collection, question):
-    results = collection.query(query_texts=[question], n_results=3)
-    docs = results["documents"][0]
-    distances = results["distances"][0]
-    ids = results["ids"][0] if "ids" in results else ["unknown"] * len(docs)
-
-    if not docs or min(distances) > 1.5:
-        return "I don't have information about that topic in my documents.", "No source"
-
-    context = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(docs)])
-    prompt = f"""Context information:
-{context}
+def get_answer_with_source(collection, question, namespace=None):
+    return answer_with_source(collection, question, namespace=namespace)
 
-Question: {question}
 
-Instructions: Answer ONLY using the information provided above. If the answer is not in the context, respond with 'I don't know.' Do not add information from outside the context.
+# Streaming Q&A: the source is known after retrieval, the answer arrives token by token
+def stream_answer(collection, question, namespace=None):
+    return stream_answer_with_source(collection, question, namespace=namespace)
 
-Answer:"""
-
-    ai_model = pipeline("text2text-generation", model="google/flan-t5-small")
-    response = ai_model(prompt, max_length=150)
-    answer = response[0]['generated_text'].strip()
-    # Extract source from best matching document
-    best_source = ids[0].split('_chunk_')[0] if ids else "unknown"
-    return answer, best_source
+# The knowledge base space (user or team) this session works in
+def current_namespace():
+    return st.session_state.get('namespace') or settings.DEFAULT_NAMESPACE
 
 # Search history feature
 def add_to_search_history(question, answer, source):
@@ -483,6 +357,13 @@ def show_search_history():
             st.write("**Question:**", search['question'])
             st.write("**Answer:**", search['answer'])
             st.write("**Source:**", search['source'])
+            # Served from the retrieval cache until the documents change
+            if st.checkbox("Show retrieved passages", key=f"passages_{i}") and 'collection' in st.session_state:
+                retrieved = retrieve(st.session_state.collection, search['question'], namespace=current_namespace())
+                for chunk_id, distance, doc in zip(retrieved['ids'], retrieved['distances'], retrieved['documents']):
+                    source = best_source([chunk_id], st.session_state.collection, current_namespace())
+                    st.write(f"**{source}** (distance {distance:.3f})")
+                    st.text(doc[:300] + "..." if len(doc) > 300 else doc)
 
 # Document manager with delete and preview
 def show_document_manager():
@@ -490,31 +371,34 @@ def show_document_manager():
         '<h2 style="color: white; font-family: Cal Sans, sans-serif;">📋 Manage documents</h2>',
         unsafe_allow_html=True
     )
-    if not st.session_state.get('converted_docs', []):
+    # Handles only; the text stays in the document store
+    docs = get_knowledge_base("documents").documents(current_namespace())
+    if not docs:
         st.markdown(
             '<span style="color: white; font-family: Cal Sans, sans-serif;">No documents uploaded yet.</span>',
             unsafe_allow_html=True
         )
         return
-    for i, doc in enumerate(st.session_state.converted_docs):
+    for i, doc in enumerate(docs):
         col1, col2, col3 = st.columns([3, 1, 1])
         with col1:
             st.write(f"📄 {doc['filename']}")
-            st.write(f"   Words: {len(doc['content'].split())}")
+            st.write(f"   Words: {doc['words']:,} · Chunks: {doc['chunks']:,}")
+            if doc['shared_with']:
+                st.write(f"   Shared with {doc['shared_with']} other upload(s), stored once")
         with col2:
             if st.button("Preview", key=f"preview_{i}"):
                 st.session_state[f'show_preview_{i}'] = True
         with col3:
             if st.button("Delete", key=f"delete_{i}"):
-                st.session_state.converted_docs.pop(i)
-                # Rebuild database
-                st.session_state.collection = reset_collection(st.session_state.client, "documents")
-                for d in st.session_state.converted_docs:
-                    add_text_to_chromadb(d['content'], d['filename'], collection_name="documents")
+                # Drops this space's reference; the chunks go once nobody uses them
+                get_knowledge_base("documents").detach(current_namespace(), doc['filename'])
                 st.rerun()
         if st.session_state.get(f'show_preview_{i}', False):
             with st.expander(f"Preview: {doc['filename']}", expanded=True):
-                st.text(doc['content'][:500] + "..." if len(doc['content']) > 500 else doc['content'])
+                # Only the start of the document is read from disk
+                preview = document_store.store.preview(doc, 501)
+                st.text(preview[:500] + "..." if len(preview) > 500 else preview)
                 if st.button("Hide Preview", key=f"hide_{i}"):
                     st.session_state[f'show_preview_{i}'] = False
                     st.rerun()
@@ -525,11 +409,15 @@ def show_document_stats():
         '<h2 style="color: white; font-family: Cal Sans, sans-serif;">📊 Document statistics</h2>',
         unsafe_allow_html=True
     )
-    if not st.session_state.get('converted_docs', []):
+    docs = get_knowledge_base("documents").documents(current_namespace())
+    if not docs:
         st.markdown('<span style="color: white; font-family: Cal Sans, sans-serif;">No documents to analyze.</span>', unsafe_allow_html=True)
         return
-    total_docs = len(st.session_state.converted_docs)
-    total_words = sum(len(doc['content'].split()) for doc in st.session_state.converted_docs)
+    total_docs = len(docs)
+    # Counted once at ingest time and kept in the document handles
+    total_words = sum(doc['words'] for doc in docs)
+    total_chunks = sum(doc['chunks'] for doc in docs)
+    total_bytes = sum(doc['bytes'] for doc in docs)
     avg_words = total_words // total_docs if total_docs > 0 else 0
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -538,39 +426,154 @@ def show_document_stats():
         st.metric("Total Words", f"{total_words:,}")
     with col3:
         st.metric("Average Words/Doc", f"{avg_words:,}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Chunks", f"{total_chunks:,}")
+    with col2:
+        st.metric("Markdown Size", f"{total_bytes / (1024 * 1024):.1f} MB")
     file_types = {}
-    for doc in st.session_state.converted_docs:
+    for doc in docs:
         ext = Path(doc['filename']).suffix.lower()
         file_types[ext] = file_types.get(ext, 0) + 1
     st.write("**File Types:**")
     for ext, count in file_types.items():
         st.write(f"• {ext}: {count} files")
+    cache_stats = conversion_cache.stats()
+    if cache_stats['hits'] or cache_stats['misses']:
+        st.write("**Conversion Cache:**")
+        st.write(f"• {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)")
+    corpus_stats = corpus.stats()
+    if corpus_stats['cold_start_seconds'] is not None:
+        st.write("**Built-in Corpus:**")
+        st.write(f"• Ready in {corpus_stats['cold_start_seconds']:.2f}s at startup ({corpus_stats['embedded_documents']} documents embedded)")
+    retrieval_stats = retrieval_cache.cache.stats()
+    if retrieval_stats['hits'] or retrieval_stats['misses']:
+        st.write("**Retrieval Cache:**")
+        st.write(f"• {retrieval_stats['hits']} hits, {retrieval_stats['misses']} misses ({retrieval_stats['hit_rate']:.0%} hit rate), {retrieval_stats['stale']} stale")
+    answer_stats = answer_cache.cache.stats()
+    if answer_stats['hits'] or answer_stats['misses']:
+        st.write("**Answer Cache:**")
+        st.write(f"• {answer_stats['hits']} hits, {answer_stats['misses']} misses ({answer_stats['hit_rate']:.0%} hit rate), {answer_stats['entries']} cached answers")
+    kb_stats = get_knowledge_base("documents").stats()
+    if kb_stats['entries']:
+        st.write("**Shared Knowledge Base:**")
+        st.write(f"• {kb_stats['documents']} documents indexed for {kb_stats['namespaces']} spaces, "
+                 f"{kb_stats['deduplicated']} duplicate uploads stored once")
+    report = st.session_state.get('last_ingest_report')
+    if report:
+        st.write("**Last Ingestion:**")
+        st.write(
+            f"• {report['chunks']} chunks ({report['added_chunks']} embedded, {report['reused_chunks']} reused, "
+            f"{report['removed_chunks']} removed) in {report['total_seconds']}s "
+            f"({report['chunks_per_second']} chunks/s, {report['tokens_per_second']} tokens/s, "
+            f"batch size {report['batch_size']})"
+        )
 
-# Helper: convert uploaded files to markdown and store in session
-def convert_uploaded_files(uploaded_files):
-    converted_docs = []
-    for file in uploaded_files:
-        suffix = Path(file.name).suffix
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
-            temp_file.write(file.getvalue())
-            temp_file_path = temp_file.name
-        text = convert_to_markdown(temp_file_path)
-        converted_docs.append({
-            'filename': file.name,
-            'content': text
-        })
-    return converted_docs
-
-# Helper: add docs to database
-def add_docs_to_database(collection, docs):
-    count = 0
-    for doc in docs:
-        add_text_to_chromadb(doc['content'], doc['filename'], collection_name="documents")
-        count += 1
-    return count
+# Developer panel: per-stage timings of the latest questions and uploads
+def show_developer_panel():
+    if not st.checkbox("🛠️ Show request timings (developer)"):
+        return
+    traces = telemetry.recent_traces()
+    if not traces:
+        st.info("No questions or uploads timed yet.")
+        return
+    rows = []
+    for trace in traces:
+        row = {
+            'time': datetime.fromtimestamp(trace['started_at']).strftime("%H:%M:%S"),
+            'request': trace['kind'],
+            'status': trace['status'],
+            'total ms': round(trace['seconds'] * 1000, 1),
+        }
+        for span in trace['spans']:
+            column = f"{span['stage']} ms"
+            row[column] = round(row.get(column, 0) + span['seconds'] * 1000, 1)
+        rows.append(row)
+    st.dataframe(rows, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Download metrics (Prometheus)", telemetry.prometheus_text(),
+                           file_name="padelmate_metrics.prom", mime="text/plain")
+    with col2:
+        st.download_button("Download traces (JSON)", json.dumps(traces, indent=2),
+                           file_name="padelmate_traces.json", mime="application/json")
+
+# Helper: queue uploaded files for background conversion and indexing
+def submit_uploaded_files(uploaded_files):
+    job_id = ingestion_queue.jobs.submit(
+        [(file.name, file.getvalue()) for file in uploaded_files],
+        collection_name="documents",
+        namespace=current_namespace()
+    )
+    # Only the latest few uploads are shown
+    st.session_state.ingest_jobs = ([job_id] + st.session_state.get('ingest_jobs', []))[:5]
+    return job_id
+
+# Helper: files of this session's uploads that finished since the last run
+def collect_finished_files():
+    seen = st.session_state.setdefault('finished_files', set())
+    finished = []
+    for job_id in st.session_state.get('ingest_jobs', []):
+        job = ingestion_queue.jobs.job(job_id)
+        if job is None:
+            continue
+        for file_job in job.files:
+            if file_job.status == ingestion_queue.DONE and (job_id, file_job.filename) not in seen:
+                seen.add((job_id, file_job.filename))
+                finished.append(file_job)
+                st.session_state.last_ingest_report = file_job.report
+    return finished
+
+STATUS_ICONS = {
+    ingestion_queue.QUEUED: "⏳",
+    ingestion_queue.CONVERTING: "📝",
+    ingestion_queue.INDEXING: "🧠",
+    ingestion_queue.DONE: "✅",
+    ingestion_queue.FAILED: "❌",
+}
+
+# Per-file progress of this session's uploads, refreshed while jobs are running
+def show_ingestion_jobs():
+    if collect_finished_files():
+        # Let the other tabs pick up the new documents
+        st.rerun()
+    for job_id in st.session_state.get('ingest_jobs', []):
+        job = ingestion_queue.jobs.job(job_id)
+        if job is None:
+            continue
+        done = sum(f.status == ingestion_queue.DONE for f in job.files)
+        if not job.finished:
+            st.progress(job.progress(), text=f"Upload {job.id}: {done}/{len(job.files)} files ready")
+        for file_job in job.files:
+            line = f"{STATUS_ICONS[file_job.status]} {file_job.filename} — {file_job.status}"
+            if file_job.streamed and file_job.status == ingestion_queue.INDEXING:
+                line += f" (pages 1-{file_job.pages_done} of {file_job.pages_total} searchable)"
+            if file_job.status == ingestion_queue.DONE:
+                report = file_job.report
+                if file_job.shared:
+                    line += f" (already in the knowledge base, {report['reused_chunks']} chunks shared)"
+                else:
+                    line += (f" ({report['added_chunks']} new chunks, {report['reused_chunks']} unchanged, "
+                             f"{report['removed_chunks']} removed, {file_job.seconds:.1f}s)")
+            elif file_job.status == ingestion_queue.FAILED:
+                line += f": {file_job.error}"
+            st.markdown(
+                f"<span style='color: white; font-family: \"Cal Sans\", sans-serif;'>{line}</span>",
+                unsafe_allow_html=True
+            )
+
+# Poll for progress without rerunning the whole page (needs a Streamlit with fragments)
+if hasattr(st, "fragment"):
+    show_ingestion_jobs = st.fragment(run_every=2)(show_ingestion_jobs)
     
 
 def create_tabbed_interface():
+    st.text_input(
+        "👥 Team space",
+        value=settings.DEFAULT_NAMESPACE,
+        key="namespace",
+        help="Everyone using the same space shares its documents; files already uploaded elsewhere are reused, not re-indexed."
+    )
     tab1, tab2, tab3, tab4 = st.tabs(["🎾 **UPLOAD**", "🔥 **QUESTIONS**", "📋 **MANAGE**", "📊 **STATS**"])
 
     with tab1:
@@ -586,30 +589,35 @@ def create_tabbed_interface():
         )
         if st.button("💾 **ADD TO PADELMATE**", type="primary"):
             if uploaded_files:
-                with st.spinner("Organizing your padel notes with passion..."):
-                    converted_docs = convert_uploaded_files(uploaded_files)
-                if 'converted_docs' not in st.session_state:
-                    st.session_state.converted_docs = []
-                if 'client' not in st.session_state:
-                    st.session_state.client = chromadb.Client()
-                if 'collection' not in st.session_state:
-                    st.session_state.collection = reset_collection(st.session_state.client, "padel_documents")
-                num_added = add_docs_to_database(st.session_state.collection, converted_docs)
-                st.session_state.converted_docs.extend(converted_docs)
+                submit_uploaded_files(uploaded_files)
                 st.markdown(
-                    f"<span style='color: white; font-family: \"Cal Sans\", sans-serif;'>🎾 Added {num_added} padel notes to your Knowledge Base!</span>",
+                    f"<span style='color: white; font-family: \"Cal Sans\", sans-serif;'>🎾 Organizing {len(uploaded_files)} padel notes in the background. "
+                    f"Each one is searchable as soon as it's ready — feel free to keep browsing!</span>",
                     unsafe_allow_html=True
                 )
             else:
                 st.info("Please select your padel files to upload first.")
+        if st.session_state.get('ingest_jobs'):
+            show_ingestion_jobs()
 
     with tab2:
         st.markdown('<h2 style="color: white; font-family: Cal Sans, sans-serif;">🔥 Ask anything about your padel docs</h2>', unsafe_allow_html=True)
-        if st.session_state.get('converted_docs', []):
+        # Documents indexed before a restart are still searchable
+        if get_knowledge_base("documents").count(current_namespace()) > 0:
             question, search_button, clear_button = enhanced_question_interface()
-            if search_button and question:
-                with st.spinner("Searching your padel wisdom..."):
-                    answer, source = get_answer_with_source(st.session_state.collection, question)
+            streaming = st.checkbox("⚡ Show the answer while it's being written", value=True)
+            if search_button and question and streaming:
+                with telemetry.trace("question", streaming=True):
+                    with st.spinner("Searching your padel wisdom..."):
+                        source, answer_stream = stream_answer(st.session_state.collection, question, current_namespace())
+                    st.markdown("### ✨ Your Padel-Powered Answer")
+                    st.info(f"📄 Source: {source}")
+                    answer = st.write_stream(answer_stream).strip()
+                add_to_search_history(question, answer, source)
+            elif search_button and question:
+                with telemetry.trace("question", streaming=False):
+                    with st.spinner("Searching your padel wisdom..."):
+                        answer, source = get_answer_with_source(st.session_state.collection, question, current_namespace())
                 st.markdown("### ✨ Your Padel-Powered Answer")
                 st.write(answer)
                 st.info(f"📄 Source: {source}")
@@ -630,6 +638,7 @@ def create_tabbed_interface():
 
     with tab4:
         show_document_stats()
+        show_developer_panel()
 
 
 
@@ -658,12 +667,11 @@ def enhanced_question_interface():
 def main():
     add_custom_css()
     # Removed the title and subtitle markdown lines here
-    if 'converted_docs' not in st.session_state:
-        st.session_state.converted_docs = []
     if 'client' not in st.session_state:
-        st.session_state.client = chromadb.Client()
+        st.session_state.client = get_client()
     if 'collection' not in st.session_state:
-        st.session_state.collection = reset_collection(st.session_state.client, "documents")
+        # Reopen the shared on-disk collection instead of wiping it
+        st.session_state.collection = get_or_create_collection(st.session_state.client, "documents")
     if 'search_history' not in st.session_state:
         st.session_state.search_history = []
     create_tabbed_interface()
@@ -671,12 +679,11 @@ def main():
 def main():
     add_custom_css()
     
-    if 'converted_docs' not in st.session_state:
-        st.session_state.converted_docs = []
     if 'client' not in st.session_state:
-        st.session_state.client = chromadb.Client()
+        st.session_state.client = get_client()
     if 'collection' not in st.session_state:
-        st.session_state.collection = reset_collection(st.session_state.client, "documents")
+        # Reopen the shared on-disk collection instead of wiping it
+        st.session_state.collection = get_or_create_collection(st.session_state.client, "documents")
     if 'search_history' not in st.session_state:
         st.session_state.search_history = []
 
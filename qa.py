@@ -0,0 +1,275 @@
+"""
+Question answering over a document collection: retrieve the closest chunks,
+build a grounded prompt and generate an answer with flan-t5.
+
+Kept out of the Streamlit scripts so the batch tools can use the same code.
+
+With a namespace, only the documents that namespace added to the shared
+knowledge base are searched, and sources are reported under the filenames it
+uploaded them as. Caches are then scoped to the namespace.
+"""
+import time
+
+import answer_cache
+import collection_versions
+import knowledge_base
+import lexical_index
+import rerank
+import retrieval_cache
+import settings
+from embeddings import get_embedder
+from generation import get_generator
+from context_builder import build_context
+from telemetry import annotate, record, span
+
+NO_ANSWER = "I don't have information about that topic in my documents."
+NO_SOURCE = "No source"
+
+
+def embed_question(question: str):
+    with span("qa.embed"):
+        return retrieval_cache.cache.query_embedding(get_embedder(), question)
+
+
+def scope(collection, namespace: str = None) -> str:
+    """Name the caches and collection versions use for what a question can see."""
+    if namespace is None:
+        return collection.name
+    return knowledge_base.get_knowledge_base(collection.name).scope(namespace)
+
+
+def namespace_filter(collection, namespace: str = None):
+    """Query kwargs restricting the search to a namespace, or None if it has no documents."""
+    if namespace is None:
+        return {}
+    base = knowledge_base.get_knowledge_base(collection.name)
+    return {"where": base.where(namespace)} if base.count(namespace) else None
+
+
+def lexical_filenames(collection, namespace: str = None):
+    """Document keys the BM25 search is restricted to, or None for the whole collection."""
+    if namespace is None:
+        return None
+    return knowledge_base.get_knowledge_base(collection.name).keys(namespace)
+
+
+def first_stage_sizes(n_results: int):
+    """(chunks the first stage returns, chunks to ask the vector index for)."""
+    candidates = max(n_results, settings.RERANK_CANDIDATES) if settings.RERANK else n_results
+    if settings.RETRIEVAL_MODE == "hybrid":
+        return candidates, max(candidates, settings.HYBRID_CANDIDATES)
+    return candidates, candidates
+
+
+def retrieve(collection, question: str, n_results: int = None, query_embedding=None, namespace: str = None,
+             use_cache: bool = True) -> dict:
+    """
+    Closest chunks to the question: {"ids", "documents", "distances"}.
+    In hybrid mode the vector hits are fused with BM25 hits (lexical_index),
+    and with settings.RERANK a larger candidate set is cut down by a
+    cross-encoder (rerank).
+    Results are reused until the collection changes (unless use_cache is
+    off, e.g. to time the search); don't modify them.
+    """
+    n_results = n_results or settings.N_RESULTS
+    cache_scope = scope(collection, namespace)
+    if use_cache:
+        with span("qa.retrieval_cache"):
+            cached = retrieval_cache.cache.get(cache_scope, question, n_results)
+        if cached is not None:
+            return cached
+
+    version = collection_versions.current(cache_scope)
+    where = namespace_filter(collection, namespace)
+    if where is None:
+        return {"ids": [], "documents": [], "distances": []}
+    if query_embedding is None:
+        query_embedding = embed_question(question)
+    candidates, fetch = first_stage_sizes(n_results)
+    with span("qa.search"):
+        results = collection.query(
+            query_embeddings=[query_embedding],
+            n_results=fetch,
+            **where
+        )
+    docs = results["documents"][0]
+    retrieved = {
+        "ids": results["ids"][0] if "ids" in results else ["unknown"] * len(docs),
+        "documents": docs,
+        "distances": results["distances"][0],
+    }
+    if settings.RETRIEVAL_MODE == "hybrid":
+        with span("qa.lexical"):
+            retrieved = lexical_index.hybrid(collection, question, query_embedding, retrieved, candidates,
+                                             lexical_filenames(collection, namespace))
+    if settings.RERANK:
+        with span("qa.rerank"):
+            retrieved = rerank.rerank(question, retrieved, n_results)
+        if not retrieved["reranked"]:
+            # Don't keep serving the fallback once the cross-encoder is back in budget
+            return retrieved
+    if use_cache:
+        retrieval_cache.cache.put(cache_scope, version, question, n_results, retrieved)
+    return retrieved
+
+
+def is_relevant(retrieved: dict) -> bool:
+    return bool(retrieved["documents"]) and min(retrieved["distances"]) <= settings.DISTANCE_THRESHOLD
+
+
+def build_prompt(question: str, docs) -> str:
+    context = "\n\n".join([f"Document {i+1}: {doc}" for i, doc in enumerate(docs)])
+    return f"""Context information:
+{context}
+
+Question: {question}
+
+Instructions: Answer ONLY using the information provided above. If the answer is not in the context, respond with 'I don't know.' Do not add information from outside the context.
+
+Answer:"""
+
+
+def prompt_context(question: str, docs):
+    """The prompt for the retrieved docs, packed into the token budget (context_builder)."""
+    generator = answer_generator()
+    context = build_context(question, docs, build_prompt, generator.count_tokens,
+                            settings.PROMPT_TOKEN_BUDGET or generator.max_input_tokens)
+    annotate(**context.as_dict())
+    return context
+
+
+def best_source(ids, collection=None, namespace: str = None) -> str:
+    # Chunk ids look like "<filename>_chunk_<...>"
+    if not ids:
+        return "unknown"
+    source = ids[0].split('_chunk_')[0]
+    if collection is not None:
+        # Knowledge base chunks are keyed by document hash, not filename
+        source = knowledge_base.get_knowledge_base(collection.name).source_name(namespace, source)
+    return source
+
+
+def answer_generator():
+    return get_generator(settings.GENERATION_MODEL, max_length=settings.ANSWER_MAX_LENGTH)
+
+
+def answer_with_source(collection, question: str, namespace: str = None):
+    cache_scope = scope(collection, namespace)
+    version = collection_versions.current(cache_scope)
+    query_embedding = embed_question(question)
+    with span("qa.answer_cache"):
+        cached = answer_cache.cache.lookup(cache_scope, query_embedding)
+    if cached:
+        return cached
+
+    retrieved = retrieve(collection, question, query_embedding=query_embedding, namespace=namespace)
+    if not is_relevant(retrieved):
+        answer, source = NO_ANSWER, NO_SOURCE
+    else:
+        with span("qa.prompt"):
+            prompt = prompt_context(question, retrieved["documents"]).prompt
+        with span("qa.generate"):
+            response = answer_generator()(prompt)
+        answer, source = response[0]['generated_text'].strip(), best_source(retrieved["ids"], collection, namespace)
+
+    answer_cache.cache.store(cache_scope, version, question, query_embedding, answer, source)
+    return answer, source
+
+
+def stream_answer_with_source(collection, question: str, namespace: str = None):
+    """
+    Retrieve right away and return (source, pieces), where pieces is a
+    generator that yields the answer text as flan-t5 produces it.
+    """
+    cache_scope = scope(collection, namespace)
+    version = collection_versions.current(cache_scope)
+    query_embedding = embed_question(question)
+    with span("qa.answer_cache"):
+        cached = answer_cache.cache.lookup(cache_scope, query_embedding)
+    if cached:
+        answer, source = cached
+        return source, iter([answer])
+
+    retrieved = retrieve(collection, question, query_embedding=query_embedding, namespace=namespace)
+    if not is_relevant(retrieved):
+        answer_cache.cache.store(cache_scope, version, question, query_embedding, NO_ANSWER, NO_SOURCE)
+        return NO_SOURCE, iter([NO_ANSWER])
+
+    source = best_source(retrieved["ids"], collection, namespace)
+    with span("qa.prompt"):
+        prompt = prompt_context(question, retrieved["documents"]).prompt
+
+    def pieces():
+        answer = []
+        with span("qa.generate"):
+            start = time.perf_counter()
+            for piece in answer_generator().stream(prompt):
+                if not answer:
+                    record("qa.first_token", time.perf_counter() - start)
+                answer.append(piece)
+                yield piece
+        # Only fully generated answers are cached
+        answer_cache.cache.store(cache_scope, version, question, query_embedding, "".join(answer).strip(), source)
+
+    return source, pieces()
+
+
+def answer_batch(collection, questions, n_results: int = None, batch_size: int = None, namespace: str = None) -> list:
+    """
+    Answer many questions at once: one batched embedding pass, one
+    collection.query for all of them and batched generation. Skips the
+    caches, so regression runs always exercise the full pipeline.
+    Returns one dict per question with answer, source, ids, distances and
+    prompt_tokens.
+    """
+    questions = list(questions)
+    if not questions:
+        return []
+    n_results = n_results or settings.N_RESULTS
+    where = namespace_filter(collection, namespace)
+    if where is None:
+        return [{"question": q, "answer": NO_ANSWER, "source": NO_SOURCE, "ids": [], "distances": [], "prompt_tokens": 0}
+                for q in questions]
+    embeddings = get_embedder().embed_queries(questions)
+    hybrid = settings.RETRIEVAL_MODE == "hybrid"
+    candidates, fetch = first_stage_sizes(n_results)
+    results = collection.query(query_embeddings=embeddings, n_results=fetch, **where)
+    filenames = lexical_filenames(collection, namespace) if hybrid else None
+
+    rows, prompts, prompt_rows = [], [], []
+    for i, question in enumerate(questions):
+        retrieved = {
+            "ids": results["ids"][i],
+            "documents": results["documents"][i],
+            "distances": results["distances"][i],
+        }
+        if hybrid:
+            retrieved = lexical_index.hybrid(collection, question, embeddings[i], retrieved, candidates, filenames)
+        if settings.RERANK:
+            # No latency budget, so regression runs are deterministic
+            retrieved = rerank.rerank(question, retrieved, n_results, budget_ms=0)
+        else:
+            retrieved = {key: retrieved[key][:n_results] for key in ("ids", "documents", "distances")}
+        row = {
+            "question": question,
+            "answer": NO_ANSWER,
+            "source": NO_SOURCE,
+            "ids": retrieved["ids"],
+            "distances": [round(float(d), 4) for d in retrieved["distances"]],
+            "prompt_tokens": 0,
+        }
+        if is_relevant(retrieved):
+            row["source"] = best_source(retrieved["ids"], collection, namespace)
+            context = prompt_context(question, retrieved["documents"])
+            row["prompt_tokens"] = context.tokens
+            prompts.append(context.prompt)
+            prompt_rows.append(row)
+        rows.append(row)
+
+    if prompts:
+        responses = answer_generator()(prompts, batch_size=batch_size or settings.QA_BATCH_SIZE)
+        for row, response in zip(prompt_rows, responses):
+            # Pipelines return [{"generated_text": ...}] or {"generated_text": ...} per input
+            response = response[0] if isinstance(response, list) else response
+            row["answer"] = response["generated_text"].strip()
+    return rows
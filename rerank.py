@@ -0,0 +1,94 @@
+"""
+Cross-encoder re-ranking of retrieved chunks.
+
+With settings.RERANK on, the first stage (vector or hybrid search) fetches
+RERANK_CANDIDATES chunks, a small CPU cross-encoder scores every
+(question, chunk) pair in one batched forward pass, and only the best
+n_results go into the prompt. Scoring has a hard per-query budget
+(RERANK_BUDGET_MS): when it isn't met, while the model is still loading, or
+while another question is being scored, the candidates keep their
+first-stage order instead of waiting.
+
+The model is loaded once per process, on a background thread, so the first
+questions fall back rather than pay for the load.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import settings
+from telemetry import record
+
+# Question + one 700-character chunk fit comfortably
+MAX_LENGTH = 256
+
+logger = logging.getLogger("padelmate.rerank")
+
+
+class Reranker:
+    def __init__(self, model_name: str):
+        from sentence_transformers import CrossEncoder
+
+        start = time.perf_counter()
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=MAX_LENGTH, device="cpu")
+        self.load_seconds = time.perf_counter() - start
+
+    def score(self, question: str, documents) -> list:
+        """Relevance score of every document for the question, in one batch."""
+        pairs = [(question, document) for document in documents]
+        scores = self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return [float(score) for score in scores]
+
+
+_reranker = None
+# One scoring (or loading) at a time; callers that find it busy don't queue up
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="padelmate-rerank")
+_busy = threading.Semaphore(1)
+
+
+def _score(question: str, documents) -> list:
+    global _reranker
+    try:
+        if _reranker is None:
+            _reranker = Reranker(settings.RERANK_MODEL)
+        return _reranker.score(question, documents)
+    finally:
+        _busy.release()
+
+
+def _top(retrieved: dict, order, reranked: bool = False) -> dict:
+    top = {key: [retrieved[key][i] for i in order] for key in ("ids", "documents", "distances")}
+    top["reranked"] = reranked
+    return top
+
+
+def rerank(question: str, retrieved: dict, n_results: int, budget_ms: float = None) -> dict:
+    """
+    The n_results candidates the cross-encoder ranks highest, or the first
+    n_results in their original order if scoring misses the budget or fails
+    ("reranked" tells which). budget_ms=0 waits for the scores however long they take.
+    """
+    budget_ms = settings.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    candidates = len(retrieved["ids"])
+    if candidates <= 1:
+        return _top(retrieved, range(candidates), reranked=True)
+    start = time.perf_counter()
+    if not _busy.acquire(blocking=budget_ms == 0):
+        record("qa.rerank_fallback", 0.0)
+        return _top(retrieved, range(min(n_results, candidates)))
+    future = _executor.submit(_score, question, retrieved["documents"])
+    try:
+        scores = future.result(timeout=budget_ms / 1000 if budget_ms else None)
+    except FutureTimeoutError:
+        # Scoring carries on in the background (it may be loading the model)
+        record("qa.rerank_fallback", time.perf_counter() - start)
+        return _top(retrieved, range(min(n_results, candidates)))
+    except Exception:
+        logger.exception("Re-ranking failed; keeping the retrieval order")
+        record("qa.rerank_fallback", time.perf_counter() - start)
+        return _top(retrieved, range(min(n_results, candidates)))
+    order = sorted(range(candidates), key=lambda i: scores[i], reverse=True)[:n_results]
+    return _top(retrieved, order, reranked=True)
@@ -0,0 +1,90 @@
+"""
+Memoized retrieval results.
+
+collection.query results (ids, documents, distances) are kept per collection,
+normalized question and n_results, tagged with the collection version they
+were computed against. Any add, delete or reset bumps the version, so an entry
+is only ever served for the exact corpus it came from. Question embeddings are
+memoized as well, since they only depend on the question and the model.
+"""
+import threading
+from collections import OrderedDict
+
+import collection_versions
+import settings
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._results = OrderedDict()     # (collection, question, n_results) -> (version, retrieved)
+        self._embeddings = OrderedDict()  # (model, question) -> embedding
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _remember(self, store, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_entries:
+            store.popitem(last=False)
+
+    def get(self, collection_name: str, question: str, n_results: int):
+        if not self.enabled:
+            return None
+        key = (collection_name, normalize_question(question), n_results)
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] != collection_versions.current(collection_name):
+                del self._results[key]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, collection_name: str, version: int, question: str, n_results: int, retrieved: dict):
+        if not self.enabled or version != collection_versions.current(collection_name):
+            return
+        with self._lock:
+            self._remember(self._results, (collection_name, normalize_question(question), n_results),
+                           (version, retrieved))
+
+    def query_embedding(self, embedder, question: str):
+        """The question's embedding, computed once per normalized question."""
+        key = (embedder.model_name, normalize_question(question))
+        with self._lock:
+            embedding = self._embeddings.get(key)
+            if embedding is not None:
+                self._embeddings.move_to_end(key)
+                return embedding
+        embedding = embedder.embed_query(question)
+        if self.enabled:
+            with self._lock:
+                self._remember(self._embeddings, key, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stale": self.stale,
+            "entries": len(self._results),
+        }
+
+
+cache = RetrievalCache(settings.RETRIEVAL_CACHE_SIZE)
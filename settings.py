@@ -0,0 +1,140 @@
+"""
+Tunable settings shared by the apps and the command line tools.
+
+Every value can be overridden with an environment variable of the same name
+prefixed with PADELMATE_, e.g. PADELMATE_EMBED_BATCH_SIZE=128.
+"""
+import os
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(f"PADELMATE_{name}")
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+def _flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Text splitting
+CHUNK_SIZE = _env("CHUNK_SIZE", 700, int)
+CHUNK_OVERLAP = _env("CHUNK_OVERLAP", 100, int)
+
+# Embedding ingestion: chunks per encode mini-batch, and rows per Chroma
+# upsert (0 means "as many as the Chroma client accepts")
+EMBED_BATCH_SIZE = _env("EMBED_BATCH_SIZE", 64, int)
+UPSERT_BATCH_SIZE = _env("UPSERT_BATCH_SIZE", 0, int)
+
+# Embedding model used for both indexing and querying, and what to do when a
+# collection was built with a different one: "reindex" or "refuse"
+EMBEDDING_MODEL = _env("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_MISMATCH = _env("EMBEDDING_MISMATCH", "reindex")
+
+# Vector store: "persistent" keeps the index on disk under VECTOR_STORE_DIR and
+# reopens it on restart, "memory" keeps everything in-process
+VECTOR_STORE = _env("VECTOR_STORE", "persistent")
+VECTOR_STORE_DIR = _env("VECTOR_STORE_DIR", "chroma_store")
+
+# Markdown conversion cache, keyed by file content + converter options;
+# least recently used entries are evicted above CONVERSION_CACHE_MAX_MB (0 disables it)
+CONVERSION_CACHE_DIR = _env("CONVERSION_CACHE_DIR", "conversion_cache")
+CONVERSION_CACHE_MAX_MB = _env("CONVERSION_CACHE_MAX_MB", 512, int)
+
+# Docling converters, built once per process and reused for every file
+CONVERTER_NUM_THREADS = _env("CONVERTER_NUM_THREADS", 4, int)
+CONVERTER_OCR = _env("CONVERTER_OCR", False, _flag)
+
+# Parallel batch conversion: worker processes (0 = one per 4 cores, at least 1)
+# and seconds a single file may take before its worker is killed
+BATCH_WORKERS = _env("BATCH_WORKERS", 0, int)
+BATCH_TIMEOUT = _env("BATCH_TIMEOUT", 600, int)
+
+# Question answering
+GENERATION_MODEL = _env("GENERATION_MODEL", "google/flan-t5-small")
+ANSWER_MAX_LENGTH = _env("ANSWER_MAX_LENGTH", 150, int)
+# Tokens the prompt (instructions, question and retrieved context) may use;
+# 0 means the generation model's input limit (512 for flan-t5)
+PROMPT_TOKEN_BUDGET = _env("PROMPT_TOKEN_BUDGET", 0, int)
+N_RESULTS = _env("N_RESULTS", 3, int)
+# Questions whose closest chunk is further away than this get no answer
+DISTANCE_THRESHOLD = _env("DISTANCE_THRESHOLD", 1.5, float)
+
+# Semantic answer cache: a past answer is reused when a new question's
+# embedding is at least this cosine-similar (ANSWER_CACHE_SIZE=0 disables it)
+ANSWER_CACHE_SIZE = _env("ANSWER_CACHE_SIZE", 1000, int)
+ANSWER_CACHE_THRESHOLD = _env("ANSWER_CACHE_THRESHOLD", 0.92, float)
+ANSWER_CACHE_TTL = _env("ANSWER_CACHE_TTL", 3600, int)
+
+# Retrieval results memoized per normalized question, n_results and collection version
+RETRIEVAL_CACHE_SIZE = _env("RETRIEVAL_CACHE_SIZE", 2000, int)
+
+# Batch question answering: prompts per flan-t5 forward pass
+QA_BATCH_SIZE = _env("QA_BATCH_SIZE", 16, int)
+
+# Telemetry: finished request traces are logged as JSON lines to TELEMETRY_LOG
+# and Prometheus metrics are written to METRICS_FILE (both off when empty)
+TELEMETRY_LOG = _env("TELEMETRY_LOG", "")
+METRICS_FILE = _env("METRICS_FILE", "")
+TELEMETRY_RECENT = _env("TELEMETRY_RECENT", 50, int)
+
+# Background ingestion: worker threads converting and indexing uploads
+INGEST_WORKERS = _env("INGEST_WORKERS", 1, int)
+
+# Streaming ingestion: PDFs with at least STREAM_MIN_PAGES pages are converted
+# and indexed STREAM_PAGES_PER_SECTION pages at a time (0 disables streaming)
+STREAM_MIN_PAGES = _env("STREAM_MIN_PAGES", 100, int)
+STREAM_PAGES_PER_SECTION = _env("STREAM_PAGES_PER_SECTION", 10, int)
+
+# Converted Markdown of ingested documents, read lazily for previews
+DOCUMENT_STORE_DIR = _env("DOCUMENT_STORE_DIR", "document_store")
+
+# Knowledge base namespace (user or team) for sessions that don't pick one
+DEFAULT_NAMESPACE = _env("DEFAULT_NAMESPACE", "shared")
+
+# Vector index: HNSW profile ("fast", "balanced", "high-recall") and distance
+# metric ("l2", "cosine", "ip") for new collections, and where searches run:
+# "chroma", or a local "hnswlib"/"faiss" index for very large corpora
+# (optional: pip install hnswlib / faiss-cpu). Chroma still indexes the
+# vectors too, so a local index trades search speed for extra memory.
+# Filtered searches on a local index fetch ANN_FILTER_OVERFETCH x n_results
+# candidates before applying the filter, and twice as many each time fewer
+# than n_results of them pass, up to ANN_FILTER_MAX_FETCH; beyond that the
+# search goes to Chroma with the filter.
+INDEX_PROFILE = _env("INDEX_PROFILE", "balanced")
+INDEX_METRIC = _env("INDEX_METRIC", "l2")
+ANN_BACKEND = _env("ANN_BACKEND", "chroma")
+ANN_FILTER_OVERFETCH = _env("ANN_FILTER_OVERFETCH", 4, int)
+ANN_FILTER_MAX_FETCH = _env("ANN_FILTER_MAX_FETCH", 1000, int)
+
+# Retrieval: "vector" (default), or "hybrid" to fuse the vector hits with an
+# in-process BM25 index (better on player names and numbers) by reciprocal
+# rank fusion. The BM25 index is built in memory on the first hybrid query.
+# HYBRID_WEIGHT is the share of the lexical ranking (0 = vector only,
+# 1 = BM25 only); each side contributes HYBRID_CANDIDATES candidates.
+RETRIEVAL_MODE = _env("RETRIEVAL_MODE", "vector")
+HYBRID_WEIGHT = _env("HYBRID_WEIGHT", 0.5, float)
+HYBRID_CANDIDATES = _env("HYBRID_CANDIDATES", 20, int)
+RRF_K = _env("RRF_K", 60, int)
+
+# Re-ranking: fetch RERANK_CANDIDATES chunks, score them with a CPU
+# cross-encoder and keep the best N_RESULTS for the prompt. Questions whose
+# scoring takes longer than RERANK_BUDGET_MS keep the retrieval order.
+RERANK = _env("RERANK", False, _flag)
+RERANK_MODEL = _env("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = _env("RERANK_CANDIDATES", 30, int)
+RERANK_BUDGET_MS = _env("RERANK_BUDGET_MS", 300, float)
+
+# Inference backend for the generation and embedding models: "torch", or
+# "onnx" for int8-quantized ONNX Runtime models (optional: pip install
+# "optimum[onnxruntime]"). Exports are cached in ONNX_DIR and only used if
+# they pass the parity check against PyTorch; a model that can't be exported
+# or quantized stays on PyTorch (logged). ONNX_QUANTIZATION is the
+# instruction set to quantize for ("auto", "avx2", "avx512", "avx512_vnni",
+# "arm64").
+INFERENCE_BACKEND = _env("INFERENCE_BACKEND", "torch")
+ONNX_DIR = _env("ONNX_DIR", "onnx_models")
+ONNX_QUANTIZATION = _env("ONNX_QUANTIZATION", "auto")
+ONNX_PARITY_MIN_COSINE = _env("ONNX_PARITY_MIN_COSINE", 0.98, float)
+ONNX_PARITY_MIN_MATCH = _env("ONNX_PARITY_MIN_MATCH", 0.75, float)
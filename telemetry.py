@@ -0,0 +1,164 @@
+"""
+Per-stage timing for questions and uploads.
+
+A trace covers one request (a question, an upload); spans inside it time the
+stages (query embedding, search, generation, conversion, splitting, ...).
+Every span also feeds a process-wide Prometheus-style histogram, whether or
+not a trace is active. Finished traces are kept for the developer panel,
+logged as one JSON line each and, when settings.METRICS_FILE is set, the
+metrics are rewritten there in the Prometheus text format (e.g. for the node
+exporter's textfile collector).
+
+    with trace("question", question=q):
+        with span("qa.search"):
+            ...
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger("padelmate.telemetry")
+if settings.TELEMETRY_LOG:
+    _handler = logging.FileHandler(settings.TELEMETRY_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_current = contextvars.ContextVar("padelmate_trace", default=None)
+_lock = threading.Lock()
+_histograms = {}   # stage -> {"buckets": [...], "sum": float, "count": int}
+_requests = {}     # (kind, status) -> count
+recent = deque(maxlen=settings.TELEMETRY_RECENT)
+
+
+class Trace:
+    def __init__(self, kind: str, attributes: dict):
+        self.kind = kind
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.spans = []
+        self.seconds = 0.0
+        self.status = "ok"
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "started_at": round(self.started_at, 3),
+            "seconds": round(self.seconds, 4),
+            "status": self.status,
+            "attributes": self.attributes,
+            "spans": [{"stage": stage, "seconds": round(seconds, 4)} for stage, seconds in self.spans],
+        }
+
+
+class Span:
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.seconds = 0.0
+
+
+def record(stage: str, seconds: float):
+    """Record a stage duration measured elsewhere."""
+    with _lock:
+        histogram = _histograms.setdefault(stage, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+    current = _current.get()
+    if current is not None:
+        current.spans.append((stage, seconds))
+
+
+def annotate(**attributes):
+    """Add attributes to the active trace, if any."""
+    current = _current.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+@contextmanager
+def span(stage: str):
+    timing = Span(stage)
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing.seconds = time.perf_counter() - start
+        record(stage, timing.seconds)
+
+
+@contextmanager
+def trace(kind: str, **attributes):
+    """Start a request trace; inside an active trace this is just a span."""
+    if _current.get() is not None:
+        with span(kind) as timing:
+            yield timing
+        return
+
+    current = Trace(kind, attributes)
+    token = _current.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _current.reset(token)
+        _finish(current)
+
+
+def _finish(current: Trace):
+    with _lock:
+        key = (current.kind, current.status)
+        _requests[key] = _requests.get(key, 0) + 1
+        recent.appendleft(current)
+    record(f"{current.kind}.total", current.seconds)
+    logger.info(json.dumps(current.as_dict(), ensure_ascii=False))
+    if settings.METRICS_FILE:
+        write_prometheus(settings.METRICS_FILE)
+
+
+def recent_traces(limit: int = None) -> list:
+    traces = list(recent)
+    return [t.as_dict() for t in (traces[:limit] if limit else traces)]
+
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP padelmate_requests_total Finished requests by kind and status.",
+        "# TYPE padelmate_requests_total counter",
+    ]
+    with _lock:
+        for (kind, status), count in sorted(_requests.items()):
+            lines.append(f'padelmate_requests_total{{kind="{kind}",status="{status}"}} {count}')
+        lines += [
+            "# HELP padelmate_stage_seconds Time spent per request stage.",
+            "# TYPE padelmate_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(_histograms.items()):
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f'padelmate_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'padelmate_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'padelmate_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'padelmate_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
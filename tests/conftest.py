@@ -0,0 +1,78 @@
+import hashlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class FakeEmbedder:
+    """Deterministic vectors derived from a hash of the text; counts what it encodes."""
+
+    model_name = "fake-embedder"
+    dimension = 8
+    backend = "torch"
+
+    def __init__(self):
+        self.encoded = []
+
+    def _vector(self, text: str) -> list:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [byte / 255 for byte in digest[:self.dimension]]
+
+    def encode(self, texts, batch_size: int = None):
+        self.encoded.extend(texts)
+        return np.asarray([self._vector(text) for text in texts], dtype=np.float32).reshape(len(texts), self.dimension)
+
+    def embed_query(self, question: str) -> list:
+        return self._vector(question)
+
+    def count_tokens(self, texts) -> int:
+        return sum(len(text.split()) for text in texts)
+
+    def fingerprint(self) -> dict:
+        return {"embedding_model": self.model_name, "embedding_dimension": self.dimension}
+
+
+class FakeCollection:
+    """The parts of a Chroma collection the knowledge base and BM25 index use."""
+
+    def __init__(self, name: str = "documents"):
+        self.name = name
+        self.metadata = {}
+        self.rows = {}   # id -> (document, metadata)
+        self.deleted_filenames = []
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            self.rows[chunk_id] = (document, metadata)
+
+    def get(self, ids=None, where=None, limit=None, offset=0, include=()):
+        selected = [chunk_id for chunk_id in (ids if ids is not None else sorted(self.rows)) if chunk_id in self.rows]
+        if where is not None:
+            selected = [chunk_id for chunk_id in selected if self.rows[chunk_id][1]["filename"] == where["filename"]]
+        selected = selected[offset:offset + limit if limit else None]
+        return {
+            "ids": selected,
+            "documents": [self.rows[chunk_id][0] for chunk_id in selected],
+            "metadatas": [self.rows[chunk_id][1] for chunk_id in selected],
+        }
+
+    def delete(self, ids=None, where=None):
+        if where is not None:
+            self.deleted_filenames.append(where["filename"])
+            ids = self.get(where=where)["ids"]
+        for chunk_id in ids:
+            self.rows.pop(chunk_id, None)
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture
+def fake_collection():
+    return FakeCollection()
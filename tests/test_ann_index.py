@@ -0,0 +1,87 @@
+import uuid
+
+import numpy as np
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+import ann_index  # noqa: E402
+
+
+class BruteForceIndex(ann_index.ANNIndex):
+    """Exact search with the ANNIndex interface; records every k it is asked for."""
+
+    def __init__(self, dimension: int):
+        super().__init__(dimension, metric="l2")
+        self.vectors = {}
+        self.searches = []
+
+    def upsert(self, ids, embeddings):
+        self.vectors.update(zip(ids, np.asarray(embeddings, dtype=np.float32)))
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.vectors.pop(chunk_id, None)
+
+    def search(self, embeddings, k: int):
+        self.searches.append(k)
+        ids = list(self.vectors)
+        found_ids, found_distances = [], []
+        for embedding in np.asarray(embeddings, dtype=np.float32):
+            distances = [float(((self.vectors[chunk_id] - embedding) ** 2).sum()) for chunk_id in ids]
+            order = np.argsort(distances)[:k]
+            found_ids.append([ids[i] for i in order])
+            found_distances.append([distances[i] for i in order])
+        return found_ids, found_distances
+
+    def __len__(self):
+        return len(self.vectors)
+
+
+@pytest.fixture
+def indexed():
+    collection = chromadb.Client().create_collection(name=f"ann_{uuid.uuid4().hex}")
+    indexed = ann_index.IndexedCollection(collection, BruteForceIndex(2))
+    # 90 chunks of a big shared document close to the origin, 5 of a small
+    # namespace's document far away
+    ids = [f"chunk_{i}" for i in range(95)]
+    indexed.upsert(ids, [[float(i), 0.0] for i in range(95)], [f"text {i}" for i in ids],
+                   [{"filename": "doc_small" if i >= 90 else "doc_big"} for i in range(95)])
+    return indexed
+
+
+def test_query_without_filter_returns_the_nearest_chunks(indexed):
+    results = indexed.query([[0.0, 0.0]], n_results=3)
+    assert results["ids"] == [["chunk_0", "chunk_1", "chunk_2"]]
+    assert results["documents"][0][0] == "text chunk_0"
+    assert indexed.index.searches == [3]
+
+
+def test_namespace_filter_finds_chunks_beyond_the_first_fetch(indexed, monkeypatch):
+    monkeypatch.setattr(ann_index.settings, "ANN_FILTER_OVERFETCH", 4)
+    results = indexed.query([[0.0, 0.0]], n_results=3, where={"filename": {"$in": ["doc_small"]}})
+    assert results["ids"] == [["chunk_90", "chunk_91", "chunk_92"]]
+    assert all(metadata["filename"] == "doc_small" for metadata in results["metadatas"][0])
+    assert results["distances"][0] == [8100.0, 8281.0, 8464.0]
+
+
+def test_small_namespace_falls_back_to_a_filtered_chroma_query(indexed, monkeypatch):
+    monkeypatch.setattr(ann_index.settings, "ANN_FILTER_OVERFETCH", 4)
+    monkeypatch.setattr(ann_index.settings, "ANN_FILTER_MAX_FETCH", 20)
+    results = indexed.query([[0.0, 0.0]], n_results=3, where={"filename": {"$in": ["doc_small"]}})
+    assert results["ids"] == [["chunk_90", "chunk_91", "chunk_92"]]
+    assert results["distances"][0] == [8100.0, 8281.0, 8464.0]
+    assert results["metadatas"][0][0]["filename"] == "doc_small"
+    # One local search of 12 neighbours, then Chroma instead of 24, 48, 96
+    assert indexed.index.searches == [12]
+
+
+def test_namespace_with_fewer_chunks_than_asked_for(indexed):
+    results = indexed.query([[0.0, 0.0]], n_results=10, where={"filename": "doc_small"})
+    assert len(results["ids"][0]) == 5
+
+
+def test_deleted_chunks_leave_both_indexes(indexed):
+    indexed.delete(where={"filename": "doc_small"})
+    assert len(indexed.index) == 90
+    assert indexed.query([[0.0, 0.0]], n_results=3, where={"filename": "doc_small"})["ids"] == [[]]
@@ -0,0 +1,32 @@
+import answer_cache
+import collection_versions
+
+
+def test_answer_cache_matches_similar_questions_only():
+    cache = answer_cache.AnswerCache(max_entries=10, threshold=0.95, ttl=3600)
+    version = collection_versions.current("answers_similar")
+    cache.store("answers_similar", version, "How high is the net?", [1.0, 0.0], "88 cm", "rules.md")
+    assert cache.lookup("answers_similar", [0.99, 0.05]) == ("88 cm", "rules.md")
+    assert cache.lookup("answers_similar", [0.0, 1.0]) is None
+    assert cache.lookup("answers_other", [1.0, 0.0]) is None
+
+
+def test_answer_cache_invalidation_expiry_and_eviction(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = answer_cache.AnswerCache(max_entries=2, threshold=0.95, ttl=60)
+    version = collection_versions.current("answers_expiry")
+    cache.store("answers_expiry", version, "net", [1.0, 0.0, 0.0], "88 cm", "rules.md")
+    cache.store("answers_expiry", version, "court", [0.0, 1.0, 0.0], "20 x 10 m", "rules.md")
+    cache.store("answers_expiry", version, "serve", [0.0, 0.0, 1.0], "Underhand", "rules.md")
+    assert cache.stats()["evictions"] == 1
+    assert cache.lookup("answers_expiry", [1.0, 0.0, 0.0]) is None
+
+    now[0] += 61
+    assert cache.lookup("answers_expiry", [0.0, 1.0, 0.0]) is None
+    assert cache.stats()["expirations"] == 2
+
+    cache.store("answers_expiry", version, "net", [1.0, 0.0, 0.0], "88 cm", "rules.md")
+    collection_versions.bump("answers_expiry")
+    assert cache.lookup("answers_expiry", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
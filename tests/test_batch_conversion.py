@@ -0,0 +1,32 @@
+import batch_conversion
+import conversion_cache
+
+
+def test_cached_files_are_written_without_starting_a_worker(tmp_path, monkeypatch):
+    cache = conversion_cache.ConversionCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    monkeypatch.setattr(conversion_cache, "cache", cache)
+    source = tmp_path / "rules.docx"
+    source.write_bytes(b"not really a docx")
+    cache.put(cache.key(source, conversion_cache.converter_options("word", False)), "# Padel rules")
+
+    def no_workers(*args, **kwargs):
+        raise AssertionError("a worker was started for a cached file")
+
+    monkeypatch.setattr(batch_conversion.multiprocessing, "get_context", no_workers)
+    results = batch_conversion.convert_batch([source], tmp_path / "out", do_ocr=False)
+
+    assert [r.as_dict()["cached"] for r in results] == [True]
+    assert (tmp_path / "out" / "rules.md").read_text(encoding="utf-8") == "# Padel rules"
+
+
+def test_a_cache_entry_only_matches_the_same_options(tmp_path, monkeypatch):
+    cache = conversion_cache.ConversionCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    monkeypatch.setattr(conversion_cache, "cache", cache)
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"%PDF-1.4")
+    cache.put(cache.key(source, conversion_cache.converter_options("pdf", False)), "# Without OCR")
+
+    assert conversion_cache.cached_markdown(source, do_ocr=False) == "# Without OCR"
+    assert conversion_cache.cached_markdown(source, do_ocr=True) is None
+    # Plain text is read directly, never cached
+    assert conversion_cache.cached_markdown(tmp_path / "notes.txt", do_ocr=False) is None
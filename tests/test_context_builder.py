@@ -0,0 +1,49 @@
+import context_builder
+
+
+def count_tokens(texts) -> list:
+    # One token per word, plus the end-of-sequence token
+    return [len(text.split()) + 1 for text in texts]
+
+
+def build_prompt(question: str, docs) -> str:
+    context = "\n\n".join(f"Document {i + 1}: {doc}" for i, doc in enumerate(docs))
+    return f"Context:\n{context}\n\nQuestion: {question}\n\nAnswer:"
+
+
+def test_strip_overlap_drops_text_a_previous_chunk_has():
+    shared = "the glass walls can be used after the ball bounces"
+    first = "Padel is played in doubles and " + shared
+    second = shared + " on the player's own side of the court"
+    assert context_builder.strip_overlap(second, [first], max_overlap=200) == "on the player's own side of the court"
+    assert context_builder.strip_overlap(shared, [first]) == ""
+    assert context_builder.strip_overlap("Unrelated text.", [first]) == "Unrelated text."
+
+
+def test_everything_fits_within_a_large_budget():
+    docs = ["The net is 88 cm high.", "A court is 20 by 10 metres."]
+    context = context_builder.build_context("How high is the net?", docs, build_prompt, count_tokens, budget=100)
+    assert context.excerpts == docs
+    assert context.trimmed == context.dropped == 0
+    assert context.tokens == count_tokens([context.prompt])[0] <= 100
+
+
+def test_chunk_that_does_not_fit_is_cut_to_whole_sentences():
+    docs = ["The net is 88 cm high.", "Serve underhand. Bounce the ball first. Aim diagonally into the box."]
+    base = count_tokens([build_prompt("How do you serve?", [])])[0]
+    budget = base + count_tokens(["Document 1: " + docs[0]])[0] + 6
+    context = context_builder.build_context("How do you serve?", docs, build_prompt, count_tokens, budget)
+    assert context.excerpts[0] == docs[0]
+    assert context.excerpts[1] == "Serve underhand."
+    assert context.trimmed == 1
+    assert context.tokens <= budget
+
+
+def test_duplicates_and_chunks_with_no_room_are_dropped():
+    docs = ["The net is 88 cm high.", "The net is 88 cm high.", "Another fact that will never fit in."]
+    base = count_tokens([build_prompt("Net?", [])])[0]
+    budget = base + count_tokens(["Document 1: " + docs[0]])[0]
+    context = context_builder.build_context("Net?", docs, build_prompt, count_tokens, budget)
+    assert context.excerpts == [docs[0]]
+    assert context.dropped == 2
+    assert context.as_dict()["prompt_tokens"] <= budget
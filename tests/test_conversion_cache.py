@@ -0,0 +1,45 @@
+import os
+
+import conversion_cache
+
+
+def test_hit_after_put_and_miss_for_other_options(tmp_path):
+    cache = conversion_cache.ConversionCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    source = tmp_path / "rules.pdf"
+    source.write_bytes(b"%PDF-1.4 padel rules")
+    key = cache.key(source, {"format": "pdf", "do_ocr": False})
+
+    assert cache.get(key) is None
+    cache.put(key, "# Padel rules")
+    assert cache.get(key) == "# Padel rules"
+    assert cache.get(cache.key(source, {"format": "pdf", "do_ocr": True})) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_key_follows_the_file_bytes(tmp_path):
+    cache = conversion_cache.ConversionCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    first, copy, other = tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "c.pdf"
+    first.write_bytes(b"same bytes")
+    copy.write_bytes(b"same bytes")
+    other.write_bytes(b"other bytes")
+    assert cache.key(first, {}) == cache.key(copy, {})
+    assert cache.key(first, {}) != cache.key(other, {})
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(tmp_path):
+    cache = conversion_cache.ConversionCache(str(tmp_path / "cache"), max_bytes=1 << 20)
+    for age, key in enumerate(["old", "used", "new"]):
+        cache.put(key, key * 40)
+        # Distinct modification times, oldest first
+        os.utime(cache._entry(key), (1000 + age, 1000 + age))
+    os.utime(cache._entry("used"), (2000, 2000))
+    cache.max_bytes = 300
+    cache.evict()
+
+    assert cache.get("old") is None
+    assert cache.get("used") == "used" * 40
+    assert cache.stats()["evictions"] == 1
+
+
+def test_a_zero_size_limit_disables_the_cache(tmp_path):
+    assert not conversion_cache.ConversionCache(str(tmp_path), max_bytes=0).enabled
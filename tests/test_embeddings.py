@@ -0,0 +1,57 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+import embeddings  # noqa: E402
+
+
+class FakeModel:
+    """Takes 20 ms per call, like a small batch on a CPU."""
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.batches = []
+
+    def encode(self, texts, batch_size, convert_to_numpy, show_progress_bar):
+        assert self.embedder._lock.locked()
+        self.batches.append(list(texts))
+        time.sleep(0.02)
+        return np.full((len(texts), 2), len(self.batches), dtype=np.float64)
+
+
+@pytest.fixture
+def embedder():
+    embedder = embeddings.Embedder.__new__(embeddings.Embedder)
+    embedder.model_name = "fake"
+    embedder.dimension = 2
+    embedder._lock = threading.Lock()
+    embedder.model = FakeModel(embedder)
+    return embedder
+
+
+def test_encode_locks_the_model_one_batch_at_a_time(embedder):
+    chunks = [f"chunk {i}" for i in range(5)]
+    matrix = embedder.encode(chunks, batch_size=2)
+
+    assert matrix.dtype == np.float32 and matrix.shape == (5, 2)
+    assert embedder.model.batches == [chunks[0:2], chunks[2:4], chunks[4:5]]
+
+
+def test_questions_are_embedded_between_the_batches_of_a_document(embedder):
+    document = threading.Thread(target=embedder.encode, args=([f"chunk {i}" for i in range(50)], 2))
+    document.start()
+    time.sleep(0.05)
+    embedder.embed_query("How high is the net?")
+    # Answered while the document (25 batches, ~0.5 s) is still being embedded
+    assert document.is_alive()
+    document.join()
+    assert ["How high is the net?"] in embedder.model.batches
+
+
+def test_encode_of_nothing_skips_the_model(embedder):
+    assert embedder.encode([]).shape == (0, 2)
+    assert embedder.model.batches == []
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("transformers")
+
+import generation  # noqa: E402
+import onnx_backend  # noqa: E402
+
+
+def test_failed_onnx_export_falls_back_to_torch(monkeypatch, caplog):
+    def export_fails(model_name):
+        raise RuntimeError("quantization failed")
+
+    loaded = []
+    monkeypatch.setattr(generation.settings, "INFERENCE_BACKEND", "onnx")
+    monkeypatch.setattr(onnx_backend, "load_seq2seq", export_fails)
+    monkeypatch.setattr(generation, "pipeline", lambda task, model, **kwargs: loaded.append(model) or object())
+
+    registry = generation.GeneratorRegistry()
+    registry._load(generation.DEFAULT_TASK, "tiny-t5")
+
+    assert loaded == ["tiny-t5"]
+    assert registry.metrics()[f"{generation.DEFAULT_TASK}:tiny-t5"]["backend"] == "torch"
+    assert "ONNX backend unavailable for tiny-t5" in caplog.text
@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("langchain")
+
+import ingestion  # noqa: E402
+import lexical_index  # noqa: E402
+
+
+def paragraph(tag) -> str:
+    """Too long to share a chunk with a neighbouring paragraph."""
+    return f"Paragraph {tag}. " + " ".join(f"padel{tag}word{j}" for j in range(40))
+
+
+PARAGRAPHS = [paragraph(i) for i in range(6)]
+
+
+@pytest.fixture
+def collection():
+    return chromadb.Client().create_collection(name=f"test_{uuid.uuid4().hex}")
+
+
+def text(paragraphs) -> str:
+    return "\n\n".join(paragraphs)
+
+
+def stored_ids(collection, filename: str) -> set:
+    return set(collection.get(where={"filename": filename}, include=[])["ids"])
+
+
+def test_chunk_ids_follow_content_not_position():
+    ids, metadatas = ingestion.chunk_rows("rules.md", ["same", "other", "same"])
+    assert ids[0] != ids[2]
+    assert ids[0].rsplit("_", 1)[0] == ids[2].rsplit("_", 1)[0]
+    shifted, _ = ingestion.chunk_rows("rules.md", ["new", "same", "other", "same"])
+    assert shifted[1:] == ids
+    assert [m["chunk_index"] for m in metadatas] == [0, 1, 2]
+
+
+def test_reingesting_only_embeds_changed_chunks(collection, embedder):
+    first = ingestion.ingest_documents(collection, embedder, [("rules.md", text(PARAGRAPHS))])
+    assert first.added_chunks == first.chunks == len(PARAGRAPHS)
+
+    again = ingestion.ingest_documents(collection, embedder, [("rules.md", text(PARAGRAPHS))])
+    assert again.added_chunks == 0 and again.reused_chunks == len(PARAGRAPHS)
+
+    edited = [paragraph("s")] + PARAGRAPHS[:3] + PARAGRAPHS[4:]
+    embedder.encoded.clear()
+    report = ingestion.ingest_documents(collection, embedder, [("rules.md", text(edited))])
+    assert embedder.encoded == [edited[0]]
+    assert report.added_chunks == 1
+    assert report.removed_chunks == 1
+    assert len(stored_ids(collection, "rules.md")) == len(edited)
+    # Chunks that moved know their new position
+    rows = collection.get(where={"filename": "rules.md"}, include=["documents", "metadatas"])
+    positions = {document: metadata["chunk_index"] for document, metadata in zip(rows["documents"], rows["metadatas"])}
+    assert positions[PARAGRAPHS[0]] == 1
+
+
+def test_streamed_sections_are_searchable_as_they_arrive(collection, embedder):
+    ingestion.ingest_documents(collection, embedder, [("manual.pdf", text(PARAGRAPHS + [paragraph("x")]))])
+    sections = [("pages 1-2", text(PARAGRAPHS[:3])), ("pages 3-4", text(PARAGRAPHS[3:]))]
+    stream = ingestion.ingest_stream(collection, embedder, "manual.pdf", sections)
+
+    label, report = next(stream)
+    assert label == "pages 1-2"
+    assert report.chunks == 3
+    for _ in stream:
+        pass
+    assert report.chunks == len(PARAGRAPHS)
+    assert report.added_chunks == 0
+    assert report.removed_chunks == 1
+    assert len(stored_ids(collection, "manual.pdf")) == len(PARAGRAPHS)
+
+
+def test_new_version_reuses_vectors_of_the_old_one(collection, embedder):
+    ingestion.ingest_documents(collection, embedder, [("doc_v1", text(PARAGRAPHS))])
+    edited = PARAGRAPHS[:-1] + [paragraph("r")]
+    embedder.encoded.clear()
+    report = ingestion.ingest_documents(collection, embedder, [("doc_v2", text(edited))], reuse_from=["doc_v1"])
+    assert embedder.encoded == [edited[-1]]
+    assert report.reused_chunks == len(PARAGRAPHS) - 1
+    assert len(stored_ids(collection, "doc_v2")) == len(edited)
+    # The old version is left for its owner to delete
+    assert len(stored_ids(collection, "doc_v1")) == len(PARAGRAPHS)
+
+
+def test_writes_feed_a_loaded_bm25_index(collection, embedder):
+    ingestion.ingest_documents(collection, embedder, [("rules.md", text(PARAGRAPHS[:2]))])
+    index = lexical_index.get_index(collection)
+    assert len(index) == 2
+
+    ingestion.ingest_documents(collection, embedder, [("rules.md", text(PARAGRAPHS[1:3]))])
+    assert len(index) == 2
+    [(chunk_id, _)] = index.search("padel2word5", 5)
+    assert chunk_id in stored_ids(collection, "rules.md")
+    assert index.search("padel0word5", 5) == []
+    lexical_index.forget(collection.name)
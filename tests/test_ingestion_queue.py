@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("docling")
+
+import document_store  # noqa: E402
+import ingestion_queue  # noqa: E402
+import knowledge_base  # noqa: E402
+from ingestion import IngestReport  # noqa: E402
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch, fake_collection, embedder):
+    monkeypatch.setattr(document_store, "store", document_store.DocumentStore(str(tmp_path / "store")))
+    monkeypatch.setattr(knowledge_base, "delete_document",
+                        lambda collection, filename: collection.delete(where={"filename": filename}))
+    base = knowledge_base.KnowledgeBase("documents", str(tmp_path))
+    monkeypatch.setattr(base, "collection", lambda: fake_collection)
+    monkeypatch.setattr(ingestion_queue, "convert_to_markdown", lambda path: "Padel is played in doubles.")
+    monkeypatch.setattr(ingestion_queue, "get_client", lambda: None)
+    monkeypatch.setattr(ingestion_queue, "get_or_create_collection", lambda client, name: fake_collection)
+    monkeypatch.setattr(ingestion_queue, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(ingestion_queue, "max_upsert_batch", lambda client: 100)
+
+    def ingest_documents(collection, embedder, docs, **kwargs):
+        [(key, text)] = docs
+        collection.upsert(ids=[f"{key}_chunk_0"], documents=[text], metadatas=[{"filename": key}])
+        report = IngestReport()
+        report.documents = report.chunks = 1
+        return report
+
+    monkeypatch.setattr(ingestion_queue, "ingest_documents", ingest_documents)
+    return base
+
+
+def file_job(data: bytes = b"rules"):
+    job = ingestion_queue.Job([("rules.md", data)], "documents", "alice")
+    job.files[0].key = knowledge_base.document_key(data)
+    return job, job.files[0]
+
+
+def test_ingested_document_is_attached(base, fake_collection):
+    job, upload = file_job()
+    ingestion_queue.jobs._ingest(job, upload, base, "rules.md")
+    base.flush()
+    assert base.key_of("alice", "rules.md") == upload.key
+    assert base.has(upload.key)
+
+
+def test_failed_ingest_removes_the_chunks_it_wrote(base, fake_collection, monkeypatch):
+    def disk_full(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(document_store.store, "put", disk_full)
+    job, upload = file_job()
+    with pytest.raises(OSError):
+        ingestion_queue.jobs._ingest(job, upload, base, "rules.md")
+    base.flush()
+    assert fake_collection.deleted_filenames == [upload.key]
+    assert fake_collection.rows == {}
+    assert base.count("alice") == 0
@@ -0,0 +1,161 @@
+import threading
+
+import pytest
+
+import collection_versions
+import document_store
+import knowledge_base
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch, fake_collection):
+    monkeypatch.setattr(document_store, "store", document_store.DocumentStore(str(tmp_path / "store")))
+    monkeypatch.setattr(knowledge_base, "delete_document",
+                        lambda collection, filename: collection.delete(where={"filename": filename}))
+    base = knowledge_base.KnowledgeBase("documents", str(tmp_path))
+    monkeypatch.setattr(base, "collection", lambda: fake_collection)
+    return base
+
+
+def index(base, fake_collection, key: str, text: str = "Padel is played in doubles."):
+    fake_collection.upsert(ids=[f"{key}_chunk_0"], documents=[text], metadatas=[{"filename": key}])
+    document_store.store.put(base.collection_name, key, text)
+
+
+def test_shared_document_is_deleted_with_its_last_reference(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    base.attach("alice", "rules.md", "doc_a")
+    base.attach("bob", "padel-rules.md", "doc_a")
+    assert base.stats()["deduplicated"] == 1
+    assert base.document("alice", "rules.md")["shared_with"] == 1
+
+    base.detach("alice", "rules.md")
+    base.flush()
+    assert fake_collection.deleted_filenames == []
+    assert base.has("doc_a")
+
+    base.detach("bob", "padel-rules.md")
+    base.flush()
+    assert fake_collection.deleted_filenames == ["doc_a"]
+    assert not base.has("doc_a")
+    assert base.stats()["documents"] == 0
+
+
+def test_attach_replaces_and_releases_the_previous_version(base, fake_collection):
+    index(base, fake_collection, "doc_v1")
+    index(base, fake_collection, "doc_v2")
+    base.attach("alice", "rules.md", "doc_v1")
+    base.attach("alice", "rules.md", "doc_v2")
+    base.flush()
+    assert base.key_of("alice", "rules.md") == "doc_v2"
+    assert fake_collection.deleted_filenames == ["doc_v1"]
+
+
+def test_writes_bump_the_namespace_version(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    scope, other = base.scope("alice"), base.scope("bob")
+    before, other_before = collection_versions.current(scope), collection_versions.current(other)
+    base.attach("alice", "rules.md", "doc_a")
+    attached = collection_versions.current(scope)
+    base.detach("alice", "rules.md")
+    assert before < attached < collection_versions.current(scope)
+    # Other namespaces keep their cached results
+    assert collection_versions.current(other) == other_before
+
+
+def test_detach_does_not_wait_for_the_write_lock(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    base.attach("alice", "rules.md", "doc_a")
+    with base.lock:
+        detach = threading.Thread(target=base.detach, args=("alice", "rules.md"))
+        detach.start()
+        detach.join(timeout=5)
+        assert not detach.is_alive()
+        assert base.count("alice") == 0
+        # The chunks go once the writer is done
+        assert fake_collection.deleted_filenames == []
+    base.flush()
+    assert fake_collection.deleted_filenames == ["doc_a"]
+
+
+def test_restore_puts_back_the_replaced_version(base, fake_collection):
+    index(base, fake_collection, "doc_v1")
+    base.attach("alice", "rules.md", "doc_v1")
+    previous = base.entry("alice", "rules.md")
+
+    base.pin("doc_v1")
+    base.attach("alice", "rules.md", "doc_v2")
+    base.restore("alice", "rules.md", "doc_v2", previous)
+    base.unpin("doc_v1")
+    base.flush()
+
+    assert base.key_of("alice", "rules.md") == "doc_v1"
+    assert "doc_v1" not in fake_collection.deleted_filenames
+    assert "doc_v2" in fake_collection.deleted_filenames
+
+
+def test_restore_leaves_a_newer_upload_alone(base):
+    base.attach("alice", "rules.md", "doc_v2")
+    base.attach("alice", "rules.md", "doc_v3")
+    base.restore("alice", "rules.md", "doc_v2")
+    assert base.key_of("alice", "rules.md") == "doc_v3"
+
+
+def test_pinned_document_outlives_its_references(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    base.attach("alice", "rules.md", "doc_a")
+    base.pin("doc_a")
+    base.detach("alice", "rules.md")
+    base.flush()
+    assert fake_collection.deleted_filenames == []
+    base.unpin("doc_a")
+    base.flush()
+    assert fake_collection.deleted_filenames == ["doc_a"]
+
+
+def test_where_and_source_name(base):
+    base.attach("alice", "rules.md", "doc_a")
+    assert base.where("alice") == {"filename": "doc_a"}
+    base.attach("alice", "rackets.md", "doc_b")
+    assert base.where("alice") == {"filename": {"$in": ["doc_a", "doc_b"]}}
+    base.attach("bob", "padel-rules.md", "doc_a")
+
+    assert base.source_name("bob", "doc_a") == "padel-rules.md"
+    # Without a namespace, the name it was first uploaded under
+    assert base.source_name(None, "doc_a") == "rules.md"
+    assert base.source_name(None, "doc_unknown") == "doc_unknown"
+
+
+def test_registry_survives_a_restart(base, tmp_path):
+    base.attach("alice", "rules.md", "doc_a")
+    reopened = knowledge_base.KnowledgeBase("documents", str(tmp_path))
+    assert reopened.key_of("alice", "rules.md") == "doc_a"
+    assert reopened.stats()["documents"] == 1
+
+
+def test_stored_copy_without_chunks_is_not_reused(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    base.attach("alice", "rules.md", "doc_a")
+    # The vector store was lost, the document store wasn't
+    fake_collection.rows.clear()
+    assert not base.has("doc_a")
+    assert document_store.store.get(base.collection_name, "doc_a") is None
+
+
+def test_in_memory_store_keeps_the_registry_in_memory(base, tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base.settings, "VECTOR_STORE", "memory")
+    base.attach("alice", "rules.md", "doc_a")
+    assert not base.registry_path.exists()
+    assert knowledge_base.KnowledgeBase("documents", str(tmp_path)).count("alice") == 0
+
+
+def test_pins_are_not_counted_as_shares(base, fake_collection):
+    index(base, fake_collection, "doc_a")
+    base.pin("doc_a")
+    assert base.stats()["documents"] == 0
+    base.attach("alice", "rules.md", "doc_a")
+    assert base.document("alice", "rules.md")["shared_with"] == 0
+    assert base.stats()["shared_documents"] == 0
+    base.unpin("doc_a")
+    base.flush()
+    assert fake_collection.deleted_filenames == []
@@ -0,0 +1,69 @@
+import lexical_index
+
+
+def make_index() -> lexical_index.BM25Index:
+    index = lexical_index.BM25Index()
+    index.add(
+        ["players_0", "players_1", "court_0"],
+        ["Galán and Lebrón won the final.", "Coello and Tapia are ranked first.", "The net is 88 cm high."],
+        [{"filename": "players.md"}, {"filename": "players.md"}, {"filename": "court.md"}],
+    )
+    return index
+
+
+def test_tokenize_folds_case_and_accents_and_drops_stopwords():
+    assert lexical_index.tokenize("Who is Galán?") == ["galan"]
+    assert lexical_index.tokenize("The net is 88 cm") == ["net", "88", "cm"]
+
+
+def test_search_ranks_lexical_matches():
+    index = make_index()
+    assert [chunk_id for chunk_id, _ in index.search("galan lebron", 5)] == ["players_0"]
+    assert [chunk_id for chunk_id, _ in index.search("88 cm", 5)] == ["court_0"]
+    assert index.search("racket", 5) == []
+    assert index.search("galan", 5, filenames=["court.md"]) == []
+
+
+def test_deletes_remove_every_posting_of_the_chunk():
+    index = make_index()
+    index.delete(["court_0"])
+    assert len(index) == 2
+    assert "net" not in index._postings
+    index.delete_file("players.md")
+    assert len(index) == 0
+    assert index._postings == {} and index._files == {}
+    assert index._total_length == 0
+
+
+def test_add_replaces_a_chunk_with_the_same_id():
+    index = make_index()
+    index.add(["court_0"], ["The court is 20 by 10 metres."], [{"filename": "court.md"}])
+    assert len(index) == 3
+    assert index.search("88", 5) == []
+    assert [chunk_id for chunk_id, _ in index.search("metres", 5)] == ["court_0"]
+
+
+def test_index_is_loaded_once_then_fed_by_writers(fake_collection):
+    fake_collection.name = "lexical_hooks"
+    fake_collection.upsert(ids=["court_0"], documents=["The net is 88 cm high."], metadatas=[{"filename": "court.md"}])
+    lexical_index.added(fake_collection.name, ["ignored"], ["Not loaded yet"], [{"filename": "x.md"}])
+    index = lexical_index.get_index(fake_collection)
+    assert len(index) == 1
+
+    lexical_index.added(fake_collection.name, ["players_0"], ["Galán and Lebrón"], [{"filename": "players.md"}])
+    assert lexical_index.get_index(fake_collection) is index
+    assert [chunk_id for chunk_id, _ in index.search("lebron", 5)] == ["players_0"]
+    lexical_index.deleted_file(fake_collection.name, "court.md")
+    lexical_index.deleted(fake_collection.name, ["players_0"])
+    assert len(index) == 0
+
+    lexical_index.forget(fake_collection.name)
+    assert lexical_index.get_index(fake_collection) is not index
+
+
+def test_reciprocal_rank_fusion_weights():
+    vector, lexical = ["a", "b", "c"], ["c", "d"]
+    assert lexical_index.reciprocal_rank_fusion(vector, lexical, weight=0.0, k=60)[:3] == ["a", "b", "c"]
+    assert lexical_index.reciprocal_rank_fusion(vector, lexical, weight=1.0, k=60)[:2] == ["c", "d"]
+    # Found by both: ahead of the ones only one side ranks first
+    assert lexical_index.reciprocal_rank_fusion(vector, lexical, weight=0.5, k=1)[0] == "c"
@@ -0,0 +1,80 @@
+import uuid
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+
+import qa  # noqa: E402
+import settings  # noqa: E402
+
+CHUNKS = {
+    "rules.md_chunk_net_0": ("The net is 88 cm high at the centre.", [1.0, 0.0, 0.0]),
+    "players.md_chunk_coello_0": ("Arturo Coello is ranked number one.", [0.0, 1.0, 0.0]),
+}
+
+
+class FakeGenerator:
+    max_input_tokens = 512
+
+    def __init__(self):
+        self.calls = []
+
+    def count_tokens(self, texts) -> list:
+        return [len(text.split()) + 1 for text in texts]
+
+    def __call__(self, prompts, batch_size: int = None):
+        self.calls.append((list(prompts), batch_size))
+        return [[{"generated_text": f" answer {i} "}] for i in range(len(prompts))]
+
+
+class QuestionEmbedder:
+    """Embeds each question onto the chunk that answers it."""
+
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_queries(self, questions) -> list:
+        return [self.vectors[question] for question in questions]
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DOCUMENT_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "vector")
+    monkeypatch.setattr(settings, "RERANK", False)
+    monkeypatch.setattr(settings, "DISTANCE_THRESHOLD", 0.5)
+    collection = chromadb.Client().create_collection(name=f"qa_{uuid.uuid4().hex}")
+    collection.upsert(ids=list(CHUNKS), documents=[doc for doc, _ in CHUNKS.values()],
+                      embeddings=[vector for _, vector in CHUNKS.values()],
+                      metadatas=[{"filename": chunk_id.split("_chunk_")[0]} for chunk_id in CHUNKS])
+    return collection
+
+
+def test_answer_batch_generates_all_answers_in_one_call(collection, monkeypatch):
+    generator = FakeGenerator()
+    monkeypatch.setattr(qa, "answer_generator", lambda: generator)
+    monkeypatch.setattr(qa, "get_embedder", lambda: QuestionEmbedder({
+        "How high is the net?": [1.0, 0.0, 0.0],
+        "Who is number one?": [0.0, 1.0, 0.0],
+        "How do I bake bread?": [0.0, 0.0, 1.0],
+    }))
+
+    rows = qa.answer_batch(collection, ["How high is the net?", "Who is number one?", "How do I bake bread?"],
+                           n_results=1, batch_size=8)
+
+    assert [row["source"] for row in rows] == ["rules.md", "players.md", qa.NO_SOURCE]
+    assert [row["answer"] for row in rows] == ["answer 0", "answer 1", qa.NO_ANSWER]
+    assert rows[0]["ids"] == ["rules.md_chunk_net_0"]
+    assert rows[0]["prompt_tokens"] > 0 and rows[2]["prompt_tokens"] == 0
+    # Off-topic questions never reach the generator
+    [(prompts, batch_size)] = generator.calls
+    assert len(prompts) == 2 and batch_size == 8
+    assert "88 cm" in prompts[0]
+
+
+def test_answer_batch_of_an_empty_namespace_answers_nothing(collection, monkeypatch):
+    monkeypatch.setattr(qa, "answer_generator", lambda: pytest.fail("nothing to generate"))
+    rows = qa.answer_batch(collection, ["How high is the net?"], namespace="nobody")
+    assert rows == [{"question": "How high is the net?", "answer": qa.NO_ANSWER, "source": qa.NO_SOURCE,
+                     "ids": [], "distances": [], "prompt_tokens": 0}]
+    assert qa.answer_batch(collection, []) == []
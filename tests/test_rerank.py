@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+import rerank
+
+RETRIEVED = {
+    "ids": ["a", "b", "c"],
+    "documents": ["short", "the longest document", "medium text"],
+    "distances": [0.1, 0.2, 0.3],
+}
+
+
+class FakeReranker:
+    """Scores documents by length, once `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def score(self, question: str, documents) -> list:
+        self.release.wait(timeout=5)
+        return [float(len(document)) for document in documents]
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    reranker = FakeReranker()
+    monkeypatch.setattr(rerank, "_reranker", reranker)
+    yield reranker
+    reranker.release.set()
+    # Let a scoring left running in the background finish
+    rerank._busy.acquire(timeout=5)
+    rerank._busy.release()
+
+
+def test_scores_within_budget_reorder_the_candidates(reranker):
+    reranker.release.set()
+    top = rerank.rerank("question", RETRIEVED, n_results=2, budget_ms=0)
+    assert top["reranked"]
+    assert top["ids"] == ["b", "c"]
+    assert top["distances"] == [0.2, 0.3]
+
+
+def test_missing_the_budget_keeps_the_first_stage_order(reranker):
+    top = rerank.rerank("question", RETRIEVED, n_results=2, budget_ms=20)
+    assert not top["reranked"]
+    assert top["ids"] == ["a", "b"]
+
+    # Still scoring the previous question: fall back without waiting
+    busy = rerank.rerank("question", RETRIEVED, n_results=2, budget_ms=1000)
+    assert not busy["reranked"] and busy["ids"] == ["a", "b"]
+
+
+def test_scoring_errors_fall_back(monkeypatch):
+    class Broken:
+        def score(self, question, documents):
+            raise RuntimeError("model failed")
+
+    monkeypatch.setattr(rerank, "_reranker", Broken())
+    top = rerank.rerank("question", RETRIEVED, n_results=1, budget_ms=0)
+    assert not top["reranked"] and top["ids"] == ["a"]
+
+
+def test_a_single_candidate_needs_no_scoring():
+    single = {key: values[:1] for key, values in RETRIEVED.items()}
+    assert rerank.rerank("question", single, n_results=3)["ids"] == ["a"]
@@ -0,0 +1,46 @@
+import collection_versions
+import retrieval_cache
+
+RETRIEVED = {"ids": ["padel2_chunk_0"], "documents": ["The net is 88 cm high."], "distances": [0.4]}
+
+
+def test_retrieval_cache_hits_normalized_questions():
+    cache = retrieval_cache.RetrievalCache(max_entries=10)
+    version = collection_versions.current("cache_hits")
+    cache.put("cache_hits", version, "How high is the net?", 3, RETRIEVED)
+    assert cache.get("cache_hits", "  how HIGH is the net ", 3) is RETRIEVED
+    assert cache.get("cache_hits", "How high is the net?", 5) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_retrieval_cache_drops_entries_from_older_versions():
+    cache = retrieval_cache.RetrievalCache(max_entries=10)
+    version = collection_versions.current("cache_stale")
+    cache.put("cache_stale", version, "How high is the net?", 3, RETRIEVED)
+    collection_versions.bump("cache_stale")
+    assert cache.get("cache_stale", "How high is the net?", 3) is None
+    assert cache.stats()["stale"] == 1
+    # Results computed before a write never get in
+    cache.put("cache_stale", version, "How high is the net?", 3, RETRIEVED)
+    assert cache.get("cache_stale", "How high is the net?", 3) is None
+
+
+def test_retrieval_cache_evicts_least_recently_used():
+    cache = retrieval_cache.RetrievalCache(max_entries=2)
+    version = collection_versions.current("cache_lru")
+    for question in ("first", "second"):
+        cache.put("cache_lru", version, question, 3, RETRIEVED)
+    cache.get("cache_lru", "first", 3)
+    cache.put("cache_lru", version, "third", 3, RETRIEVED)
+    assert cache.get("cache_lru", "second", 3) is None
+    assert cache.get("cache_lru", "first", 3) is RETRIEVED
+
+
+def test_query_embeddings_are_computed_once(embedder):
+    cache = retrieval_cache.RetrievalCache(max_entries=10)
+    calls = []
+    embed_query = embedder.embed_query
+    embedder.embed_query = lambda question: calls.append(question) or embed_query(question)
+    first = cache.query_embedding(embedder, "Who is Arturo Coello?")
+    assert cache.query_embedding(embedder, "who is arturo coello") == first
+    assert calls == ["Who is Arturo Coello?"]
@@ -0,0 +1,333 @@
+"""
+Chroma client and collection helpers.
+
+All sessions share one client per process. In "persistent" mode the index
+lives under settings.VECTOR_STORE_DIR, so a restart just reopens it instead of
+re-converting and re-embedding every document.
+
+Every collection records the embedding model and dimension it was built with
+in its metadata, so a collection is never queried with vectors from a
+different model than the one that indexed it.
+
+New collections get the HNSW parameters of an index profile (see ann_index).
+With settings.ANN_BACKEND set to "hnswlib" or "faiss", the collections
+returned here search a local index instead of Chroma's own.
+
+Maintenance commands for long-running deployments:
+
+    python vectorstore.py stats
+    python vectorstore.py compact
+
+compact swaps every collection for a rebuilt copy, so it refuses to run while
+another process (the app, batch_qa.py) has the persistent store open: their
+collection handles would point at the deleted originals. Stop the app first.
+A compaction that was interrupted is finished (or rolled back) the next time
+the store is opened.
+"""
+import argparse
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import chromadb
+
+import ann_index
+import collection_versions
+import lexical_index
+import settings
+from embeddings import get_embedder
+from ingestion import max_upsert_batch, upsert_batched
+
+
+class EmbeddingMismatchError(ValueError):
+    pass
+
+
+COMPACT_SUFFIX = "__compact"
+
+_client = None
+_client_lock = threading.Lock()
+client_open_seconds = 0.0
+
+
+class StoreInUseError(RuntimeError):
+    pass
+
+
+def get_client():
+    """The process-wide Chroma client, opened on first use."""
+    global _client, client_open_seconds
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                start = time.perf_counter()
+                if settings.VECTOR_STORE == "persistent":
+                    Path(settings.VECTOR_STORE_DIR).mkdir(parents=True, exist_ok=True)
+                    client = chromadb.PersistentClient(path=settings.VECTOR_STORE_DIR)
+                    recover_compaction(client)
+                    _mark_in_use()
+                else:
+                    client = chromadb.Client()
+                client_open_seconds = time.perf_counter() - start
+                _client = client
+    return _client
+
+
+def _users_dir() -> Path:
+    return Path(settings.VECTOR_STORE_DIR) / "in_use"
+
+
+def _mark_in_use():
+    """Register this process as a user of the persistent store until it exits."""
+    marker = _users_dir() / str(os.getpid())
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    atexit.register(marker.unlink, missing_ok=True)
+
+
+def other_users() -> list:
+    """Pids of other live processes that have the persistent store open."""
+    pids = []
+    for marker in _users_dir().glob("*"):
+        pid = int(marker.name) if marker.name.isdigit() else None
+        if pid is None or pid == os.getpid():
+            continue
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            # Left behind by a process that crashed
+            marker.unlink(missing_ok=True)
+            continue
+        except PermissionError:
+            pass
+        pids.append(pid)
+    return pids
+
+
+def recover_compaction(client) -> list:
+    """
+    Clean up after a compaction that was interrupted: a copy whose original
+    still exists is dropped, one whose original was already deleted takes
+    its place. Returns the names of the collections that were restored.
+    """
+    names = {getattr(listed, "name", listed) for listed in client.list_collections()}
+    restored = []
+    for tmp_name in sorted(name for name in names if name.endswith(COMPACT_SUFFIX)):
+        name = tmp_name[:-len(COMPACT_SUFFIX)]
+        if name in names:
+            client.delete_collection(name=tmp_name)
+        else:
+            client.get_collection(name=tmp_name).modify(name=name)
+            restored.append(name)
+    return restored
+
+
+def _settable_metadata(metadata):
+    # Chroma doesn't allow changing the hnsw:* index settings after creation
+    return {k: v for k, v in (metadata or {}).items() if not k.startswith("hnsw:")}
+
+
+def create_collection(client, name: str, embedder=None, metadata: dict = None, profile: str = None, metric: str = None):
+    """
+    New collection indexed with an HNSW profile ("fast", "balanced" or
+    "high-recall", settings.INDEX_PROFILE by default) and distance metric.
+    hnsw:* keys in `metadata` win over the profile.
+    """
+    embedder = embedder or get_embedder()
+    collection = client.create_collection(name=name, metadata={
+        **ann_index.chroma_metadata(profile, metric),
+        **(metadata or {}),
+        **embedder.fingerprint(),
+    })
+    collection_versions.bump(name)
+    lexical_index.forget(name)
+    return ann_index.attach(collection, embedder.dimension, fresh=True)
+
+
+def get_or_create_collection(client, name: str, embedder=None, on_mismatch: str = None,
+                             profile: str = None, metric: str = None):
+    """An existing collection keeps the index settings it was created with."""
+    embedder = embedder or get_embedder()
+    try:
+        collection = client.get_collection(name=name)
+    except Exception:
+        return create_collection(client, name, embedder, profile=profile, metric=metric)
+    return ann_index.attach(ensure_compatible(client, collection, embedder, on_mismatch), embedder.dimension)
+
+
+def built_with(collection):
+    """(model name, dimension) a collection was built with; model is None if unknown."""
+    metadata = collection.metadata or {}
+    model_name = metadata.get("embedding_model")
+    dimension = metadata.get("embedding_dimension")
+    if dimension is None:
+        sample = collection.get(limit=1, include=["embeddings"])
+        embeddings = sample.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            dimension = len(embeddings[0])
+    return model_name, dimension
+
+
+def ensure_compatible(client, collection, embedder=None, on_mismatch: str = None):
+    """
+    Make sure collection was built with embedder. On mismatch either re-embed
+    its stored chunks ("reindex") or raise EmbeddingMismatchError ("refuse").
+    """
+    embedder = embedder or get_embedder()
+    on_mismatch = on_mismatch or settings.EMBEDDING_MISMATCH
+    model_name, dimension = built_with(collection)
+
+    if model_name is None and dimension in (None, embedder.dimension):
+        # Empty or built before models were recorded: adopt it
+        collection.modify(metadata={**_settable_metadata(collection.metadata), **embedder.fingerprint()})
+        return collection
+
+    if model_name == embedder.model_name and dimension == embedder.dimension:
+        return collection
+
+    if on_mismatch == "refuse":
+        raise EmbeddingMismatchError(
+            f"Collection '{collection.name}' was built with {model_name or 'an unknown model'} "
+            f"({dimension} dims) but the embedding model is {embedder.model_name} ({embedder.dimension} dims)"
+        )
+    return reindex_collection(client, collection, embedder)
+
+
+def reindex_collection(client, collection, embedder=None):
+    """Rebuild a collection from its stored chunks with embedder."""
+    embedder = embedder or get_embedder()
+    name = collection.name
+    metadata = {k: v for k, v in (collection.metadata or {}).items()
+                if k not in ("embedding_model", "embedding_dimension")}
+    rows = collection.get(include=["documents", "metadatas"])
+
+    client.delete_collection(name=name)
+    collection = create_collection(client, name, embedder, metadata)
+    if rows["ids"]:
+        embeddings = embedder.encode(rows["documents"])
+        upsert_batched(collection, rows["ids"], embeddings, rows["documents"], rows["metadatas"],
+                       max_upsert_batch(client))
+        collection_versions.bump(name)
+    return collection
+
+
+def delete_document(collection, filename: str):
+    """Remove one document's chunks, leaving the rest of the index untouched."""
+    collection.delete(where={"filename": filename})
+    lexical_index.deleted_file(collection.name, filename)
+    collection_versions.bump(collection.name)
+
+
+def copy_collection(source, target, page_size: int = 1000):
+    """Copy ids, embeddings, documents and metadatas without re-embedding."""
+    offset = 0
+    while True:
+        rows = source.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not rows["ids"]:
+            break
+        target.upsert(
+            ids=rows["ids"],
+            embeddings=[list(e) for e in rows["embeddings"]],
+            documents=rows["documents"],
+            metadatas=rows["metadatas"]
+        )
+        offset += len(rows["ids"])
+    return offset
+
+
+def compact(client=None, force: bool = False) -> dict:
+    """
+    Rebuild every collection into a fresh one (dropping HNSW entries left behind
+    by deletes and updates) and VACUUM the sqlite file of a persistent store.
+    Raises StoreInUseError if another process has the store open, unless forced.
+    """
+    if settings.VECTOR_STORE == "persistent" and not force:
+        users = other_users()
+        if users:
+            raise StoreInUseError(
+                f"The vector store is open in other processes (pids {', '.join(map(str, users))}); "
+                "stop the app before compacting"
+            )
+    client = client or get_client()
+    report = {"collections": {}, "bytes_before": store_size(), "bytes_after": None}
+    for listed in client.list_collections():
+        # Older clients list Collection objects, newer ones just names
+        name = getattr(listed, "name", listed)
+        if name.endswith(COMPACT_SUFFIX):
+            continue
+        collection = client.get_collection(name=name)
+        start = time.perf_counter()
+        tmp_name = f"{name}{COMPACT_SUFFIX}"
+        try:
+            client.delete_collection(name=tmp_name)
+        except Exception:
+            pass
+        fresh = client.create_collection(name=tmp_name, metadata=collection.metadata)
+        rows = copy_collection(collection, fresh)
+        # If this is interrupted, recover_compaction() finishes it on the next start
+        client.delete_collection(name=name)
+        fresh.modify(name=name)
+        collection_versions.bump(name)
+        if settings.ANN_BACKEND != "chroma":
+            # Also drops vectors a local index only tombstoned
+            ann_index.attach(client.get_collection(name=name), get_embedder().dimension, fresh=True).rebuild()
+        report["collections"][name] = {"rows": rows, "seconds": round(time.perf_counter() - start, 3)}
+
+    sqlite_file = Path(settings.VECTOR_STORE_DIR) / "chroma.sqlite3"
+    if settings.VECTOR_STORE == "persistent" and sqlite_file.exists():
+        connection = sqlite3.connect(sqlite_file)
+        try:
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+    report["bytes_after"] = store_size()
+    return report
+
+
+def store_size() -> int:
+    """Bytes used on disk by the persistent store (0 in memory mode)."""
+    root = Path(settings.VECTOR_STORE_DIR)
+    if settings.VECTOR_STORE != "persistent" or not root.exists():
+        return 0
+    return sum(f.stat().st_size for f in root.rglob("*") if f.is_file())
+
+
+def stats(client=None) -> dict:
+    client = client or get_client()
+    collections = {}
+    for listed in client.list_collections():
+        name = getattr(listed, "name", listed)
+        collection = client.get_collection(name=name)
+        collections[name] = {"rows": collection.count(), "metadata": collection.metadata}
+    return {
+        "mode": settings.VECTOR_STORE,
+        "ann_backend": settings.ANN_BACKEND,
+        "path": settings.VECTOR_STORE_DIR,
+        "open_seconds": round(client_open_seconds, 4),
+        "bytes": store_size(),
+        "collections": collections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the PadelMate vector store.")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--force", action="store_true",
+                        help="Compact even if other processes have the store open (they must be restarted)")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(stats(), indent=2))
+    else:
+        try:
+            print(json.dumps(compact(force=args.force), indent=2))
+        except StoreInUseError as e:
+            parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()